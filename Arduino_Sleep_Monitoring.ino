@@ -1,5 +1,7 @@
 #include <WiFi.h>
 #include <PubSubClient.h>
+#include <time.h>
+#include <sys/time.h>
 #include "MQ135.h"
 
 // -------------------- 0. WIFI & MQTT CONFIG --------------------
@@ -19,11 +21,50 @@ const char* topic_mq135       = "mq135";
 const char* topic_fan         = "PWM_Fan";
 const char* topic_light       = "light";          // subscribe
 const char* topic_dcfan       = "DC_Fan";         // subscribe command (Node-RED -> ESP32)
+const char* topic_fan_cmd     = "PWM_Fan_cmd";    // subscribe: {"speed": 0-2} from the app's fan controller
 
 // NEW essential topics (added, original topics unchanged)
 const char* topic_dcfan_btn   = "DC_Fan_btn";     // ESP32 button event -> Node-RED ("TOGGLE")
 const char* topic_dcfan_state = "DC_Fan_state";   // ESP32 publishes effective DC fan state (0/1)
 
+// -------------------- BATCHED TELEMETRY --------------------
+// TELEMETRY_BATCH 1: every sample goes into one packed message on "telemetry"
+// every batchInterval (decoded by backend/telemetry_batch.py in the app); the
+// original topics above are still published every legacyInterval so Node-RED
+// keeps current values. TELEMETRY_BATCH 0: original 1 s per-topic messages only.
+#define TELEMETRY_BATCH 1
+#define TELEMETRY_JSON  0      // 1 = send the JSON fallback instead of binary
+
+const char* topic_telemetry = "telemetry";
+const char* ntp_server      = "pool.ntp.org";
+const unsigned long batchInterval  = 5000;   // 5 Seconds (max 60 s: offsets are uint16 ms)
+const unsigned long legacyInterval = 30000;  // 30 Seconds
+
+// Wire format v2, little-endian (ESP32 native)
+struct __attribute__((packed)) BatchHeader {
+  char     magic[2];   // "SB"
+  uint8_t  version;    // 2
+  uint8_t  count;      // samples that follow
+  uint32_t baseTime;   // unix seconds at offset 0, or 0 while NTP has not synced
+  uint16_t sentMs;     // offset of the publish moment (millis()), for latency tracking
+};
+struct __attribute__((packed)) BatchSample {
+  uint8_t  sensor;     // SENSOR_* id below
+  uint16_t offsetMs;   // ms after baseTime
+  float    value;
+};
+
+enum : uint8_t { SENSOR_LM35 = 1, SENSOR_MQ135 = 2, SENSOR_PWM_FAN = 3, SENSOR_LIGHT = 4, SENSOR_DC_FAN = 5 };
+const char* SENSOR_NAMES[] = { "", "lm35", "mq135", "PWM_Fan", "light", "DC_Fan_state" };
+
+const int MAX_BATCH_SAMPLES = 60;
+BatchSample batchSamples[MAX_BATCH_SAMPLES];
+uint8_t batchCount = 0;
+uint32_t batchBaseTime = 0;
+unsigned long batchStartMs = 0;   // millis() matching offset 0
+unsigned long lastBatchPublish = 0;
+unsigned long lastLegacyPublish = 0;
+
 WiFiClient espClient;
 PubSubClient client(espClient);
 
@@ -47,6 +88,15 @@ MQ135 gasSensor = MQ135(GAS_AOUT_PIN, MY_CALIBRATED_R0);
 const float PWM_FAN_TEMP_MIN = 28.0;
 const float PWM_FAN_PPM_MIN  = 500.0;
 
+// App fan commands: speed step -> PWM duty. A command is followed until it is this
+// old, then the local thresholds take over. The app re-sends its speed every
+// 10 min while running, so this only lapses once the app is gone.
+const uint8_t PWM_FAN_DUTY[] = { 0, 160, 255 };
+const uint8_t PWM_FAN_MAX_SPEED = 2;
+const unsigned long PWM_FAN_CMD_TIMEOUT = 30UL * 60UL * 1000UL;
+int pwmFanCmdSpeed = -1;           // -1: no command received yet
+unsigned long pwmFanCmdAt = 0;
+
 // DC fan high-temp OFF (safety / automation requirement)
 const float DC_FAN_TEMP_OFF  = 35.0;   // adjust as needed
 
@@ -89,6 +139,14 @@ void mqttCallback(char* topic, byte* payload, unsigned int length) {
     if (p.equalsIgnoreCase("OFF") || p == "0") dcFanCmdFromNR = false;
   }
 
+  // PWM fan speed from the app: {"speed": 2} (a bare number is accepted too)
+  if (t == topic_fan_cmd) {
+    int colon = p.indexOf(':');
+    int speed = (colon >= 0 ? p.substring(colon + 1) : p).toInt();
+    pwmFanCmdSpeed = constrain(speed, 0, PWM_FAN_MAX_SPEED);
+    pwmFanCmdAt = millis();
+  }
+
   // LED command from Node-RED (ON/OFF)
   if (t == topic_light) {
     if (p.equalsIgnoreCase("ON")  || p == "1") manualLedState = true;
@@ -128,6 +186,7 @@ void reconnectMQTT() {
       // Subscribe to command topics (Node-RED -> ESP32)
       client.subscribe(topic_light);
       client.subscribe(topic_dcfan);
+      client.subscribe(topic_fan_cmd);
 
     } else {
       Serial.print("failed, rc=");
@@ -138,6 +197,70 @@ void reconnectMQTT() {
   }
 }
 
+// -------------------- BATCHED TELEMETRY --------------------
+void startBatch(unsigned long now) {
+  struct timeval tv;
+  gettimeofday(&tv, nullptr);
+  // The clock starts at 1970 until NTP syncs; send 0 so the app uses its own clock
+  bool synced = tv.tv_sec > 1600000000;
+  batchBaseTime = synced ? (uint32_t)tv.tv_sec : 0;
+  batchStartMs = now - (synced ? tv.tv_usec / 1000 : 0);
+  batchCount = 0;
+}
+
+void addSample(uint8_t sensor, float value, unsigned long now) {
+  if (batchCount >= MAX_BATCH_SAMPLES) return;
+  batchSamples[batchCount].sensor = sensor;
+  batchSamples[batchCount].offsetMs = (uint16_t)(now - batchStartMs);
+  batchSamples[batchCount].value = value;
+  batchCount++;
+}
+
+void publishBatch(unsigned long now) {
+  if (batchCount > 0) {
+#if TELEMETRY_JSON
+    static char json[2048];
+    int n = snprintf(json, sizeof(json), "{\"v\":2,\"t\":%lu,\"p\":%lu,\"s\":[",
+                     (unsigned long)batchBaseTime, now - batchStartMs);
+    for (uint8_t i = 0; i < batchCount && n < (int)sizeof(json) - 48; i++) {
+      n += snprintf(json + n, sizeof(json) - n, "%s[\"%s\",%u,%.2f]", i ? "," : "",
+                    SENSOR_NAMES[batchSamples[i].sensor], batchSamples[i].offsetMs, batchSamples[i].value);
+    }
+    snprintf(json + n, sizeof(json) - n, "]}");
+    client.publish(topic_telemetry, json, false);
+#else
+    static uint8_t buf[sizeof(BatchHeader) + sizeof(batchSamples)];
+    BatchHeader header = { {'S', 'B'}, 2, batchCount, batchBaseTime, (uint16_t)(now - batchStartMs) };
+    size_t len = sizeof(header) + batchCount * sizeof(BatchSample);
+    memcpy(buf, &header, sizeof(header));
+    memcpy(buf + sizeof(header), batchSamples, batchCount * sizeof(BatchSample));
+    client.publish(topic_telemetry, buf, len, false);
+#endif
+  }
+  startBatch(now);
+}
+
+void publishLegacy(float tempC, float ppm, int pwmSpeed, bool light, bool dcFan) {
+  char bufTemp[16];
+  char bufPPM[16];
+  char bufPwmFan[4];
+  char bufDcFan[4];
+  char bufLight[4];
+
+  dtostrf(tempC, 6, 2, bufTemp);
+  dtostrf(ppm,   6, 0, bufPPM);
+
+  itoa(pwmSpeed, bufPwmFan, 10);
+  itoa(light ? 1 : 0, bufLight, 10);
+  itoa(dcFan ? 1 : 0, bufDcFan, 10);
+
+  client.publish(topic_lm35, bufTemp, true);
+  client.publish(topic_mq135, bufPPM, true);
+  client.publish(topic_fan, bufPwmFan, true);
+  client.publish(topic_light, bufLight, true);
+  client.publish(topic_dcfan_state, bufDcFan, true);
+}
+
 // -------------------- DC FAN BUTTON -> NODE-RED (PUBLISH EVENT) --------------------
 void handleDcFanButton(unsigned long now) {
   bool currentReading = digitalRead(BUTTON_DC_FAN);
@@ -188,6 +311,13 @@ void setup() {
   setupWiFi();
   client.setServer(mqtt_server, mqtt_port);
   client.setCallback(mqttCallback);
+
+#if TELEMETRY_BATCH
+  // Batches carry real timestamps once NTP has synced (UTC; the app converts)
+  configTime(0, 0, ntp_server);
+  client.setBufferSize(TELEMETRY_JSON ? 2048 : 512);
+  startBatch(millis());
+#endif
 }
 
 void loop() {
@@ -218,12 +348,16 @@ void loop() {
   }
 
   // --- B. PWM FAN LOGIC ---
-  bool pwmShouldRun = (tempC >= PWM_FAN_TEMP_MIN || ppm >= PWM_FAN_PPM_MIN);
-  if (pwmShouldRun) {
-    digitalWrite(IN1, HIGH); digitalWrite(IN2, LOW);
+  // App command while fresh, otherwise the local thresholds (full speed or off)
+  int pwmSpeed;
+  if (pwmFanCmdSpeed >= 0 && currentTime - pwmFanCmdAt < PWM_FAN_CMD_TIMEOUT) {
+    pwmSpeed = pwmFanCmdSpeed;
   } else {
-    digitalWrite(IN1, LOW);  digitalWrite(IN2, LOW);
+    pwmSpeed = (tempC >= PWM_FAN_TEMP_MIN || ppm >= PWM_FAN_PPM_MIN) ? PWM_FAN_MAX_SPEED : 0;
   }
+  bool pwmShouldRun = pwmSpeed > 0;
+  analogWrite(IN1, PWM_FAN_DUTY[pwmSpeed]);
+  digitalWrite(IN2, LOW);
 
   // --- C. DC FAN LOGIC (IoT: button -> Node-RED; Node-RED -> command; temp high forces OFF) ---
   handleDcFanButton(currentTime);
@@ -260,29 +394,32 @@ void loop() {
     lastSerialTime = currentTime;
   }
 
-  // --- F. MQTT PUBLISH (Every 1 Second) ---
+  // --- F. MQTT PUBLISH (Sample every 1 Second) ---
   if (currentTime - lastPublish >= publishInterval) {
     lastPublish = currentTime;
 
-    char bufTemp[16];
-    char bufPPM[16];
-    char bufPwmFan[4];
-    char bufDcFan[4];
-    char bufLight[4];
-
-    dtostrf(tempC, 6, 2, bufTemp);
-    dtostrf(ppm,   6, 0, bufPPM);
+#if TELEMETRY_BATCH
+    addSample(SENSOR_LM35, tempC, currentTime);
+    addSample(SENSOR_MQ135, ppm, currentTime);
+    addSample(SENSOR_PWM_FAN, pwmSpeed, currentTime);
+    addSample(SENSOR_LIGHT, manualLedState ? 1 : 0, currentTime);
+    addSample(SENSOR_DC_FAN, dcFanEffectiveState ? 1 : 0, currentTime);
 
-    itoa(pwmShouldRun ? 1 : 0, bufPwmFan, 10);
-    itoa(manualLedState ? 1 : 0, bufLight, 10);
-    itoa(dcFanEffectiveState ? 1 : 0, bufDcFan, 10);
+    if (currentTime - lastLegacyPublish >= legacyInterval) {
+      lastLegacyPublish = currentTime;
+      publishLegacy(tempC, ppm, pwmSpeed, manualLedState, dcFanEffectiveState);
+    }
+#else
+    publishLegacy(tempC, ppm, pwmSpeed, manualLedState, dcFanEffectiveState);
+#endif
+  }
 
-    client.publish(topic_lm35, bufTemp, true);
-    client.publish(topic_mq135, bufPPM, true);
-    client.publish(topic_fan, bufPwmFan, true);
-    client.publish(topic_light, bufLight, true);
-    client.publish(topic_dcfan_state, bufDcFan, true);
+#if TELEMETRY_BATCH
+  if (currentTime - lastBatchPublish >= batchInterval) {
+    lastBatchPublish = currentTime;
+    publishBatch(currentTime);
   }
+#endif
 
   delay(100); // 0.1s Operation Speed
 }
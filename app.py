@@ -1,6 +1,6 @@
 import os
 import threading
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from kivy.app import App
 from kivy.lang import Builder
@@ -37,12 +37,19 @@ Window.size = (375, 667)
 # IMPORT BACKEND SERVICES
 from backend.mqtt_client import DashboardClient
 from backend.scheduler import SleepScheduler
-from backend.database import Database
+from backend.database import DatabaseRegistry, OCCURRENCE_GRACE
 from backend.auth_service import AuthService
 from backend.bot_screen import BotScreen
 from backend.pet_service import PetService
+from backend.consistency import ConsistencyService
+from backend.telemetry_recorder import TelemetryRecorder
+from backend.fan_control import FanController
 
 MAX_DEVIATION = 180
+# Redraws aim this far past each second boundary: Kivy may run a timeout up to a frame early
+COUNTDOWN_SLACK = 0.03
+# "Every Night" edits this one plan instead of adding a new plan per tap
+NIGHTLY_PLAN_ID = "nightly"
 
 
 # =========================================================
@@ -67,7 +74,13 @@ class HomeScreen(Screen): pass
 class SleepScheduleScreen(Screen): pass
 
 
-class CountdownScreen(Screen): pass
+class CountdownScreen(Screen):
+    def on_pre_enter(self):
+        """Starts redrawing the countdown; nothing ticks while the screen is hidden."""
+        App.get_running_app().refresh_countdown()
+
+    def on_pre_leave(self):
+        App.get_running_app().stop_countdown_label()
 
 
 class ExtendScreen(Screen): pass
@@ -88,7 +101,10 @@ class ConsistencyScreen(Screen):
         else:
             return get_color_from_hex('#F44336')
 
-class DashboardScreen(Screen): pass
+class DashboardScreen(Screen):
+    def on_enter(self):
+        """Shows the readings that arrived while the dashboard was hidden."""
+        App.get_running_app().dashboard_client.flush_ui()
 
 
 class ScoreSegmentLabel(Label): pass  # Unused, but kept for context
@@ -160,8 +176,10 @@ Factory.register('PetStatusScreen', cls=PetStatusScreen)
 # =========================================================
 
 class SleepApp(App):
-    target_sleep_time = None
     countdown_event = None
+    plan_timer = None
+    planned_target = None   # bedtime of the countdown arm_next_plan started
+    paused = False
     auth_service = AuthService()
 
     # Properties for ExtendScreen picker (Used for state management)
@@ -181,10 +199,18 @@ class SleepApp(App):
         # 1. HIDE WINDOW IMMEDIATELY to prevent flash
         Window.hide()
 
-        self.db = Database()
+        self.databases = DatabaseRegistry()
+        self.db = self.databases.get("guest")
         self.pet_service = PetService()
-        self.dashboard_client = DashboardClient(self)
-        self.scheduler = SleepScheduler(self, self.db)
+        self.consistency = ConsistencyService(self.db, self.pet_service)
+        self.consistency.bind(self.apply_consistency)
+        self.dashboard_client = DashboardClient(self, outbox_path=os.path.join(self.user_data_dir, "outbox.json"))
+        self.dashboard_client.recorder = TelemetryRecorder(self.db.user_folder)
+        self.dashboard_client.enable_fan_control(FanController)
+        self.scheduler = SleepScheduler(self.dashboard_client, self.db,
+                                        state_path=os.path.join(self.user_data_dir, "scheduler.json"))
+        # Before the KV tree: a countdown (or overdue light-OFF) from the last run resumes on the first frame
+        self.scheduler.restore(self.sleep_time_reached)
 
         # 2. LOAD STYLES AND MAIN KV (After classes are registered)
         Builder.load_file("UI/styles.kv")
@@ -229,22 +255,42 @@ class SleepApp(App):
         self.root.transition.direction = direction
         self.root.current = screen
 
+    @property
+    def target_sleep_time(self):
+        """Bedtime of the running countdown, None if there is none."""
+        return self.scheduler.target if self.scheduler.running else None
+
     def go_back(self):
         """
         Checks if a countdown is active. If yes, return to countdown.
         Otherwise, return to home.
         """
-        now = datetime.now()
-        if self.target_sleep_time and self.target_sleep_time > now:
+        if self.scheduler.running:
             self.switch("countdown", direction='right')
         else:
             self.switch("home", direction='right')
 
     # ... (rest of methods) ...
 
+    def on_pause(self):
+        """Backgrounded: the countdown timer keeps running, its label stops redrawing."""
+        self.paused = True
+        self.stop_countdown_label()
+        return True
+
+    def on_resume(self):
+        self.paused = False
+        self.refresh_countdown()
+
     def on_stop(self):
-        """Disconnect MQTT clients when the application closes."""
+        """Disconnect MQTT clients and flush pending DB writes when the application closes."""
         self.dashboard_client.disconnect()
+        self.dashboard_client.recorder.close()
+        latency = self.dashboard_client.dump_latency()
+        if latency:
+            Logger.info(f"[MQTT] Telemetry latency:\n{latency}")
+        Logger.info(f"[DB] Writer stats: {self.db.writer_stats()}")
+        self.databases.close_all()
 
     # --- ASYNCHRONOUS AUTHENTICATION HANDLERS ---
     def async_call(self, func, *args, success_callback, error_callback=None):
@@ -303,10 +349,13 @@ class SleepApp(App):
             if not username:
                 username = "unknown_user"
 
-            # Initialize the private database for this user
-            self.db = Database(user_id=username)
+            # Open (or reuse) the private database for this user
+            self.db = self.databases.get(username)
+            self.scheduler.db = self.db
+            self.arm_next_plan()
+            self.dashboard_client.recorder.set_user_folder(self.db.user_folder)
+            self.consistency.bind_db(self.db)
 
-            self.update_consistency()
             self.set_status(screen, result)
             self.switch("home")
         else:
@@ -346,54 +395,89 @@ class SleepApp(App):
         self.update_consistency()
         self.start_countdown(time_str)
         self.switch("countdown")
-    def start_countdown(self, time_str):
+
+    def save_sleep_plan(self, time_str):
+        """Saves `time_str` as a nightly bedtime and counts down to the next one."""
         try:
             user_time = datetime.strptime(time_str, "%I:%M %p")
         except Exception as e:
             print("Time parse error:", e)
             return
+        bedtime = user_time.strftime("%H:%M")
+        # Earlier builds added a plan per tap; their bedtimes would score the same nights again
+        for plan in self.db.get_plans():
+            if plan["id"] != NIGHTLY_PLAN_ID and len(plan["bedtimes"]) == 7:
+                self.db.remove_plan(plan["id"])
+        self.db.save_plan({day: bedtime for day in range(7)}, plan_id=NIGHTLY_PLAN_ID)
+        self.scheduler.cancel()
+        self.arm_next_plan()
+        self.switch("countdown")
 
+    def arm_next_plan(self, *args):
+        """Counts down to the next planned bedtime, unless a countdown is already running."""
+        if self.plan_timer is not None:
+            self.plan_timer.cancel()
+            self.plan_timer = None
         now = datetime.now()
-        self.target_sleep_time = now.replace(
-            hour=user_time.hour,
-            minute=user_time.minute,
-            second=0,
-            microsecond=0
-        )
-        if self.target_sleep_time <= now:
-            self.target_sleep_time += timedelta(days=1)
+        since = now
+        fired_at = self.scheduler.fired_at
+        if fired_at is not None and now - fired_at < OCCURRENCE_GRACE:
+            # A bedtime that passed since the last fire (e.g. while suspended) is still due.
+            # The fired night is only scored once late extensions stop belonging to it;
+            # a wall-clock timer, so the grace period also runs out during a suspend
+            since = fired_at
+            self.plan_timer = self.scheduler.timers.call_at(fired_at + OCCURRENCE_GRACE, self.score_planned_nights,
+                                                            name="score-plans", main_thread=True)
+        if self.scheduler.running:
+            return
+        occurrence = self.db.next_occurrence(since)
+        if occurrence is None:
+            return
+        self.planned_target = self.scheduler.start_countdown(occurrence.when, self.sleep_time_reached)
+        print("Next planned bedtime:", occurrence)
+        self.refresh_countdown()
+
+    def score_planned_nights(self):
+        """Writes the history score of every planned night whose grace period is over."""
+        self.plan_timer = None
+        self.db.score_due_nights()
+
+    def start_countdown(self, time_str):
+        try:
+            user_time = datetime.strptime(time_str, "%I:%M %p")
+        except Exception as e:
+            print("Time parse error:", e)
+            return
+
+        # The scheduler's timer fires the light-OFF; the label is only redrawn while shown
+        target = self.scheduler.start_countdown(user_time.strftime("%H:%M"), self.sleep_time_reached)
+        print("Target sleep datetime:", target)
+        self.refresh_countdown()
 
-        print("Target sleep datetime:", self.target_sleep_time)
+    def refresh_countdown(self):
+        """Redraws the countdown now if it is on screen, then once per second boundary."""
+        self.stop_countdown_label()
+        if not self.paused and self.root.current == "countdown":
+            self.update_countdown(0)
 
+    def stop_countdown_label(self):
         if self.countdown_event:
-            try:
-                self.countdown_event.cancel()
-            except Exception:
-                pass
+            self.countdown_event.cancel()
             self.countdown_event = None
-        self.countdown_event = Clock.schedule_interval(self.update_countdown, 1)
-        self.update_countdown(0)
 
     def update_countdown(self, dt):
-        if not self.target_sleep_time:
+        self.countdown_event = None
+        remaining = self.scheduler.remaining()
+        if remaining is None:
             return
-        now = datetime.now()
-        remaining = self.target_sleep_time - now
-        if remaining.total_seconds() <= 0:
-            self.update_countdown_label("00:00:00")
-            self.sleep_time_reached()
-            if self.countdown_event:
-                try:
-                    self.countdown_event.cancel()
-                except Exception:
-                    pass
-            return False
-
-        total_sec = int(remaining.total_seconds())
+        total_sec = int(remaining)
         h = total_sec // 3600
         m = (total_sec % 3600) // 60
         s = total_sec % 60
         self.update_countdown_label(f"{h:02d}:{m:02d}:{s:02d}")
+        if remaining > 0:
+            # Sleep until the displayed second changes instead of polling
+            self.countdown_event = Clock.schedule_once(self.update_countdown, remaining - total_sec + COUNTDOWN_SLACK)
 
     def update_countdown_label(self, text):
         try:
@@ -403,8 +487,9 @@ class SleepApp(App):
             pass
 
     def sleep_time_reached(self):
+        # The light-OFF was already queued by the scheduler thread
         print("Sleep Time Reached!")
-        self.dashboard_client.publish_turn_off()
+        self.stop_countdown_label()
         try:
             screen = self.root.get_screen("countdown")
             screen.ids.status_msg.text = "Light turned off. Ready for sleep."
@@ -416,29 +501,19 @@ class SleepApp(App):
             print("[DB] Event logged: sleep_time_reached")
         except Exception as e:
             print("DB error:", e)
+        self.arm_next_plan()
 
     def extend_time(self, minutes):
         mins = int(minutes)
         if mins < 0 or mins > self.MAX_EXTENSION_MINUTES: raise ValueError
-        try:
-            self.db.save_extension(mins)
-        except Exception as e:
-            print("DB save_extension failed:", e)
-
-        if self.target_sleep_time:
-            self.target_sleep_time += timedelta(minutes=mins)
-            self.update_countdown(0)
-            if not self.countdown_event:
-                self.countdown_event = Clock.schedule_interval(self.update_countdown, 1)
-        else:
-            self.target_sleep_time = datetime.now() + timedelta(minutes=mins)
-            if self.countdown_event:
-                try:
-                    self.countdown_event.cancel()
-                except Exception:
-                    pass
-            self.countdown_event = Clock.schedule_interval(self.update_countdown, 1)
-            self.update_countdown(0)
+        fired_at = self.scheduler.fired_at
+        if (self.scheduler.running and self.scheduler.target == self.planned_target
+                and fired_at is not None and datetime.now() - fired_at < OCCURRENCE_GRACE):
+            # Just after a bedtime fired, the running countdown is the next planned
+            # night's: the extension is for tonight, so it starts from now
+            self.scheduler.cancel()
+        # Saves the extension and moves the running countdown (or starts one from now)
+        self.scheduler.extend_time(mins, self.sleep_time_reached)
 
         self.update_consistency()
         self.extend_hours = 0
@@ -448,40 +523,16 @@ class SleepApp(App):
 
     def on_start(self):
         Clock.schedule_once(self.update_consistency, 0.5)
+        self.arm_next_plan()
 
-    # In main.py (Inside SleepApp class)
-    # In main.py
-    # In main.py (Inside SleepApp class)
     def update_consistency(self, *args):
-        try:
-            # 1. Check current extensions
-            ext_list = self.db.get_all_extensions()
-            total_ext = sum(ext_list) if ext_list else 0
-            current_score = self.db._calculate_score_from_minutes(total_ext)
-
-            # 2. Get history
-            historical_data = self.db.get_recent_consistency_scores(days=7)
-
-            if not historical_data and total_ext == 0:
-                # NEW USER LOGIC: If no history and no current extension, start at 0
-                current_score = 0
-            else:
-                # REGULAR LOGIC: 0 deviation means 100%
-                current_score = self.db._calculate_score_from_minutes(total_ext)
-
-            today_label = datetime.now().strftime("%b %d")
-            chart_data_updated = False
-            final_chart_data = []
-
-            for date_label, score in historical_data:
-                if date_label == today_label:
-                    final_chart_data.append((current_score, date_label))
-                    chart_data_updated = True
-                else:
-                    final_chart_data.append((float(score), date_label))
+        """Asks for a refresh; repeated calls within one frame collapse into one."""
+        self.consistency.request_refresh()
 
-            if not chart_data_updated:
-                final_chart_data.append((current_score, today_label))
+    def apply_consistency(self, snapshot):
+        """Pushes a ConsistencySnapshot to the consistency and pet screens."""
+        try:
+            current_score = snapshot.current_score
 
             # Update Labels
             score_text = f"Your Sleep Consistency Level\n\n[size=100]{current_score}%[/size]"
@@ -492,44 +543,21 @@ class SleepApp(App):
             # Update Chart
             if hasattr(screen.ids, 'score_bar'):
                 screen.ids.score_bar.scores = []
-                screen.ids.score_bar.scores = final_chart_data
+                screen.ids.score_bar.scores = snapshot.chart_data
 
-            # Update Pet (Syncing with the new PetStatusScreen IDs)
-            try:
-                img_path, status_text, text_color = self.pet_service.calculate_pet_state(current_score)
-                pet_screen = self.root.get_screen("pet_status")
-                pet_screen.ids.detail_pet_image.source = img_path
-                pet_screen.ids.detail_pet_status.text = f"Status: {status_text}"
-                pet_screen.ids.detail_pet_status.color = text_color
-            except:
-                pass
+            self.update_pet_on_status_screen()
 
         except Exception as e:
             Logger.error(f"update_consistency failed: {e}")
 
     def update_pet_on_status_screen(self):
-        """Specifically updates the IDs on the PetStatusScreen with New User logic."""
+        """Specifically updates the IDs on the PetStatusScreen from the cached snapshot."""
         try:
-            # 1. Get Live Data
-            ext_list = self.db.get_all_extensions()
-            total_ext_minutes = sum(ext_list) if ext_list else 0
+            # Cached unless a Database write happened since the last look
+            snapshot = self.consistency.get()
+            img_path, status_text, text_color = snapshot.pet_state
 
-            # 2. NEW USER LOGIC: Check if history exists
-            # This mirrors the fix in your update_consistency function
-            historical_data = self.db.get_recent_consistency_scores(days=7)
-
-            if not historical_data and total_ext_minutes == 0:
-                current_score = 0.0  # Force 0% for new users
-            else:
-                current_score = self.db._calculate_score_from_minutes(total_ext_minutes)
-
-            # 3. Target the PetStatusScreen
             screen = self.root.get_screen("pet_status")
-
-            # 4. Get the correct pet state
-            img_path, status_text, text_color = self.pet_service.calculate_pet_state(current_score)
-
-            # 5. Update the UI elements
             if hasattr(screen.ids, 'detail_pet_image'):
                 screen.ids.detail_pet_image.source = img_path
 
@@ -537,7 +565,7 @@ class SleepApp(App):
                 screen.ids.detail_pet_status.text = f"Status: {status_text}"
                 screen.ids.detail_pet_status.color = text_color
 
-            Logger.info(f"PetStatusScreen: UI updated successfully for score {current_score}%")
+            Logger.info(f"PetStatusScreen: UI updated successfully for score {snapshot.current_score}%")
 
         except Exception as e:
             Logger.error(f"PetStatusScreen update failed: {e}")
@@ -0,0 +1,177 @@
+import json
+import time
+import threading
+from kivy.logger import Logger
+from backend.db_writer import get_writer, write_atomic
+
+# A command still undelivered after this long is stale (e.g. last night's light-OFF)
+COMMAND_TTL = 6 * 60 * 60
+
+# Delivery states, in order
+QUEUED = "queued"          # waiting for a connection
+SENT = "sent"              # claimed for publishing, waiting for the broker's PUBACK
+DELIVERED = "delivered"    # broker has it; waiting for the device to report the new state
+CONFIRMED = "confirmed"    # device state matches (or no confirmation is expected)
+
+
+class CommandQueue:
+    """
+    Outbound device commands that must survive Wi-Fi drops and app restarts.
+
+    Holds at most one command per topic (a newer fan speed replaces the older
+    one), persisted to `path` through the background writer. A command stays
+    until the broker acknowledges it and, when `confirm` is given, until the
+    device publishes that value on `confirm_topic`.
+
+    put() runs on the main thread, the delivery callbacks on the paho network
+    thread; both go through one lock.
+    """
+
+    def __init__(self, path=None, ttl=COMMAND_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._commands = {}     # topic -> command dict
+        self._inflight = {}     # paho mid -> topic
+        self._early_acks = set()
+        self._load()
+
+    # ---------------------------------------------------------
+    # PERSISTENCE
+    # ---------------------------------------------------------
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                commands = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            Logger.warning(f"[OUTBOX] Ignoring unreadable {self.path}: {e}")
+            return
+        for cmd in commands.values():
+            # Anything not confirmed before the restart goes out again
+            cmd["state"] = QUEUED
+        self._commands = commands
+        if commands:
+            Logger.info(f"[OUTBOX] Restored {len(commands)} pending command(s)")
+
+    def _save(self):
+        """Snapshot under the lock, write on the background writer thread."""
+        if not self.path:
+            return
+        text = json.dumps(self._commands)
+        path = self.path
+        get_writer().call(lambda: write_atomic(path, text))
+
+    # ---------------------------------------------------------
+    # QUEUE
+    # ---------------------------------------------------------
+    def put(self, topic, payload, qos=1, confirm_topic=None, confirm=None):
+        """Queues a command, replacing any older one for the same topic."""
+        with self._lock:
+            cmd = {
+                "topic": topic,
+                "payload": payload,
+                "qos": qos,
+                "confirm_topic": confirm_topic,
+                "confirm": confirm,
+                "created": time.time(),
+                "state": QUEUED,
+            }
+            self._commands[topic] = cmd
+            self._save()
+            return dict(cmd)
+
+    def take_pending(self):
+        """
+        Claims every queued command for sending (oldest first) and marks it SENT,
+        so a replay on the network thread and a new publish on the main thread
+        never send the same command twice. Stale commands are dropped here.
+        """
+        with self._lock:
+            cutoff = time.time() - self.ttl
+            for topic, cmd in list(self._commands.items()):
+                if cmd["created"] < cutoff:
+                    Logger.warning(f"[OUTBOX] Dropping stale command for '{topic}'")
+                    del self._commands[topic]
+                    self._save()
+            queued = sorted((c for c in self._commands.values() if c["state"] == QUEUED),
+                            key=lambda c: c["created"])
+            for cmd in queued:
+                cmd["state"] = SENT
+            return [dict(c) for c in queued]
+
+    def state(self, topic):
+        """Delivery state of the pending command for `topic` (None once confirmed)."""
+        with self._lock:
+            cmd = self._commands.get(topic)
+            return cmd["state"] if cmd else None
+
+    def __len__(self):
+        return len(self._commands)
+
+    # ---------------------------------------------------------
+    # DELIVERY TRACKING
+    # Each returns the updated command (a copy) or None if nothing changed.
+    # ---------------------------------------------------------
+    def mark_sent(self, cmd, mid):
+        """Links a claimed command to the paho message id of its publish."""
+        with self._lock:
+            current = self._commands.get(cmd["topic"])
+            if current is None or current["created"] != cmd["created"] or current["state"] != SENT:
+                return None  # replaced or requeued while we were publishing
+            self._inflight[mid] = cmd["topic"]
+            if mid in self._early_acks:
+                # PUBACK beat publish() back to us
+                self._early_acks.discard(mid)
+                return self._delivered(mid)
+            return dict(current)
+
+    def requeue(self, cmd):
+        """The publish did not go out: put a claimed command back in the queue."""
+        with self._lock:
+            current = self._commands.get(cmd["topic"])
+            if current is not None and current["created"] == cmd["created"] and current["state"] == SENT:
+                current["state"] = QUEUED
+
+    def mark_unsent(self):
+        """Connection lost: every SENT command goes back to QUEUED."""
+        with self._lock:
+            for cmd in self._commands.values():
+                if cmd["state"] == SENT:
+                    cmd["state"] = QUEUED
+            self._inflight.clear()
+            self._early_acks.clear()
+
+    def on_puback(self, mid):
+        with self._lock:
+            if mid not in self._inflight:
+                self._early_acks.add(mid)
+                return None
+            return self._delivered(mid)
+
+    def _delivered(self, mid):
+        topic = self._inflight.pop(mid)
+        cmd = self._commands.get(topic)
+        if cmd is None or cmd["state"] != SENT:
+            return None
+        if cmd["confirm_topic"] is None:
+            cmd["state"] = CONFIRMED
+            del self._commands[topic]
+            self._save()
+        else:
+            cmd["state"] = DELIVERED
+        return dict(cmd)
+
+    def on_device_state(self, topic, text):
+        """A state report from the device; confirms a DELIVERED command that expects it."""
+        with self._lock:
+            for key, cmd in self._commands.items():
+                if cmd["state"] == DELIVERED and cmd["confirm_topic"] == topic and cmd["confirm"] == text:
+                    cmd["state"] = CONFIRMED
+                    del self._commands[key]
+                    self._save()
+                    return dict(cmd)
+        return None
@@ -1,3 +1,8 @@
+from datetime import datetime
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+
 class ConsistencyCalculator:
     def calculate(self, extension_list):
         if not extension_list:
@@ -8,3 +13,94 @@ class ConsistencyCalculator:
         # max extension = 180 mins → poor = 0 %
         score = max(0, 100 - (avg_ext / 180) * 100)
         return round(score, 2)
+
+
+class ConsistencySnapshot:
+    """Everything the consistency and pet screens show, computed in one go."""
+
+    def __init__(self, current_score, chart_data, pet_state, day):
+        self.current_score = current_score
+        self.chart_data = chart_data      # [(score, "%b %d"), ...] oldest first, today last
+        self.pet_state = pet_state        # (image_path, status_text, text_color)
+        self.day = day                    # date the snapshot was computed for
+
+
+class ConsistencyService:
+    """
+    Computes the current score, the 7-day chart series and the pet tier once and
+    caches them until the Database reports a write (or the day rolls over).
+
+    Refresh requests go through a Kivy trigger, so a burst of writes and
+    update_consistency() calls inside one frame costs a single recompute.
+    """
+
+    def __init__(self, db, pet_service, days=7):
+        self.db = None
+        self.pet_service = pet_service
+        self.days = days
+        self._snapshot = None
+        self._listeners = []
+        self._trigger = Clock.create_trigger(self._refresh)
+        self.bind_db(db)
+
+    def bind_db(self, db):
+        """Points the service at another user's Database (e.g. after login)."""
+        if self.db is not None:
+            self.db.remove_write_listener(self.invalidate)
+        self.db = db
+        db.add_write_listener(self.invalidate)
+        self.invalidate()
+
+    def bind(self, callback):
+        """callback(snapshot) runs on the main thread after each recompute."""
+        self._listeners.append(callback)
+
+    def invalidate(self):
+        self._snapshot = None
+        self._trigger()
+
+    def request_refresh(self, *args):
+        self._trigger()
+
+    def get(self):
+        """Returns the cached snapshot, recomputing only if it is stale."""
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.day != datetime.now().date():
+            snapshot = self._snapshot = self._compute()
+        return snapshot
+
+    def _refresh(self, dt):
+        snapshot = self.get()
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                Logger.error(f"[CONSISTENCY] Listener failed: {e}")
+
+    def _compute(self):
+        total_ext = self.db.get_extension_total()
+        historical_data = self.db.get_recent_consistency_scores(days=self.days)
+
+        if not historical_data and total_ext == 0:
+            # NEW USER LOGIC: If no history and no current extension, start at 0
+            current_score = 0
+        else:
+            # REGULAR LOGIC: 0 deviation means 100%
+            current_score = self.db._calculate_score_from_minutes(total_ext)
+
+        now = datetime.now()
+        today_label = now.strftime("%b %d")
+        chart_data = []
+        has_today = False
+        for date_label, score in historical_data:
+            if date_label == today_label:
+                chart_data.append((current_score, date_label))
+                has_today = True
+            else:
+                chart_data.append((float(score), date_label))
+        if not has_today:
+            chart_data.append((current_score, today_label))
+
+        pet_state = self.pet_service.calculate_pet_state(current_score)
+        Logger.info(f"[CONSISTENCY] Recomputed: {current_score}%")
+        return ConsistencySnapshot(current_score, chart_data, pet_state, now.date())
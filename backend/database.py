@@ -1,18 +1,73 @@
 import os
+import re
 import json
+import bisect
+import functools
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
 from tinydb import TinyDB, Query
 from datetime import datetime, timedelta
 from os.path import join, exists
 from kivy.app import App
 from kivy.logger import Logger
+from backend.log_storage import AppendLogStorage
+from backend.db_writer import get_writer, write_atomic
+from backend.sleep_plans import OccurrenceIndex, parse_bedtime
+from backend import retention
+from backend.retention import RAW_RETENTION_DAYS, DAILY_RETENTION_DAYS
 
 MAX_DEVIATION = 180
+MAX_OPEN_DATABASES = 4  # per-user handles kept open by DatabaseRegistry
 Extension = Query()
-History = Query()  # Query object for the 'history' table
+
+# Monthly partition files: users/<id>/2025-12.json (+ .log written by AppendLogStorage)
+PARTITION_FILE = re.compile(r"^(\d{4}-\d{2})\.json")
+MONTH_KEY = re.compile(r"^\d{4}-\d{2}$")
+LEGACY_FILE = "sleep_data.json"
+
+# Recurring weekly bedtimes and how far their occurrences have been scored
+PLANS_FILE = "plans.json"
+# An extension made up to MAX_DEVIATION after a planned bedtime still belongs to it
+OCCURRENCE_GRACE = timedelta(minutes=MAX_DEVIATION)
+# Planned nights missed while the app was closed are scored this far back at most
+MAX_CATCH_UP_DAYS = 7
+
+
+def partition_key(iso_str):
+    """'2025-12-03T22:10:00' or '2025-12-03' -> '2025-12'"""
+    return iso_str[:7]
+
+
+def next_month(key):
+    year, month = int(key[:4]), int(key[5:7])
+    return f"{year + month // 12:04d}-{month % 12 + 1:02d}"
+
+
+def _locked(method):
+    """Serializes a Database method against the background roll-up thread."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 
 class Database:
-    def __init__(self, user_id="guest"):
+    """
+    Per-user sleep database, split into one TinyDB file per calendar month.
+
+    Opening only loads the current month. Older months are loaded lazily, newest
+    first, when a read reaches back past what is already in memory (the 7-day
+    chart after a long break, or an extension period that started last month).
+
+    A background thread rolls raw events older than `raw_days` into daily rows
+    and daily rows older than `daily_days` into monthly summaries (see
+    backend/retention.py). Pass raw_days=None to keep everything raw.
+    """
+
+    def __init__(self, user_id="guest", storage=AppendLogStorage,
+                 raw_days=RAW_RETENTION_DAYS, daily_days=DAILY_RETENTION_DAYS):
         # 1. Get the protected Android data directory
         try:
             base_dir = App.get_running_app().user_data_dir
@@ -20,47 +75,352 @@ class Database:
             base_dir = "."  # Fallback for PyCharm desktop
 
         # 2. Create a unique folder for THIS user
+        self.user_id = user_id
         self.user_folder = join(base_dir, "users", user_id)
         if not exists(self.user_folder):
             os.makedirs(self.user_folder, exist_ok=True)
             Logger.info(f"[DB] Created folder for: {user_id}")
 
-        # 3. Point TinyDB to the file INSIDE that user's folder
-        self.db_file = join(self.user_folder, "sleep_data.json")
-        self.db = TinyDB(self.db_file)
+        # 3. Partitions live INSIDE that user's folder
+        # (storage is pluggable: the default appends changes to a log instead of
+        # rewriting the whole file; pass tinydb's JSONStorage for the old format)
+        self.storage = storage
+        self.partitions = {}  # "YYYY-MM" -> TinyDB, only the loaded ones
+        self._lock = threading.RLock()
+        self._closed = False
+        self._split_legacy_file()
+        self._on_disk = sorted({m.group(1) for m in map(PARTITION_FILE.match, os.listdir(self.user_folder)) if m})
+
+        # Callbacks notified after every write that changes the score inputs
+        self._write_listeners = []
+        self._history_dates = []
+        self._history_by_date = {}
+        self._events = {}  # type -> ([created, ...] sorted, [record, ...] same order)
+
+        # 4. Load the current month, then rebuild the running extension total
+        # (this may pull in older months if the current period started there)
+        self._partition(self._current_key())
+        self._rebuild_extension_total()
+        self._load_plans()
+
+        Logger.info(f"[DB] User '{user_id}' is now using: {self.user_folder} "
+                    f"({len(self.partitions)} of {len(self._on_disk)} months loaded)")
+
+        # 5. Roll old raw events up into aggregates without blocking the caller
+        self.raw_days = raw_days
+        self.daily_days = max(daily_days, raw_days) if raw_days is not None else None
+        self._retention_thread = None
+        if raw_days is not None:
+            self._retention_thread = threading.Thread(target=self.roll_up, name=f"retention-{user_id}", daemon=True)
+            self._retention_thread.start()
 
-        self.sleep_table = self.db.table("sleep")
-        self.history_table = self.db.table("history")
+    # ---------------------------------------------------------
+    # PARTITIONS
+    # ---------------------------------------------------------
+    def _current_key(self):
+        return datetime.now().strftime("%Y-%m")
+
+    def _partition(self, key):
+        """Returns the TinyDB for month `key`, opening it on first use."""
+        db = self.partitions.get(key)
+        if db is None:
+            db = TinyDB(join(self.user_folder, key + ".json"), storage=self.storage)
+            self.partitions[key] = db
+            if key not in self._on_disk:
+                bisect.insort(self._on_disk, key)
+            for rec in db.table("sleep").all():
+                self._index_event(rec)
+            for rec in db.table("history").all():
+                self._index_history_record(key, rec.doc_id, rec)
+            for rec in db.table("daily").all():
+                if rec.get("score") is not None:
+                    self._index_history_record(key, rec.doc_id, rec, table="daily")
+        return db
+
+    def _unloaded_older(self):
+        """Months on disk older than everything loaded so far, newest first."""
+        oldest = min(self.partitions)
+        return [key for key in reversed(self._on_disk) if key < oldest]
+
+    def _load_next_older(self):
+        older = self._unloaded_older()
+        if not older:
+            return False
+        self._partition(older[0])
+        Logger.info(f"[DB] Lazily loaded partition {older[0]}")
+        return True
+
+    def _load_all(self):
+        while self._load_next_older():
+            pass
+
+    @property
+    def sleep_table(self):
+        """The current month's raw event table (new events are written here)."""
+        return self._partition(self._current_key()).table("sleep")
+
+    @property
+    def history_table(self):
+        """The current month's history table (today's score is written here)."""
+        return self._partition(self._current_key()).table("history")
+
+    @_locked
+    def iter_records(self, table_name):
+        """Returns every record of a table across ALL months, oldest month first."""
+        self._load_all()
+        records = []
+        for key in sorted(self.partitions):
+            records += self.partitions[key].table(table_name).all()
+        return records
+
+    @contextmanager
+    def _open_partition(self, key):
+        """Yields (TinyDB, is_loaded) without keeping an unloaded month in memory."""
+        db = self.partitions.get(key)
+        if db is not None:
+            yield db, True
+            return
+        db = TinyDB(join(self.user_folder, key + ".json"), storage=self.storage)
+        try:
+            yield db, False
+        finally:
+            db.close()
+
+    def _split_legacy_file(self):
+        """One-shot split of a pre-partitioning sleep_data.json into monthly files."""
+        legacy_path = join(self.user_folder, LEGACY_FILE)
+        if not exists(legacy_path):
+            self._retire_legacy_files()
+            return
+
+        # Monthly files next to a legacy file can only come from an interrupted
+        # split: drop them so the split below does not duplicate records
+        for name in os.listdir(self.user_folder):
+            if PARTITION_FILE.match(name):
+                os.remove(join(self.user_folder, name))
+
+        legacy = TinyDB(legacy_path, storage=self.storage)
+        fallback = self._current_key()
+        by_month = {}
+        for name in ("sleep", "history"):
+            field = "created" if name == "sleep" else "date"
+            for rec in legacy.table(name).all():
+                value = rec.get(field)
+                key = partition_key(value) if isinstance(value, str) else fallback
+                if not MONTH_KEY.match(key):
+                    key = fallback
+                by_month.setdefault(key, {}).setdefault(name, []).append(dict(rec))
+        legacy.close()
+
+        for key, tables in by_month.items():
+            db = TinyDB(join(self.user_folder, key + ".json"), storage=self.storage)
+            for name, records in tables.items():
+                db.table(name).insert_multiple(records)
+            db.close()
+
+        # Keep the original files around instead of deleting user data. Moving
+        # the .json is what marks the split as done, so it goes first: before
+        # it, a crash redoes the split from the untouched .json and its log;
+        # after it, the next open only moves the files left behind
+        os.replace(legacy_path, legacy_path + ".migrated")
+        self._retire_legacy_files()
+        Logger.info(f"[DB] Split {LEGACY_FILE} into {len(by_month)} monthly partitions")
+
+    def _retire_legacy_files(self):
+        """Renames what is left of a split legacy file (its log, ...) to *.migrated."""
+        for name in os.listdir(self.user_folder):
+            if name.startswith(LEGACY_FILE) and not name.endswith(".migrated"):
+                os.replace(join(self.user_folder, name), join(self.user_folder, name + ".migrated"))
+
+    def close(self):
+        """Stops the roll-up, then flushes and closes every loaded partition."""
+        self._closed = True
+        thread = self._retention_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        with self._lock:
+            for db in self.partitions.values():
+                db.close()
+            self.partitions = {}
+
+    def flush(self, timeout=None):
+        """Blocks until every queued write is on disk (no-op for synchronous storages)."""
+        ok = True
+        for db in self.partitions.values():
+            flush = getattr(db.storage, "flush", None)
+            if flush:
+                ok = flush(timeout) and ok
+        return ok
+
+    def writer_stats(self):
+        """Queue depth and commit latency of the background writer, if any."""
+        for db in self.partitions.values():
+            writer = getattr(db.storage, "writer", None)
+            if writer:
+                return writer.stats()
+        return {}
+
+    def add_write_listener(self, callback):
+        """Registers callback() to run after every write affecting consistency data."""
+        if callback not in self._write_listeners:
+            self._write_listeners.append(callback)
+
+    def remove_write_listener(self, callback):
+        if callback in self._write_listeners:
+            self._write_listeners.remove(callback)
+
+    def _notify_write(self):
+        for callback in self._write_listeners:
+            try:
+                callback()
+            except Exception as e:
+                Logger.error(f"[DB] Write listener failed: {e}")
 
-        Logger.info(f"[DB] User '{user_id}' is now using: {self.db_file}")
+    def _insert_event(self, record):
+        """Writes a raw event to the current month and adds it to the time index."""
+        self.sleep_table.insert(record)
+        self._index_event(record)
 
+    @_locked
     def log_event(self, name):
-        self.sleep_table.insert({"type": "event", "name": name, "created": datetime.now().isoformat()})
+        self._insert_event({"type": "event", "name": name, "created": datetime.now().isoformat()})
         Logger.info(f"[DB] Event logged: {name}")
 
     # ---------------------------------------------------------
     # RAW EVENT LOGGING METHODS
     # ---------------------------------------------------------
+    @_locked
     def save_schedule(self, time_str):
-        self.sleep_table.insert({"type": "schedule", "time": time_str, "created": datetime.now().isoformat()})
+        self._insert_event({"type": "schedule", "time": time_str, "created": datetime.now().isoformat()})
+        self._notify_write()
 
+    @_locked
     def save_extension(self, minutes):
-        self.sleep_table.insert({
+        now = datetime.now()
+        created = now.isoformat()
+        record = {
             "type": "extension",
             "minutes": minutes,
-            "created": datetime.now().isoformat()
-        })
+            "created": created
+        }
+        # Score any planned night that ended before this extension, then attach it to its own
+        self._score_due_occurrences(now)
+        occurrence = self.occurrence_at(now)
+        if occurrence is not None:
+            record["occurrence"] = occurrence.key
+            self._ext_by_occurrence[occurrence.key] = self._ext_by_occurrence.get(occurrence.key, 0) + minutes
+        self._insert_event(record)
+        self._ext_total["count"] += 1
+        self._ext_total["sum"] += minutes
+        self._ext_total["updated"] = created
+        self._ext_partitions.add(partition_key(created))
         Logger.info(f"[DB] Saved extension: {minutes} minutes")
+        self._notify_write()
 
+    @_locked
     def get_all_extensions(self):
-        # We define the Query object here so it works with the current user's table
-        Ext = Query()
-        ext_records = self.sleep_table.search(Ext.type == "extension")
+        ext_records = []
+        for key in sorted(self._ext_partitions):
+            ext_records += self._partition(key).table("sleep").search(Extension.type == "extension")
         return [r["minutes"] for r in ext_records]
 
+    def get_extension_total(self):
+        """Total extension minutes not scored yet, for every period (O(1), no table scan)."""
+        return self._ext_total["sum"]
+
+    def get_extension_summary(self):
+        """Returns a copy of the running aggregate: count, sum and last-updated."""
+        return dict(self._ext_total)
+
+    @_locked
     def clear_extensions(self):
-        self.sleep_table.remove(Extension.type == "extension")
+        for key in self._ext_partitions:
+            self._partition(key).table("sleep").remove(Extension.type == "extension")
+        self._ext_partitions = set()
+        self._ext_total = {"count": 0, "sum": 0, "updated": None}
+        self._ext_by_occurrence = {}
+        self._events.pop("extension", None)
         Logger.info("[DB] Cleared extensions")
+        self._notify_write()
+
+    def _pending_minutes(self, occurrence=None):
+        """
+        Extension minutes not scored yet for one period: the planned night
+        `occurrence` (a key), or the one-off countdowns for None.
+        """
+        if occurrence is not None:
+            return self._ext_by_occurrence.get(occurrence, 0)
+        return self._ext_total["sum"] - sum(self._ext_by_occurrence.values())
+
+    def _clear_period(self, occurrence=None):
+        """Deletes the extensions of one period (see _pending_minutes), leaving the others."""
+        if occurrence is None and not self._ext_by_occurrence:
+            # Nothing planned is pending (always the case without plans)
+            self.clear_extensions()
+            return
+        count = minutes = 0
+        for key in list(self._ext_partitions):
+            table = self._partition(key).table("sleep")
+            docs = [doc for doc in table.search(Extension.type == "extension")
+                    if doc.get("occurrence") == occurrence]
+            if docs:
+                table.remove(doc_ids=[doc.doc_id for doc in docs])
+                count += len(docs)
+                minutes += sum(doc.get("minutes", 0) for doc in docs)
+            if not table.contains(Extension.type == "extension"):
+                self._ext_partitions.discard(key)
+        self._ext_total["count"] -= count
+        self._ext_total["sum"] -= minutes
+        self._ext_by_occurrence.pop(occurrence, None)
+        keys, records = self._events.get("extension", ([], []))
+        kept = [(k, r) for k, r in zip(keys, records) if r.get("occurrence") != occurrence]
+        self._events["extension"] = ([k for k, _ in kept], [r for _, r in kept])
+        Logger.info(f"[DB] Cleared {count} extension(s) of {occurrence or 'the one-off countdowns'}")
+        self._notify_write()
+
+    def _rebuild_extension_total(self):
+        """
+        Recomputes the running extension aggregate from the raw tables.
+        Only called on open, so a crash between a write and the in-memory
+        update can never leave the total out of sync with the file.
+
+        Extensions are cleared whenever a period is scored, so walking back
+        month by month can stop at the first month holding a score.
+        """
+        total = {"count": 0, "sum": 0, "updated": None}
+        self._ext_partitions = set()
+        self._ext_by_occurrence = {}
+        key = self._current_key()
+        while True:
+            table = self._partition(key).table("sleep")
+            for rec in table.search(Extension.type == "extension"):
+                total["count"] += 1
+                total["sum"] += rec.get("minutes", 0)
+                self._ext_partitions.add(key)
+                if rec.get("occurrence") is not None:
+                    by_occurrence = self._ext_by_occurrence
+                    by_occurrence[rec["occurrence"]] = by_occurrence.get(rec["occurrence"], 0) + rec.get("minutes", 0)
+                created = rec.get("created")
+                if created and (total["updated"] is None or created > total["updated"]):
+                    total["updated"] = created
+            if self._has_score(key):
+                break
+            older = self._unloaded_older()
+            if not older:
+                break
+            key = older[0]
+        self._ext_total = total
+
+    def _has_score(self, key):
+        """
+        True if month `key` holds a history score, raw or already rolled into a
+        daily row. A monthly summary counts too: it replaced the daily rows,
+        and nothing that old is still a raw extension.
+        """
+        db = self._partition(key)
+        if len(db.table("history")) or len(db.table("monthly")):
+            return True
+        return any(row.get("score") is not None for row in db.table("daily").all())
 
     # ---------------------------------------------------------
     # SCORE CALCULATION & WRITING
@@ -69,6 +429,7 @@ class Database:
         score = max(0.0, 100.0 - (m / MAX_DEVIATION) * 100.0)
         return round(score, 2)
 
+    @_locked
     def save_current_period_score(self):
         """
         CRITICAL FIX: Calculates the final consistency score for the current period,
@@ -76,15 +437,9 @@ class Database:
         (Called only when a new schedule starts)
         """
         try:
-            # 1. Get the total accumulated deviation from the current period
-            ext_list = self.get_all_extensions()
-            total_ext = sum(ext_list) if ext_list else 0
-
-            # 2. Calculate the final score for this completed period
-            score = self._calculate_score_from_minutes(total_ext)
-
-            # 3. Save this score to the permanent history table
-            self.save_score_to_history(score, total_ext)
+            # 1.-3. Score the one-off countdowns' extensions into today's history row.
+            # Extensions tagged with a planned night are left for that night's score.
+            score = self._score_period(datetime.now().date().isoformat())
 
             # 4. CRITICAL: Clear extensions AFTER saving the score (Handled by save_score_to_history)
 
@@ -95,11 +450,14 @@ class Database:
             Logger.error(f"[DB ERROR] Failed to finalize period score: {e}")
             raise Exception(f"Database error during score finalization: {e}")
 
-    def save_score_to_history(self, score, total_minutes):
+    @_locked
+    def save_score_to_history(self, score, total_minutes, day=None, occurrence=None):
         """
-        Saves the score to the history table under today's date and clears extensions.
+        Saves the score to the history table under `day` (default: today) and
+        clears the extensions it scored: those of the planned night
+        `occurrence`, or the one-off countdowns' for None.
         """
-        today_date_str = datetime.now().date().isoformat()
+        today_date_str = day or datetime.now().date().isoformat()
 
         record = {
             "date": today_date_str,
@@ -107,10 +465,24 @@ class Database:
             "minutes": total_minutes,
             "created": datetime.now().isoformat()
         }
-
-        # Use upsert in the permanent history table
-        self.history_table.upsert(record, History.date == today_date_str)
+        if occurrence is not None:
+            record["occurrence"] = occurrence
+
+        # Upsert through the date index instead of a query scan
+        entry = self._history_by_date.get(today_date_str)
+        if entry and entry["table"] == "history":
+            table = self._partition(entry["partition"]).table("history")
+            table.update(record, doc_ids=[entry["doc_id"]])
+            entry["score"] = score
+            entry["minutes"] = total_minutes
+            entry["created"] = record["created"]
+        else:
+            # A catch-up score for a night last month belongs in last month's file
+            key = partition_key(today_date_str)
+            doc_id = self._partition(key).table("history").insert(record)
+            self._index_history_record(key, doc_id, record)
         Logger.info(f"[DB WRITE] Saved score: {score}% for {today_date_str}")
+        self._notify_write()
 
         # FIX: Removed redundant self.clear_extensions() call from here,
         # as the main function save_current_period_score should handle it.
@@ -118,47 +490,388 @@ class Database:
         # For simplicity and correctness in this architecture, let's keep the clear
         # but ensure the method is only called once.
         # Since it was already here before the last error, we will assume this is correct.
-        self.clear_extensions()
+        self._clear_period(occurrence)
         return score
 
+    def _score_period(self, day, occurrence=None):
+        """
+        Scores one period's extensions (see _pending_minutes) into `day`'s
+        history row. A day already scored (a one-off countdown and a planned
+        night, or two plans) adds these minutes to its own instead of being
+        overwritten, so every extension counts exactly once.
+        """
+        minutes = self._pending_minutes(occurrence)
+        entry = self._history_by_date.get(day)
+        if entry is not None:
+            if not minutes and occurrence not in self._ext_by_occurrence:
+                # Nothing new for a day that already has its score
+                return entry["score"]
+            minutes += entry["minutes"]
+        score = self._calculate_score_from_minutes(minutes)
+        return self.save_score_to_history(score, minutes, day=day, occurrence=occurrence)
+
+    # ---------------------------------------------------------
+    # RECURRING SLEEP PLANS
+    # ---------------------------------------------------------
+    def _load_plans(self):
+        """Loads plans.json and indexes every occurrence not scored yet."""
+        try:
+            with open(join(self.user_folder, PLANS_FILE), encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        now = datetime.now()
+        oldest = (now - timedelta(days=MAX_CATCH_UP_DAYS)).isoformat()
+        self._plans = state.get("plans", {})
+        self._scored_through = max(state.get("scored_through") or now.isoformat(), oldest)
+        self._plan_index = OccurrenceIndex(self._plans, datetime.fromisoformat(self._scored_through))
+
+    def _save_plans(self):
+        path = join(self.user_folder, PLANS_FILE)
+        text = json.dumps({"plans": self._plans, "scored_through": self._scored_through})
+        get_writer().call(lambda: write_atomic(path, text))
+
+    @_locked
+    def save_plan(self, bedtimes, skip=(), plan_id=None):
+        """
+        Creates (or replaces) a weekly plan and returns its id.
+        bedtimes: {weekday (0 = Monday): "HH:MM"}; skip: ISO dates without a bedtime.
+        """
+        bedtimes = {str(int(day)): text for day, text in bedtimes.items()}
+        for day, text in bedtimes.items():
+            if not 0 <= int(day) <= 6:
+                raise ValueError(f"invalid weekday {day}")
+            parse_bedtime(text)
+        now = datetime.now()
+        plan_id = plan_id or "plan-" + now.strftime("%Y%m%d%H%M%S%f")
+        self._plans[plan_id] = {
+            "id": plan_id,
+            "bedtimes": bedtimes,
+            "skip": sorted(set(skip)),
+            "created": now.isoformat(),
+        }
+        self._plan_index.update_plan(plan_id, now)
+        self._save_plans()
+        Logger.info(f"[DB] Saved plan {plan_id}: {bedtimes}")
+        return plan_id
+
+    @_locked
+    def remove_plan(self, plan_id):
+        if self._plans.pop(plan_id, None) is None:
+            return False
+        self._plan_index.update_plan(plan_id, datetime.now())
+        self._save_plans()
+        Logger.info(f"[DB] Removed plan {plan_id}")
+        return True
+
+    @_locked
+    def skip_plan_day(self, plan_id, day):
+        """Drops one night (date or ISO date) from a plan without touching the rest."""
+        plan = self._plans[plan_id]
+        day = self._iso(day)[:10]
+        if day not in plan["skip"]:
+            bisect.insort(plan["skip"], day)
+            self._plan_index.update_plan(plan_id, datetime.now())
+            self._save_plans()
+
+    @_locked
+    def get_plans(self):
+        return [json.loads(json.dumps(plan)) for plan in self._plans.values()]
+
+    @_locked
+    def next_occurrence(self, now=None):
+        """The next planned bedtime after `now` (an Occurrence), or None without plans."""
+        now = now or datetime.now()
+        self._score_due_occurrences(now)
+        return self._plan_index.next_after(now)
+
+    @_locked
+    def occurrence_at(self, moment=None):
+        """
+        The planned night an action at `moment` belongs to: the last bedtime if
+        it passed less than OCCURRENCE_GRACE ago, otherwise the next one.
+        """
+        moment = moment or datetime.now()
+        previous = self._plan_index.previous(moment)
+        if previous is not None and moment - previous.when < OCCURRENCE_GRACE:
+            return previous
+        return self._plan_index.next_after(moment)
+
+    @_locked
+    def score_due_nights(self, now=None):
+        """Scores every planned night whose grace period is over (plan reads do this too)."""
+        self._score_due_occurrences(now or datetime.now())
+
+    def _score_due_occurrences(self, now):
+        """
+        Finalizes every planned night whose grace period is over: the
+        extensions tagged with it become part of its day's history score.
+        """
+        cutoff = now - OCCURRENCE_GRACE
+        start = datetime.fromisoformat(self._scored_through)
+        if cutoff <= start:
+            return
+        due = self._plan_index.between(start, cutoff)
+        for occurrence in due:
+            self._score_period(occurrence.day, occurrence.key)
+        # Nights whose plan was removed or skipped after an extension was tagged
+        # never come due; score them once their day is surely over
+        over = (cutoff - timedelta(days=1)).date().isoformat()
+        for key in [key for key in self._ext_by_occurrence if key.rpartition("@")[2] < over]:
+            self._score_period(key.rpartition("@")[2], key)
+        self._scored_through = cutoff.isoformat()
+        self._plan_index.trim(cutoff)
+        if due:
+            self._save_plans()
+
     # ---------------------------------------------------------
     # READ SCORES (REQUIRED BY main.py)
     # ---------------------------------------------------------
 
+    @_locked
     def get_latest_saved_score(self):
         """Retrieves the score from the most recent historical record for the main label."""
-        all_history = self.history_table.all()
-        if not all_history:
+        self._ensure_history(1)
+        if not self._history_dates:
             return 100.00
+        return self._history_by_date[self._history_dates[-1]]["score"]
 
-            # Sort by date descending to get the newest score first
-        all_history.sort(key=lambda r: r['date'], reverse=True)
-        return all_history[0]['score']
-
+    @_locked
     def get_recent_consistency_scores(self, days=7):
         """Retrieves consistency scores ONLY from the permanent history table (for the bar chart)."""
-        history = self.history_table.all()
+        if days <= 0:
+            return []
 
-        Logger.info(f"[DB READ] {len(history)} records loaded for charting.")
+        self._ensure_history(days)
+        final = [(self._history_by_date[d]["label"], self._history_by_date[d]["score"])
+                 for d in self._history_dates[-days:]]
+        Logger.info(f"[DB READ] Prepared chart data: {final}")
 
-        # Safe sort by date
-        def safe_date(rec):
-            try:
-                return datetime.fromisoformat(rec["date"]).date()
-            except:
-                return datetime(1970, 1, 1).date()
+        return final
 
-        history.sort(key=safe_date)
+    # ---------------------------------------------------------
+    # TIME-RANGE QUERIES
+    # ---------------------------------------------------------
+    @_locked
+    def get_events(self, event_type, start=None, end=None):
+        """
+        Raw events of one type with start <= created < end, oldest first.
+        start/end may be datetimes, dates or ISO strings; None means open-ended.
+        Months older than what is loaded are pulled in only if `start` reaches them.
+        """
+        start = self._iso(start)
+        end = self._iso(end)
+        if start is None:
+            self._load_all()
+        else:
+            while min(self.partitions) > partition_key(start) and self._load_next_older():
+                pass
+
+        keys, records = self._events.get(event_type, ([], []))
+        lo = 0 if start is None else bisect.bisect_left(keys, start)
+        hi = len(keys) if end is None else bisect.bisect_left(keys, end)
+        return [dict(r) for r in records[lo:hi]]
+
+    @_locked
+    def get_latest_event(self, event_type):
+        """Most recent raw event of a type, or None. Loads older months only until one is found."""
+        while True:
+            keys, records = self._events.get(event_type, ([], []))
+            if records:
+                return dict(records[-1])
+            if not self._load_next_older():
+                return None
+
+    @staticmethod
+    def _iso(value):
+        if value is None or isinstance(value, str):
+            return value
+        return value.isoformat()
+
+    def _index_event(self, rec):
+        created = rec.get("created")
+        if not isinstance(created, str):
+            return
+        keys, records = self._events.setdefault(rec.get("type"), ([], []))
+        if not keys or created >= keys[-1]:
+            # New events arrive in time order, so this is the common case
+            keys.append(created)
+            records.append(rec)
+        else:
+            i = bisect.bisect_right(keys, created)
+            keys.insert(i, created)
+            records.insert(i, rec)
+
+    def _unindex_events_before(self, partition, cutoff_day, types):
+        """Drops index entries of `partition` older than `cutoff_day` (after a roll-up)."""
+        for event_type in types:
+            keys, records = self._events.get(event_type, ([], []))
+            kept = [(k, r) for k, r in zip(keys, records)
+                    if not (partition_key(k) == partition and k[:10] < cutoff_day)]
+            self._events[event_type] = ([k for k, _ in kept], [r for _, r in kept])
 
-        results = []
-        for rec in history:
-            try:
-                d = datetime.fromisoformat(rec["date"]).date()
-                results.append((d.strftime("%b %d"), rec["score"]))
-            except Exception as e:
-                Logger.error(f"[DB READ] Skipped invalid record {rec} | {e}")
+    # ---------------------------------------------------------
+    # RETENTION / ROLL-UP
+    # ---------------------------------------------------------
+    def roll_up(self):
+        """
+        Rolls old raw events into daily rows and old daily rows into monthly
+        summaries. Incremental: months finished on an earlier run are skipped
+        (see retention.json). Holds the lock one month at a time, so UI writes
+        wait for at most one partition.
+        """
+        if self.raw_days is None:
+            return
+        try:
+            today = datetime.now().date()
+            raw_cutoff = (today - timedelta(days=self.raw_days)).isoformat()
+            daily_cutoff = partition_key((today - timedelta(days=self.daily_days)).isoformat())
+            state = retention.load_state(self.user_folder)
+
+            with self._lock:
+                months = list(self._on_disk)
+
+            for key in months:
+                if key > partition_key(raw_cutoff):
+                    break
+                if key < partition_key(state["raw_through"]):
+                    continue
+                with self._lock:
+                    if self._closed:
+                        return
+                    with self._open_partition(key) as (db, loaded):
+                        moved = retention.roll_up_days(db, raw_cutoff)
+                    if loaded:
+                        self._unindex_events_before(key, raw_cutoff, ("schedule", "event"))
+                        for day, doc_id in moved.items():
+                            entry = self._history_by_date.get(day)
+                            if entry and entry["partition"] == key:
+                                entry["table"], entry["doc_id"] = "daily", doc_id
+                state["raw_through"] = min(raw_cutoff, next_month(key) + "-01")
+                retention.save_state(self.user_folder, state)
+
+            for key in months:
+                if key >= daily_cutoff:
+                    break
+                if key < state["daily_through"]:
+                    continue
+                with self._lock:
+                    if self._closed:
+                        return
+                    with self._open_partition(key) as (db, loaded):
+                        folded = retention.fold_month(db, key)
+                    if loaded:
+                        self._unindex_dates(key, folded)
+                state["daily_through"] = next_month(key)
+                retention.save_state(self.user_folder, state)
+
+            Logger.info(f"[RETENTION] Roll-up done (raw < {raw_cutoff}, daily < {daily_cutoff})")
+        except Exception as e:
+            Logger.error(f"[RETENTION] Roll-up failed: {e}")
 
-        final = results[-days:]
-        Logger.info(f"[DB READ] Prepared chart data: {final}")
+    @_locked
+    def get_monthly_summaries(self):
+        """Monthly roll-ups (oldest first) for months older than the daily retention."""
+        summaries = []
+        for key in list(self._on_disk):
+            with self._open_partition(key) as (db, loaded):
+                summaries += db.table("monthly").all()
+        return summaries
 
-        return final
\ No newline at end of file
+    # ---------------------------------------------------------
+    # HISTORY DATE INDEX
+    # ---------------------------------------------------------
+    def _unindex_dates(self, partition, dates):
+        for day in dates:
+            entry = self._history_by_date.get(day)
+            if entry and entry["partition"] == partition:
+                del self._history_by_date[day]
+                i = bisect.bisect_left(self._history_dates, day)
+                if i < len(self._history_dates) and self._history_dates[i] == day:
+                    del self._history_dates[i]
+
+    def _ensure_history(self, count):
+        """Loads older months until `count` history records are indexed (or none are left)."""
+        while len(self._history_dates) < count and self._load_next_older():
+            pass
+
+    def _index_history_record(self, partition, doc_id, rec, table="history"):
+        """
+        Adds one history record to the sorted date index. The date is parsed and
+        the chart label formatted once here, never again on read.
+        Returns False for records with an unusable date.
+        """
+        try:
+            d = datetime.fromisoformat(rec["date"]).date()
+        except Exception as e:
+            Logger.error(f"[DB READ] Skipped invalid record {rec} | {e}")
+            return False
+
+        key = d.isoformat()
+        existing = self._history_by_date.get(key)
+        if existing is None:
+            bisect.insort(self._history_dates, key)
+        elif existing["created"] > rec.get("created", ""):
+            # Older duplicate of a date we already have: keep the newest one
+            return True
+
+        self._history_by_date[key] = {
+            "partition": partition,
+            "table": table,
+            "doc_id": doc_id,
+            "score": rec["score"],
+            "minutes": rec.get("minutes", rec.get("extension_minutes", 0)),
+            "label": d.strftime("%b %d"),
+            "created": rec.get("created", ""),
+        }
+        return True
+
+
+class DatabaseRegistry:
+    """
+    Keeps per-user Database handles open so switching back to a user does not
+    re-create folders or replay their files again. Holds at most `max_open`
+    handles; the least recently used one is flushed and closed on overflow.
+    """
+
+    def __init__(self, max_open=MAX_OPEN_DATABASES, factory=Database):
+        self.max_open = max(1, max_open)
+        self.factory = factory
+        self._open = OrderedDict()  # user_id -> Database, least recently used first
+
+    def get(self, user_id="guest"):
+        db = self._open.get(user_id)
+        if db is not None:
+            self._open.move_to_end(user_id)
+            Logger.info(f"[DB] Reusing open handle for: {user_id}")
+            return db
+
+        db = self.factory(user_id=user_id)
+        self._open[user_id] = db
+        while len(self._open) > self.max_open:
+            old_id, old_db = self._open.popitem(last=False)
+            self._close_handle(old_id, old_db)
+        return db
+
+    def close(self, user_id):
+        db = self._open.pop(user_id, None)
+        if db is not None:
+            self._close_handle(user_id, db)
+
+    def close_all(self):
+        while self._open:
+            user_id, db = self._open.popitem(last=False)
+            self._close_handle(user_id, db)
+
+    def __contains__(self, user_id):
+        return user_id in self._open
+
+    def __len__(self):
+        return len(self._open)
+
+    def _close_handle(self, user_id, db):
+        try:
+            db.close()
+            Logger.info(f"[DB] Closed handle for: {user_id}")
+        except Exception as e:
+            Logger.error(f"[DB] Failed to close handle for {user_id}: {e}")
@@ -0,0 +1,158 @@
+import os
+import time
+import queue
+import threading
+from kivy.logger import Logger
+
+# Bounded so a stuck disk applies back-pressure instead of eating memory
+MAX_QUEUE = 1000
+# Max jobs folded into one commit (one write + fsync per file)
+MAX_BATCH = 64
+
+
+def write_atomic(path, text):
+    """Replaces `path` with `text` so that a crash leaves either the old or the new file."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class BackgroundWriter:
+    """
+    Single background thread that performs all storage I/O off the Kivy main
+    thread. Callers enqueue already-serialized data; the worker drains the
+    queue in batches and commits each file once per batch.
+
+    Reads never wait for this thread: the storage updates its in-memory state
+    before enqueueing, so queued writes are visible immediately. flush() is
+    the durability barrier: when it returns, everything submitted before it
+    has been written and fsync'ed.
+    """
+
+    def __init__(self, max_queue=MAX_QUEUE, max_batch=MAX_BATCH):
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=max_queue)
+
+        # Monitoring counters (read from any thread, written by the worker)
+        self.commits = 0
+        self.records = 0
+        self.max_queue_depth = 0
+        self.last_commit_ms = 0.0
+        self.max_commit_ms = 0.0
+        self._total_commit_ms = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    # ---------------------------------------------------------
+    # PRODUCER SIDE
+    # ---------------------------------------------------------
+    def submit(self, sink, data):
+        """Queues `data` to be committed through sink._commit(list_of_data)."""
+        self._put(("data", sink, data))
+
+    def call(self, func):
+        """Runs func() on the writer thread, after everything queued before it."""
+        self._put(("call", None, func))
+
+    def flush(self, timeout=None):
+        """Blocks until all previously submitted work is durable. Returns False on timeout."""
+        if threading.current_thread() is self._thread:
+            return True
+        done = threading.Event()
+        self._put(("barrier", None, done))
+        return done.wait(timeout)
+
+    def _put(self, job):
+        self._queue.put(job + (time.monotonic(),))
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    # ---------------------------------------------------------
+    # MONITORING
+    # ---------------------------------------------------------
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "commits": self.commits,
+            "records": self.records,
+            "last_commit_ms": round(self.last_commit_ms, 2),
+            "avg_commit_ms": round(self._total_commit_ms / self.commits, 2) if self.commits else 0.0,
+            "max_commit_ms": round(self.max_commit_ms, 2),
+        }
+
+    # ---------------------------------------------------------
+    # WORKER SIDE
+    # ---------------------------------------------------------
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._process(batch)
+
+    def _process(self, batch):
+        pending = {}  # sink -> [data, ...] in submission order
+        oldest = None
+
+        for kind, sink, data, enqueued in batch:
+            if kind == "data":
+                pending.setdefault(sink, []).append(data)
+                if oldest is None:
+                    oldest = enqueued
+                continue
+
+            # Calls and barriers must see every earlier write on disk
+            self._commit(pending, oldest)
+            pending, oldest = {}, None
+            if kind == "call":
+                try:
+                    data()
+                except Exception as e:
+                    Logger.error(f"[DB WRITER] Background job failed: {e}")
+            else:
+                data.set()
+
+        self._commit(pending, oldest)
+
+    def _commit(self, pending, oldest):
+        if not pending:
+            return
+        for sink, items in pending.items():
+            try:
+                sink._commit(items)
+            except Exception as e:
+                Logger.error(f"[DB WRITER] Commit failed: {e}")
+            self.records += len(items)
+
+        latency = (time.monotonic() - oldest) * 1000.0
+        self.commits += 1
+        self.last_commit_ms = latency
+        self._total_commit_ms += latency
+        if latency > self.max_commit_ms:
+            self.max_commit_ms = latency
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Returns the process-wide writer, starting it on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = BackgroundWriter()
+        return _writer
@@ -0,0 +1,115 @@
+import time
+import threading
+from backend.telemetry import RingBuffer, RING_CAPACITY
+
+# The original single ESP32 publishes on bare topics ("lm35"); every other
+# device namespaces its topics as "<device>/lm35"
+DEFAULT_DEVICE = "esp32"
+
+# A device that has been silent this long (it publishes every second) is offline
+OFFLINE_AFTER = 10.0
+# A device that sent a telemetry batch this recently is read from batches only
+BATCH_TIMEOUT = 60.0
+
+
+def topic_for(device, sensor):
+    """'lm35' for the default device, 'bedroom/lm35' for any other."""
+    return sensor if device == DEFAULT_DEVICE else f"{device}/{sensor}"
+
+
+class DeviceState:
+    """Latest readings, history buffers and liveness of one ESP32."""
+
+    def __init__(self, name, ring_capacity=RING_CAPACITY):
+        self.name = name
+        self.ring_capacity = ring_capacity
+        self.buffers = {}          # sensor -> RingBuffer, created on first reading
+        self.labels = {}           # dashboard widget id -> latest text
+        self.last_seen = None      # monotonic time of the last message
+        self.last_batch = None     # monotonic time of the last telemetry batch
+        self.online = False
+        self.fan_controller = None
+
+    def key(self, sensor):
+        """Stream name for recorders and aggregators: 'lm35' or 'bedroom.lm35'."""
+        return sensor if self.name == DEFAULT_DEVICE else f"{self.name}.{sensor}"
+
+    def buffer(self, sensor):
+        buf = self.buffers.get(sensor)
+        if buf is None:
+            buf = self.buffers[sensor] = RingBuffer(self.ring_capacity)
+        return buf
+
+    def batching(self, now):
+        """True while the device delivers batches; its per-topic readings are then duplicates."""
+        return self.last_batch is not None and now - self.last_batch < BATCH_TIMEOUT
+
+    def seen(self, now):
+        """Records a message at monotonic `now`. True if the device just came online."""
+        self.last_seen = now
+        if self.online:
+            return False
+        self.online = True
+        return True
+
+
+class DeviceRegistry:
+    """
+    All devices seen on the broker connection, keyed by name.
+
+    resolve() maps a concrete topic to its (DeviceState, sensor) pair once and
+    caches it, so the per-message cost is one dict lookup however many
+    devices there are. Devices are only ever added (on the network thread);
+    readers on the main thread iterate over a snapshot.
+    """
+
+    def __init__(self, offline_after=OFFLINE_AFTER, ring_capacity=RING_CAPACITY, on_new_device=None):
+        self.offline_after = offline_after
+        self.ring_capacity = ring_capacity
+        self.on_new_device = on_new_device   # callback(DeviceState) when a device first appears
+        self._lock = threading.Lock()
+        self._devices = {}
+        self._topics = {}   # topic -> (DeviceState, sensor)
+        self.get(DEFAULT_DEVICE)
+
+    def __len__(self):
+        return len(self._devices)
+
+    def __contains__(self, name):
+        return name in self._devices
+
+    def names(self):
+        return sorted(self._devices)
+
+    def devices(self):
+        return list(self._devices.values())
+
+    def get(self, name):
+        device = self._devices.get(name)
+        if device is not None:
+            return device
+        with self._lock:
+            device = self._devices.get(name)
+            if device is None:
+                device = DeviceState(name, self.ring_capacity)
+                if self.on_new_device is not None:
+                    self.on_new_device(device)
+                self._devices[name] = device
+        return device
+
+    def resolve(self, topic):
+        entry = self._topics.get(topic)
+        if entry is None:
+            name, _, sensor = topic.rpartition("/")
+            entry = self._topics[topic] = (self.get(name or DEFAULT_DEVICE), sensor)
+        return entry
+
+    def expire(self, now=None):
+        """Marks silent devices offline. Returns the ones that just went offline."""
+        now = time.monotonic() if now is None else now
+        gone = []
+        for device in self.devices():
+            if device.online and now - device.last_seen > self.offline_after:
+                device.online = False
+                gone.append(device)
+        return gone
@@ -0,0 +1,138 @@
+import threading
+from collections import deque
+from kivy.logger import Logger
+
+# Aggregation period and how long a bucket waits for stragglers after it ends
+BUCKET_SECONDS = 60
+LATENESS_SECONDS = 10
+# Closed buckets kept per sensor for late subscribers (charts): 12 h of minutes
+HISTORY_BUCKETS = 12 * 60
+
+
+class Bucket:
+    """min / max / mean / last / count of one sensor over [start, start + period)."""
+
+    __slots__ = ("sensor", "start", "period", "min", "max", "sum", "count", "last", "last_ts")
+
+    def __init__(self, sensor, start, period):
+        self.sensor = sensor
+        self.start = start
+        self.period = period
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.sum = 0.0
+        self.count = 0
+        self.last = None
+        self.last_ts = float("-inf")
+
+    @property
+    def end(self):
+        return self.start + self.period
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def add(self, ts, value):
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.sum += value
+        self.count += 1
+        # 'last' is the newest by timestamp, not by arrival
+        if ts >= self.last_ts:
+            self.last_ts = ts
+            self.last = value
+
+    def as_dict(self):
+        return {"sensor": self.sensor, "start": self.start, "period": self.period,
+                "min": self.min, "max": self.max, "mean": self.mean,
+                "last": self.last, "count": self.count}
+
+
+class Downsampler:
+    """
+    Streaming per-sensor aggregation of (ts, value) samples into fixed buckets.
+
+    A bucket stays open until a sample at least `lateness` seconds past its end
+    arrives for that sensor, so late or out-of-order samples inside that window
+    are still counted. Samples for a bucket that has already been emitted are
+    dropped and counted in `late_dropped`. Memory is bounded: only the few open
+    buckets per sensor plus `history` closed ones are kept.
+
+    add() runs on the paho network thread, and subscribers are called there
+    too, in bucket order, once a bucket closes. UI subscribers should hop to
+    the main thread with Clock.
+    """
+
+    def __init__(self, period=BUCKET_SECONDS, lateness=LATENESS_SECONDS, history=HISTORY_BUCKETS):
+        self.period = period
+        self.lateness = lateness
+        self._lock = threading.Lock()
+        self._open = {}        # sensor -> {bucket start: Bucket}
+        self._watermark = {}   # sensor -> newest ts seen
+        self._closed_until = {}  # sensor -> start of the oldest bucket still accepting samples
+        self._history = {}     # sensor -> deque of closed Buckets
+        self._history_len = history
+        self._subscribers = []
+        self.late_dropped = 0
+
+    def subscribe(self, callback):
+        """callback(bucket) for every closed bucket of any sensor."""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def history(self, sensor):
+        """Closed buckets of one sensor, oldest first."""
+        with self._lock:
+            return list(self._history.get(sensor, ()))
+
+    def add(self, sensor, ts, value):
+        start = ts - ts % self.period
+        with self._lock:
+            if start < self._closed_until.get(sensor, float("-inf")):
+                self.late_dropped += 1
+                return
+            buckets = self._open.setdefault(sensor, {})
+            bucket = buckets.get(start)
+            if bucket is None:
+                bucket = buckets[start] = Bucket(sensor, start, self.period)
+            bucket.add(ts, value)
+
+            watermark = self._watermark[sensor] = max(self._watermark.get(sensor, ts), ts)
+            closed = self._close(sensor, watermark - self.lateness)
+        self._emit(closed)
+
+    def flush(self, sensor=None):
+        """Closes every open bucket (all sensors by default), e.g. at the end of a night."""
+        with self._lock:
+            closed = []
+            for name in ([sensor] if sensor is not None else list(self._open)):
+                closed.extend(self._close(name, float("inf")))
+        self._emit(closed)
+
+    def _close(self, sensor, before):
+        """Pops the buckets of `sensor` that end at or before `before`, oldest first."""
+        buckets = self._open.get(sensor)
+        if not buckets:
+            return []
+        closed = [buckets.pop(start) for start in sorted(buckets) if start + self.period <= before]
+        if closed:
+            self._closed_until[sensor] = closed[-1].end
+            history = self._history.get(sensor)
+            if history is None:
+                history = self._history[sensor] = deque(maxlen=self._history_len)
+            history.extend(closed)
+        return closed
+
+    def _emit(self, closed):
+        for bucket in closed:
+            for callback in self._subscribers:
+                try:
+                    callback(bucket)
+                except Exception as e:
+                    Logger.error(f"[DOWNSAMPLER] Subscriber failed: {e}")
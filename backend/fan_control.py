@@ -0,0 +1,159 @@
+import math
+from kivy.logger import Logger
+
+# Sensor topics the controller listens to (same names as in mqtt_client)
+TEMP_SENSOR = "lm35"
+AIR_SENSOR = "mq135"
+
+# Speed steps: the fan goes to step i+1 once the predicted reading reaches
+# THRESHOLDS[sensor][i], and drops back only below that minus the hysteresis band.
+# Step 1 matches the firmware's own PWM_FAN_TEMP_MIN / PWM_FAN_PPM_MIN.
+THRESHOLDS = {
+    TEMP_SENSOR: (28.0, 30.0),      # deg C
+    AIR_SENSOR: (500.0, 700.0),     # ppm
+}
+HYSTERESIS = {
+    TEMP_SENSOR: 1.0,
+    AIR_SENSOR: 50.0,
+}
+
+# Trend filter time constants (seconds) and how far ahead the slope is projected
+LEVEL_TAU = 2.0
+SLOPE_TAU = 30.0
+LOOKAHEAD = 30.0
+
+# Speeding up is sent at once; slowing down waits this long after the last command
+MIN_DOWN_INTERVAL = 60.0
+# The firmware follows a command for PWM_FAN_CMD_TIMEOUT (30 min) and then falls
+# back to its own thresholds, so the current speed is sent again this often
+KEEPALIVE_INTERVAL = 10 * 60.0
+# A device report still disagreeing this long after the last send means the
+# command was lost or lapsed, and it is sent again
+RESEND_AFTER = 15.0
+
+
+class TrendEstimator:
+    """
+    Exponentially weighted level and slope (per second) of one sensor stream,
+    for irregularly spaced samples. Out-of-order samples are ignored.
+    """
+
+    def __init__(self, level_tau=LEVEL_TAU, slope_tau=SLOPE_TAU):
+        self.level_tau = level_tau
+        self.slope_tau = slope_tau
+        self.level = None
+        self.slope = 0.0
+        self.ts = None
+
+    def update(self, ts, value):
+        if self.level is None:
+            self.level, self.ts = value, ts
+            return self.level
+        dt = ts - self.ts
+        if dt <= 0:
+            return self.level
+        a = 1.0 - math.exp(-dt / self.level_tau)
+        b = 1.0 - math.exp(-dt / self.slope_tau)
+        level = a * value + (1.0 - a) * (self.level + self.slope * dt)
+        self.slope = b * (level - self.level) / dt + (1.0 - b) * self.slope
+        self.level, self.ts = level, ts
+        return level
+
+    def predict(self, seconds=LOOKAHEAD):
+        return None if self.level is None else self.level + self.slope * seconds
+
+
+class FanController:
+    """
+    Closed-loop fan speed control from the lm35 / mq135 streams.
+
+    Every sample updates that sensor's trend and re-evaluates the speed at
+    once, so a rising reading is acted on in the same sample period. Each
+    sensor picks a step with hysteresis and the fan runs at the highest step.
+    Speed-ups go out immediately and slow-downs are rate limited. An unchanged
+    speed is only sent again as a keepalive, or when the device reports a
+    different one.
+
+    `send(speed)` is DashboardClient.set_fan_speed in the app; update() runs on
+    the paho network thread. Timestamps are the samples' wall-clock seconds,
+    so a recorded night replays exactly as it ran.
+    """
+
+    def __init__(self, send, thresholds=THRESHOLDS, hysteresis=HYSTERESIS,
+                 lookahead=LOOKAHEAD, min_down_interval=MIN_DOWN_INTERVAL,
+                 keepalive_interval=KEEPALIVE_INTERVAL, resend_after=RESEND_AFTER):
+        self.send = send
+        self.thresholds = thresholds
+        self.hysteresis = hysteresis
+        self.lookahead = lookahead
+        self.min_down_interval = min_down_interval
+        self.keepalive_interval = keepalive_interval    # None: never
+        self.resend_after = resend_after                # None: ignore device reports
+
+        self.trends = {sensor: TrendEstimator() for sensor in thresholds}
+        self.steps = {sensor: 0 for sensor in thresholds}
+        self.speed = None            # last speed sent (or seen on the device before that)
+        self.last_command_ts = None  # last speed change
+        self.last_sent_ts = None     # last send of any kind
+        self.commands = 0
+        self.resends = 0
+
+    def observe_device(self, speed, ts=None):
+        """
+        Device-reported speed. Until the first command it is taken as the
+        current speed; after that, a report that still disagrees
+        `resend_after` seconds after the last send gets the speed sent again.
+        Returns the speed sent, or None.
+        """
+        speed = int(speed)
+        if self.last_command_ts is None:
+            self.speed = speed
+            return None
+        if speed == self.speed or ts is None or self.resend_after is None:
+            return None
+        if ts - self.last_sent_ts < self.resend_after:
+            return None
+        Logger.info(f"[FAN] Device reports speed {speed}, expected {self.speed}: sending again")
+        return self._resend(ts)
+
+    def update(self, sensor, ts, value):
+        """Feeds one sample. Returns the speed sent, or None if nothing was sent."""
+        trend = self.trends.get(sensor)
+        if trend is None:
+            return None
+        trend.update(ts, value)
+        self.steps[sensor] = self._step(sensor, trend.predict(self.lookahead))
+        desired = max(self.steps.values())
+
+        if desired == self.speed:
+            if (self.keepalive_interval is not None and self.last_sent_ts is not None
+                    and ts - self.last_sent_ts >= self.keepalive_interval):
+                return self._resend(ts)
+            return None
+        if (self.speed is not None and desired < self.speed and self.last_command_ts is not None
+                and ts - self.last_command_ts < self.min_down_interval):
+            return None
+
+        self.speed = desired
+        self.last_command_ts = self.last_sent_ts = ts
+        self.commands += 1
+        Logger.info(f"[FAN] {sensor}={value:g} (trend {trend.level:.2f}, {trend.slope:+.3f}/s) -> speed {desired}")
+        self.send(desired)
+        return desired
+
+    def _resend(self, ts):
+        self.last_sent_ts = ts
+        self.resends += 1
+        self.send(self.speed)
+        return self.speed
+
+    def _step(self, sensor, predicted):
+        step = self.steps[sensor]
+        limits = self.thresholds[sensor]
+        band = self.hysteresis[sensor]
+        # Up while the next threshold is reached, down while below the current one minus the band
+        while step < len(limits) and predicted >= limits[step]:
+            step += 1
+        while step > 0 and predicted < limits[step - 1] - band:
+            step -= 1
+        return step
@@ -0,0 +1,107 @@
+import math
+
+# Log-spaced buckets: 4 per doubling from 0.1 ms, 84 buckets reach ~2.6 min
+BUCKET_FLOOR = 0.0001
+BUCKETS_PER_DOUBLING = 4
+BUCKET_COUNT = 84
+
+# Pipeline stages, in order, from the ESP32 sample to the rendered label
+STAGES = (
+    "firmware",   # sample taken -> batch published (device millis(); batches v2+)
+    "network",    # batch published -> paho read it (device wall clock vs ours; needs NTP)
+    "paho",       # paho read the packet -> on_message entered
+    "handler",    # on_message entered -> returned (decode, buffers, recorder, ...)
+    "ui",         # on_message entered -> value applied to its label
+    "total",      # sample taken -> value applied to its label (device timestamps only)
+)
+
+
+def _upper_bound(index):
+    return BUCKET_FLOOR * 2 ** ((index + 1) / BUCKETS_PER_DOUBLING)
+
+
+class LatencyHistogram:
+    """
+    Fixed-size log histogram of durations in seconds. record() is a log and a
+    list increment, cheap enough to run on every message. Negative durations
+    (clock skew between device and phone) are counted apart from the buckets.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.negative = 0
+
+    def record(self, seconds):
+        if seconds < 0:
+            self.negative += 1
+            return
+        if seconds <= BUCKET_FLOOR:
+            index = 0
+        else:
+            index = min(int(math.log2(seconds / BUCKET_FLOOR) * BUCKETS_PER_DOUBLING), BUCKET_COUNT - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile (seconds), None if empty."""
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(_upper_bound(index), self.max)
+        return self.max
+
+
+class LatencyTracker:
+    """
+    One LatencyHistogram per pipeline stage (see STAGES). Each stage is only
+    written from one thread (network or main), so no locking is needed.
+    """
+
+    def __init__(self):
+        self.stages = {stage: LatencyHistogram() for stage in STAGES}
+
+    def record(self, stage, seconds):
+        self.stages[stage].record(seconds)
+
+    def clear(self):
+        for histogram in self.stages.values():
+            histogram.clear()
+
+    def snapshot(self):
+        """{stage: {count, mean_ms, p50_ms, p95_ms, p99_ms, max_ms, negative}}"""
+        out = {}
+        for stage, h in self.stages.items():
+            ms = lambda s: round(s * 1000.0, 2) if s is not None else None
+            out[stage] = {
+                "count": h.count,
+                "mean_ms": ms(h.total / h.count) if h.count else None,
+                "p50_ms": ms(h.percentile(50)),
+                "p95_ms": ms(h.percentile(95)),
+                "p99_ms": ms(h.percentile(99)),
+                "max_ms": ms(h.max) if h.count else None,
+                "negative": h.negative,
+            }
+        return out
+
+    def dump(self):
+        """Plain-text table of every stage, for logs and the debug view."""
+        lines = [f"{'stage':<10}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)"]
+        for stage, row in self.snapshot().items():
+            cells = [row[k] for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+            text = "".join(f"{c:>10.2f}" if c is not None else f"{'-':>10}" for c in cells)
+            skew = f"  ({row['negative']} skewed)" if row["negative"] else ""
+            lines.append(f"{stage:<10}{row['count']:>8}{text}{skew}")
+        return "\n".join(lines)
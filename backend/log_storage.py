@@ -0,0 +1,215 @@
+import os
+import json
+import threading
+from tinydb.storages import Storage, touch
+from kivy.logger import Logger
+from backend.db_writer import get_writer
+
+# Fold the log into the snapshot once it holds this many records
+COMPACT_EVERY = 500
+
+
+def apply_record(state, rec):
+    """Applies one log line (insert/update, delete or table drop) to `state`."""
+    name = rec["t"]
+    if rec.get("drop"):
+        state.pop(name, None)
+    elif rec.get("del"):
+        state.get(name, {}).pop(rec["id"], None)
+    else:
+        state.setdefault(name, {})[rec["id"]] = rec["doc"]
+
+
+def read_tables(path):
+    """
+    The tables stored at `path` (snapshot, then both log tails), read without
+    writing anything: no torn-line repair, no compaction, no .log created.
+    Also reads a plain JSONStorage file.
+    """
+    state = {}
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+    for log_path in (path + ".log.old", path + ".log"):
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path, "rb") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break   # torn last line
+                apply_record(state, rec)
+    return state
+
+
+class AppendLogStorage(Storage):
+    """
+    TinyDB storage that appends one JSON line per changed document instead of
+    rewriting the whole file on every insert/upsert.
+
+    Layout on disk (next to each other in the user's folder):
+      sleep_data.json             -> snapshot, same format as TinyDB's JSONStorage
+      sleep_data.json.log         -> tail of changes written since the snapshot
+      sleep_data.json.log.old     -> tail being folded by a running compaction
+
+    Opening replays snapshot + old tail + tail, so an existing sleep_data.json
+    written by the default JSONStorage is picked up as-is.
+
+    Appends and compaction run on the shared BackgroundWriter thread. The
+    in-memory state is updated before the line is queued, so reads always see
+    queued writes; close() waits until they are on disk.
+    """
+
+    def __init__(self, path, compact_every=COMPACT_EVERY, writer=None, **kwargs):
+        super().__init__()
+        self.path = path
+        self.log_path = path + ".log"
+        self.old_log_path = path + ".log.old"
+        self.compact_every = compact_every
+        self.writer = writer or get_writer()
+
+        self._lock = threading.Lock()
+        self._compact_queued = False
+
+        touch(path, create_dirs=False)
+        self._state = self._load_snapshot()
+        replayed = self._replay(self.old_log_path) + self._replay(self.log_path)
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        self._tail_lines = replayed
+
+        # A compaction was interrupted last time: finish it before going on
+        if os.path.exists(self.old_log_path) or self._tail_lines >= self.compact_every:
+            self._compact()
+
+    # ---------------------------------------------------------
+    # TINYDB STORAGE INTERFACE
+    # ---------------------------------------------------------
+    def read(self):
+        # TinyDB updates documents in place, so hand out copies and keep
+        # our own state untouched until write() tells us what changed.
+        with self._lock:
+            return {name: {doc_id: dict(doc) for doc_id, doc in table.items()}
+                    for name, table in self._state.items()}
+
+    def write(self, data):
+        lines = []
+        with self._lock:
+            for name, table in data.items():
+                old_table = self._state.get(name, {})
+                for doc_id, doc in table.items():
+                    if old_table.get(doc_id) != doc:
+                        lines.append({"t": name, "id": doc_id, "doc": doc})
+                for doc_id in old_table.keys() - table.keys():
+                    lines.append({"t": name, "id": doc_id, "del": 1})
+            for name in self._state.keys() - data.keys():
+                lines.append({"t": name, "drop": 1})
+
+            self._state = {name: dict(table) for name, table in data.items()}
+            self._tail_lines += len(lines)
+
+        if lines:
+            self.writer.submit(self, "".join(json.dumps(r) + "\n" for r in lines))
+
+        if self._tail_lines >= self.compact_every:
+            self.compact()
+
+    def flush(self, timeout=None):
+        """Waits until every write made so far is on disk."""
+        return self.writer.flush(timeout)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if not self._log.closed:
+                self._log.close()
+
+    # ---------------------------------------------------------
+    # LOG HANDLING
+    # ---------------------------------------------------------
+    def _commit(self, chunks):
+        """Called on the writer thread with every chunk queued in one batch."""
+        if self._log.closed:
+            return
+        self._log.write("".join(chunks))
+        self._log.flush()
+        os.fsync(self._log.fileno())
+
+    def _load_snapshot(self):
+        if os.path.getsize(self.path) == 0:
+            return {}
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _replay(self, log_path):
+        """Applies every complete line of a log file to the in-memory state."""
+        if not os.path.exists(log_path):
+            return 0
+
+        count = 0
+        good_size = 0
+        with open(log_path, "rb+") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-append: cut it off so the
+                    # next append starts on a clean line
+                    Logger.warning(f"[DB LOG] Dropping partial record in {log_path}")
+                    f.truncate(good_size)
+                    break
+                apply_record(self._state, rec)
+                good_size += len(line)
+                count += 1
+        return count
+
+    # ---------------------------------------------------------
+    # COMPACTION
+    # ---------------------------------------------------------
+    def compact(self):
+        """Queues a compaction behind the writes already waiting on the writer thread."""
+        with self._lock:
+            if self._compact_queued:
+                return
+            self._compact_queued = True
+        self.writer.call(self._compact)
+
+    def _compact(self):
+        """
+        Folds the log into a fresh snapshot. Runs on the writer thread (or at
+        open), so no append can interleave with the log rotation.
+        """
+        with self._lock:
+            self._compact_queued = False
+            # Documents are never mutated after they reach _state, so a shallow
+            # copy of each table is a consistent view of this moment.
+            snapshot = {name: dict(table) for name, table in self._state.items()}
+            self._tail_lines = 0
+
+        if self._log.closed:
+            return
+        self._log.close()
+        if os.path.exists(self.old_log_path):
+            # An earlier compaction never finished: keep both tails until
+            # this snapshot is safely on disk
+            with open(self.old_log_path, "ab") as old, open(self.log_path, "rb") as tail:
+                old.write(tail.read())
+                old.flush()
+                os.fsync(old.fileno())
+            os.remove(self.log_path)
+        else:
+            os.replace(self.log_path, self.old_log_path)
+        self._log = open(self.log_path, "a", encoding="utf-8")
+
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            os.remove(self.old_log_path)
+            Logger.info(f"[DB LOG] Compacted {self.path}")
+        except Exception as e:
+            # The old tail is kept, so the next open replays it again
+            Logger.error(f"[DB LOG] Compaction failed: {e}")
@@ -1,6 +1,15 @@
 import paho.mqtt.client as mqtt
 import json
+import time
+import random
+import threading
 from kivy.clock import Clock
+from backend.devices import DeviceRegistry, DEFAULT_DEVICE, topic_for
+from backend.downsampler import Downsampler
+from backend.topic_dispatch import TopicDispatcher
+from backend.telemetry_batch import decode_batch
+from backend.latency import LatencyTracker
+from backend.command_queue import CommandQueue, SENT, DELIVERED, CONFIRMED
 
 # ====== CONFIGURE MQTT CONNECTION AND TOPICS ======
 BROKER = "10.207.185.23"
@@ -8,11 +17,59 @@ PORT = 1883
 USERNAME = "Ruyik1207"
 PASSWORD = "Ruyik1207"
 
-# Topics for Dashboard Data
+# Topics for Dashboard Data. The default ESP32 publishes on these bare names,
+# further devices on "<device>/<topic>" (e.g. "bedroom/lm35")
 TOPIC_TEMP = "lm35"
 TOPIC_AIR = "mq135"
 TOPIC_FAN = "PWM_Fan"
+# Fan speed commands (app -> ESP32). Kept off TOPIC_FAN, where the ESP32
+# reports its fan state, so a command never comes back as a reading.
+TOPIC_FAN_CMD = "PWM_Fan_cmd"
 TOPIC_LIGHT = "light"
+# Batched binary/JSON samples of all sensors (backend/telemetry_batch.py)
+TOPIC_TELEMETRY = "telemetry"
+
+# Sensor topics and the JSON key holding the reading when the payload is JSON
+SENSOR_FIELDS = {
+    TOPIC_TEMP: "temp",
+    TOPIC_AIR: None,
+    TOPIC_FAN: None,    # the ESP32 sends its speed step as a bare number
+}
+
+# Dashboard label (widget id, format) for each sensor topic
+DASHBOARD_LABELS = {
+    TOPIC_TEMP: ("temp_lbl", "{}"),
+    TOPIC_AIR: ("aqi_lbl", "{}"),
+    TOPIC_FAN: ("fan_speed_lbl", "Speed: {}"),
+}
+
+# Label text for numeric samples that arrive in a batch, matching the firmware's
+# per-topic formatting (dtostrf 2 decimals for temperature, whole ppm, 0/1 fan)
+BATCH_LABEL_TEXT = {
+    TOPIC_TEMP: "{:.2f}",
+    TOPIC_AIR: "{:.0f}",
+    TOPIC_FAN: "{:.0f}",
+}
+
+# Reconnect backoff (seconds): paho doubles the delay after each failed attempt
+# up to the max; the starting delay is jittered per outage so a flaky access
+# point does not see every client retry in lockstep
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 120
+
+# Payload of the light-OFF command. The app is subscribed to the light topics,
+# so it hears its own command come back; that says nothing about the device.
+LIGHT_OFF = "OFF"
+
+# How command progress is shown in the status label
+COMMAND_NAMES = {TOPIC_LIGHT: "Light OFF", TOPIC_FAN_CMD: "Fan speed"}
+
+# Dashboard label refresh: None = at most once per frame, or a rate cap in Hz
+UI_FLUSH_HZ = None
+# How often silent devices are checked for going offline (seconds)
+DEVICE_CHECK_INTERVAL = 2.0
+# Per-stage latency histograms (backend/latency.py); cheap enough to leave on
+LATENCY_TRACKING = True
 # =================================================
 
 class DashboardClient(object):
@@ -21,14 +78,58 @@ class DashboardClient(object):
     Requires a reference to the Kivy App instance to update UI elements.
     """
 
-    def __init__(self, app_instance):
+    def __init__(self, app_instance, ui_hz=UI_FLUSH_HZ, outbox_path=None, client=None):
         self.app = app_instance
-        self.client = mqtt.Client()
+        # `client` lets tests and benchmarks substitute a paho look-alike
+        self.client = client if client is not None else mqtt.Client()
+
+        # Device commands waiting for a connection / delivery (persisted if a path is given)
+        self.outbox = CommandQueue(outbox_path)
+
+        # Latest-value-wins label slots, flushed to the widgets once per frame
+        self.ui_hz = ui_hz
+        self._ui_lock = threading.Lock()
+        self._ui_slots = {}      # widget id -> newest text not yet on screen
+        self._ui_shown = {}      # widget id -> text currently on the label
+        self._ui_times = {}      # widget id -> (on_message monotonic, sample wall ts or None)
+        self._flush_scheduled = False
+        self._device_list_changed = True
+
+        # Per-device readings, history buffers and online/offline state; the
+        # dashboard shows `self.device` and can switch without resubscribing
+        self._fan_factory = None
+        self.devices = DeviceRegistry(on_new_device=self._on_new_device)
+        self.device = self.devices.get(DEFAULT_DEVICE)
+        self._device_check = None
+        # Optional TelemetryRecorder for full-night files (set by the app per user)
+        self.recorder = None
+        # Per-minute min/max/mean/last/count buckets; charts, storage and alerts
+        # subscribe here instead of to the raw 1 Hz stream
+        self.downsampler = Downsampler()
+        # Sample -> label latency per pipeline stage; see dump_latency()
+        self.latency = LatencyTracker() if LATENCY_TRACKING else None
+        self._rx = (0.0, 0.0)    # (paho read, on_message entered) of the message being handled
+
+        # Topic -> handler routing for the default device and "+/<topic>" for
+        # the rest; JSON payloads carry the reading under `field`
+        # (e.g. {"temp":26.5,"humidity":60} or {"speed":1})
+        self.dispatcher = TopicDispatcher()
+        for sensor, field in SENSOR_FIELDS.items():
+            self.dispatcher.register(sensor, self._on_reading, field=field)
+            self.dispatcher.register(f"+/{sensor}", self._on_reading, field=field)
+        # The ESP32 reports the light state ("0"/"1") every second
+        self.dispatcher.register(TOPIC_LIGHT, self._on_light_state)
+        self.dispatcher.register(f"+/{TOPIC_LIGHT}", self._on_light_state)
+        self.dispatcher.register(TOPIC_TELEMETRY, self._on_batch, raw=True)
+        self.dispatcher.register(f"+/{TOPIC_TELEMETRY}", self._on_batch, raw=True)
 
         # Attach callbacks
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
+        self.client.on_connect_fail = self.on_connect_fail
+        self.client.on_publish = self.on_publish
+        self._jitter_reconnect_delay()
 
         # Set credentials and TLS for HiveMQ Cloud
         if USERNAME and PASSWORD:
@@ -40,98 +141,327 @@ class DashboardClient(object):
             print(f"Attempting MQTT connection to {BROKER}:{PORT}")
             self.client.connect_async(BROKER, PORT, 60)
             self.client.loop_start()
+            if self._device_check is None:
+                self._device_check = Clock.schedule_interval(self._check_devices, DEVICE_CHECK_INTERVAL)
         except Exception as e:
             print(f"MQTT connection error: {e}")
             # Update status label on the UI if possible
-            Clock.schedule_once(lambda dt: self._update_status(f"Connect Error: {e}"))
+            self._update_status(f"Connect Error: {e}")
 
     def on_connect(self, client, userdata, flags, rc):
         print(f"MQTT Dashboard connected with result code {rc}")
         if rc == 0:
-            client.subscribe(TOPIC_TEMP)
-            client.subscribe(TOPIC_AIR)
-            client.subscribe(TOPIC_FAN)
-            Clock.schedule_once(lambda dt: self._update_status("Connected"))
+            for topic_filter in self.dispatcher.topic_filters():
+                client.subscribe(topic_filter)
+            self._update_status("Connected")
+            # Replay anything queued while we were offline
+            self._send_pending()
         else:
-            Clock.schedule_once(lambda dt: self._update_status(f"Connection Failed: RC {rc}"))
+            self._update_status(f"Connection Failed: RC {rc}")
 
     def on_disconnect(self, client, userdata, rc):
         print(f"MQTT Dashboard disconnected with result code {rc}")
-        Clock.schedule_once(lambda dt: self._update_status("Disconnected"))
+        # Unacknowledged commands go out again after the reconnect
+        self.outbox.mark_unsent()
+        self._jitter_reconnect_delay()
+        self._update_status("Disconnected")
+
+    def on_connect_fail(self, client, userdata):
+        print("MQTT Dashboard connection attempt failed, backing off")
+        self._update_status("Reconnecting...")
+
+    def _jitter_reconnect_delay(self):
+        self.client.reconnect_delay_set(
+            min_delay=RECONNECT_MIN_DELAY * random.uniform(1.0, 2.0),
+            max_delay=RECONNECT_MAX_DELAY,
+        )
 
     def on_message(self, client, userdata, msg):
-        payload = msg.payload.decode('utf-8', errors='ignore')
-        topic = msg.topic
-
-        def update_ui(dt):
-            # RESILIENCE FIX: Check if the screen manager and the screen exist
-            try:
-                # Use screen_names check to avoid the ScreenManagerException crash during early startup
-                if 'dashboard' not in self.app.root.screen_names:
-                    return
-            except AttributeError:
-                # Catches cases where self.app.root is not yet fully initialized
-                return
+        entered = time.monotonic()
+        # paho stamps each message with its monotonic clock when it reads the packet
+        read_at = getattr(msg, "timestamp", entered)
+        self._rx = (read_at, entered)
+        self.dispatcher.dispatch(msg.topic, msg.payload)
+        if self.latency is not None:
+            self.latency.record("paho", entered - read_at)
+            self.latency.record("handler", time.monotonic() - entered)
 
-            screen = self.app.root.get_screen('dashboard')
+    def _on_reading(self, topic, value, text):
+        """Sensor handler (network thread): value is None if the payload had no number."""
+        device, sensor = self.devices.resolve(topic)
+        if sensor == TOPIC_FAN and value is None and text.startswith("{"):
+            # {"speed": n} is a fan command (older app builds sent it here), not a reading
+            return
+        self._touch(device)
+        # A batching device repeats its readings on the old topics now and then
+        # for other subscribers; its samples come from the batches
+        if value is not None and not device.batching(time.monotonic()):
+            # Record the numeric reading before the UI hop
+            now = time.time()
+            device.buffer(sensor).append(now, value)
+            self._ingest(device, sensor, now, value)
 
-            if topic == TOPIC_TEMP:
-                try:
-                    # Expecting JSON like {"temp":26.5,"humidity":60}
-                    data = json.loads(payload)
-                    screen.ids.temp_lbl.text = str(data.get("temp", "--"))
-                except Exception:
-                    # Handle single value update if not JSON
-                    screen.ids.temp_lbl.text = payload
+        widget_id, fmt = DASHBOARD_LABELS[sensor]
+        self._set_device_ui(device, widget_id, fmt.format(text))
 
-            elif topic == TOPIC_AIR:
-                screen.ids.aqi_lbl.text = payload
+    def _on_batch(self, topic, payload):
+        """Telemetry batch handler (network thread): many samples of many sensors at once."""
+        device = self.devices.resolve(topic)[0]
+        batch = decode_batch(payload)
+        if batch is None:
+            print(f"MQTT Dashboard: ignoring malformed batch on '{topic}'")
+            return
+        self._touch(device)
+        device.last_batch = time.monotonic()
+        if self.latency is not None:
+            for delay in batch.publish_delays:
+                self.latency.record("firmware", delay)
+            if batch.sent is not None:
+                received = time.time() - (time.monotonic() - self._rx[0])
+                self.latency.record("network", received - batch.sent)
 
-            elif topic == TOPIC_FAN:
-                # FIX: Parse the JSON payload to get the speed integer
-                try:
-                    data = json.loads(payload)
-                    speed = str(data.get("speed", "--"))
-                except Exception:
-                    speed = payload  # Fallback if it's just the speed string
+        columns = {}  # sensor -> ([ts...], [value...])
+        light = None
+        for sensor, ts, value in batch.samples:
+            if sensor == TOPIC_LIGHT:
+                light = value
+            elif sensor in SENSOR_FIELDS:
+                ts_col, value_col = columns.setdefault(sensor, ([], []))
+                ts_col.append(ts)
+                value_col.append(value)
+                self._ingest(device, sensor, ts, value)
 
-                screen.ids.fan_speed_lbl.text = f"Speed: {speed}"
+        # Buffers are filled in bulk; the dashboard only needs each sensor's newest sample
+        for sensor, (ts_col, value_col) in columns.items():
+            device.buffer(sensor).extend(ts_col, value_col)
+            widget_id, fmt = DASHBOARD_LABELS[sensor]
+            text = fmt.format(BATCH_LABEL_TEXT[sensor].format(value_col[-1]))
+            self._set_device_ui(device, widget_id, text, ts_col[-1] if batch.synced else None)
+        if light is not None:
+            self._report(self.outbox.on_device_state(topic_for(device.name, TOPIC_LIGHT), "%d" % light))
 
-        Clock.schedule_once(update_ui)
+    def _ingest(self, device, sensor, ts, value):
+        """Per-sample consumers, fed identically from single readings and batches."""
+        key = device.key(sensor)
+        if self.recorder is not None:
+            self.recorder.record(key, ts, value)
+        self.downsampler.add(key, ts, value)
+        if device.fan_controller is not None:
+            if sensor == TOPIC_FAN:
+                device.fan_controller.observe_device(value, ts)
+            else:
+                device.fan_controller.update(sensor, ts, value)
 
-    def _update_status(self, text):
-        """Updates the status label on the Dashboard screen."""
+    def _on_light_state(self, topic, value, text):
+        """Light state from an ESP32 (network thread); confirms a delivered light command."""
+        if text == LIGHT_OFF:
+            return
+        self._touch(self.devices.resolve(topic)[0])
+        self._report(self.outbox.on_device_state(topic, text))
+
+    # ---------------------------------------------------------
+    # DEVICES
+    # ---------------------------------------------------------
+    @property
+    def buffers(self):
+        """Sensor -> RingBuffer of the device shown on the dashboard."""
+        return self.device.buffers
+
+    def select_device(self, name):
+        """Shows another device's readings (main thread). False if it is unknown."""
+        if name not in self.devices:
+            return False
+        device = self.devices.get(name)
+        if device is self.device:
+            return True
+        with self._ui_lock:
+            self.device = device
+            for widget_id, fmt in DASHBOARD_LABELS.values():
+                self._ui_slots[widget_id] = device.labels.get(widget_id, fmt.format("--"))
+                self._ui_times.pop(widget_id, None)
+            self._ui_slots["device_spinner"] = name
+            self._schedule_flush_locked()
+        self._update_status(f"{name} {'online' if device.online else 'offline'}")
+        return True
+
+    def enable_fan_control(self, factory):
+        """
+        Gives every device (present and future) its own fan controller, built as
+        factory(send) where send(speed) commands that device's fan.
+        """
+        self._fan_factory = factory
+        for device in self.devices.devices():
+            self._on_new_device(device)
+
+    def _on_new_device(self, device):
+        if self._fan_factory is not None and device.fan_controller is None:
+            name = device.name
+            device.fan_controller = self._fan_factory(lambda speed: self.set_fan_speed(speed, device=name))
+        with self._ui_lock:
+            self._device_list_changed = True
+        if device.name != DEFAULT_DEVICE:
+            print(f"MQTT Dashboard found device '{device.name}'")
+
+    def _touch(self, device):
+        if device.seen(time.monotonic()) and device is self.device:
+            self._update_status(f"{device.name} online")
+
+    def _check_devices(self, dt):
+        for device in self.devices.expire():
+            print(f"MQTT Dashboard: device '{device.name}' went offline")
+            if device is self.device:
+                self._update_status(f"{device.name} offline")
+
+    # ---------------------------------------------------------
+    # COALESCED DASHBOARD UPDATES
+    # ---------------------------------------------------------
+    def _set_ui(self, widget_id, text):
+        """Stores the newest text for a label (any thread) and schedules one flush."""
+        with self._ui_lock:
+            self._ui_slots[widget_id] = text
+            self._ui_times.pop(widget_id, None)
+            self._schedule_flush_locked()
+
+    def _set_device_ui(self, device, widget_id, text, sample_ts=None):
+        """
+        Like _set_ui, but only reaches the screen if `device` is the one shown.
+        Called from message handlers; the value is timed from on_message (and
+        from `sample_ts`, the device's wall-clock sample time, when known).
+        """
+        with self._ui_lock:
+            device.labels[widget_id] = text
+            if device is self.device:
+                self._ui_slots[widget_id] = text
+                self._ui_times[widget_id] = (self._rx[1], sample_ts)
+                self._schedule_flush_locked()
+
+    def _schedule_flush_locked(self):
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            Clock.schedule_once(self.flush_ui, 1.0 / self.ui_hz if self.ui_hz else 0)
+
+    def _dashboard_visible(self):
         try:
-            # RESILIENCE FIX: Check if the screen manager and the screen exist
-            if 'dashboard' not in self.app.root.screen_names:
+            return self.app.root.current == 'dashboard'
+        except AttributeError:
+            # Catches cases where self.app.root is not yet fully initialized
+            return False
+
+    def flush_ui(self, *args):
+        """
+        Pushes pending label texts to the dashboard (main thread only). While the
+        dashboard is hidden the slots are kept, and DashboardScreen.on_enter
+        calls this again to catch up in one go.
+        """
+        with self._ui_lock:
+            self._flush_scheduled = False
+            if not self._dashboard_visible():
+                # Values wait for the screen; timing them would measure the user, not the pipeline
+                self._ui_times.clear()
                 return
+            slots, self._ui_slots = self._ui_slots, {}
+            times, self._ui_times = self._ui_times, {}
+            device_list_changed, self._device_list_changed = self._device_list_changed, False
 
-            screen = self.app.root.get_screen('dashboard')
-            screen.ids.status_lbl.text = f"MQTT: {text}"
-        except Exception:
-            # Fallback in case of any Kivy internal error during early startup
-            pass
+        screen = self.app.root.get_screen('dashboard')
+        spinner = screen.ids.get("device_spinner")
+        if device_list_changed and spinner is not None:
+            spinner.values = self.devices.names()
+        for widget_id, text in slots.items():
+            if self._ui_shown.get(widget_id) == text:
+                continue
+            widget = screen.ids.get(widget_id)
+            if widget is not None:
+                widget.text = text
+                self._ui_shown[widget_id] = text
 
-    def publish_turn_off(self):
-        """Sends the command to turn off the smart light when sleep time is reached."""
-        if not self.client.is_connected():
-             print("MQTT Warning: Not connected. Cannot send OFF command.")
-             return
+        if self.latency is not None and times:
+            now, wall = time.monotonic(), time.time()
+            for entered, sample_ts in times.values():
+                self.latency.record("ui", now - entered)
+                if sample_ts is not None:
+                    self.latency.record("total", wall - sample_ts)
 
-        payload = "OFF"
-        self.client.publish(TOPIC_LIGHT, payload, qos=1)
-        print(f"MQTT Published: {TOPIC_LIGHT} OFF command.")
-        Clock.schedule_once(lambda dt: self._update_status("Sent Light OFF"))
+    def dump_latency(self):
+        """Per-stage latency table (text), or None when tracking is off."""
+        return self.latency.dump() if self.latency is not None else None
 
-    def set_fan_speed(self, speed):
-        """Publishes fan speed control message."""
+    def _update_status(self, text):
+        """Updates the status label on the Dashboard screen (safe from any thread)."""
+        self._set_ui("status_lbl", f"MQTT: {text}")
+
+    # ---------------------------------------------------------
+    # DEVICE COMMANDS
+    # ---------------------------------------------------------
+    def publish_turn_off(self, device=None):
+        """Sends the command to turn off the smart light(s) when sleep time is reached."""
+        names = [device] if device is not None else self.devices.names()
+        for name in names:
+            topic = topic_for(name, TOPIC_LIGHT)
+            # Confirmed once that ESP32 reports its light as off ("0")
+            self.outbox.put(topic, LIGHT_OFF, qos=1, confirm_topic=topic, confirm="0")
+        if not self.client.is_connected():
+            print("MQTT Warning: Not connected. Light OFF queued until reconnect.")
+            self._update_status("Light OFF queued (offline)")
+            return
+        self._send_pending()
+
+    def set_fan_speed(self, speed, device=None):
+        """
+        Publishes fan speed control message to `device` (default: the one shown).
+        Only the latest speed per device is kept while offline.
+        """
+        name = device if device is not None else self.device.name
         payload = json.dumps({"speed": speed})
-        self.client.publish(TOPIC_FAN, payload, qos=1)
-        # Status update relies on the subscription callback
+        self.outbox.put(topic_for(name, TOPIC_FAN_CMD), payload, qos=1)
+        # Status comes from the outbox (queued/sent/delivered); the speed the device
+        # actually runs arrives with its own PWM_Fan reports
+        self._send_pending()
+
+    def command_state(self, topic):
+        """'queued', 'sent' or 'delivered' for an outstanding command, None once confirmed."""
+        return self.outbox.state(topic)
+
+    def _send_pending(self):
+        """Publishes every queued command (any thread)."""
+        if not self.client.is_connected():
+            return
+        for cmd in self.outbox.take_pending():
+            info = self.client.publish(cmd["topic"], cmd["payload"], qos=cmd["qos"])
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                # Dropped between the check and the publish; on_connect replays it
+                self.outbox.requeue(cmd)
+                continue
+            print(f"MQTT Published: {cmd['topic']} {cmd['payload']}")
+            self._report(self.outbox.mark_sent(cmd, info.mid))
+
+    def on_publish(self, client, userdata, mid):
+        """PUBACK from the broker for a QoS 1 command."""
+        self._report(self.outbox.on_puback(mid))
+
+    def _report(self, cmd):
+        if cmd is None:
+            return
+        device, _, sensor = cmd["topic"].rpartition("/")
+        name = COMMAND_NAMES.get(sensor, sensor)
+        if device:
+            name = f"{device} {name}"
+        if cmd["state"] == SENT:
+            self._update_status(f"Sent {name}")
+        elif cmd["state"] == DELIVERED:
+            self._update_status(f"{name} reached broker")
+        elif cmd["state"] == CONFIRMED:
+            done = "confirmed by device" if cmd["confirm_topic"] else "delivered"
+            self._update_status(f"{name} {done}")
 
     def disconnect(self):
         try:
             self.client.loop_stop()
             self.client.disconnect()
         except Exception:
-            pass
\ No newline at end of file
+            pass
+        if self._device_check is not None:
+            self._device_check.cancel()
+            self._device_check = None
+        # Hand the last partial minute to subscribers
+        self.downsampler.flush()
\ No newline at end of file
@@ -0,0 +1,173 @@
+import json
+from os.path import join
+from kivy.logger import Logger
+from backend.db_writer import write_atomic
+
+# Raw schedule/event records older than this are folded into one row per day
+RAW_RETENTION_DAYS = 30
+# Daily rows older than this are folded into one summary per month
+DAILY_RETENTION_DAYS = 365
+
+RETENTION_STATE_FILE = "retention.json"
+
+
+def new_daily_row(day):
+    return {
+        "date": day,
+        "schedule_time": None,         # last bedtime saved that day
+        "schedules": 0,
+        "events": 0,
+        "sleep_time_reached": False,
+        "extension_minutes": 0,        # total deviation of the period finalized that day
+        "score": None,                 # history score finalized that day
+        "through": "",                 # newest raw 'created' already folded in
+    }
+
+
+def new_monthly_row(month):
+    return {
+        "month": month,
+        "dates": [],                   # days already folded in (keeps re-runs idempotent)
+        "days": 0,
+        "schedules": 0,
+        "nights_reached": 0,
+        "extension_minutes": 0,
+        "scored_days": 0,
+        "score_sum": 0.0,
+        "avg_score": None,
+    }
+
+
+def roll_up_days(partition, cutoff_day):
+    """
+    Folds raw schedule/event records and history rows dated before `cutoff_day`
+    into the partition's 'daily' table, then removes the raw records.
+
+    Each daily row remembers the newest raw 'created' it has absorbed, so running
+    this again after a crash between the upsert and the delete never counts a
+    record twice. Extension records are left alone: they belong to the open
+    period and are cleared when it is finalized.
+
+    Returns {date: daily_doc_id} for every day whose history row moved.
+    """
+    sleep = partition.table("sleep")
+    history = partition.table("history")
+    daily = partition.table("daily")
+
+    days = {}
+    for rec in sleep.all():
+        created = rec.get("created", "")
+        if rec.get("type") in ("schedule", "event") and len(created) >= 10 and created[:10] < cutoff_day:
+            days.setdefault(created[:10], {"raw": [], "history": None})["raw"].append(rec)
+    for rec in history.all():
+        day = rec.get("date", "")
+        if len(day) == 10 and day < cutoff_day:
+            days.setdefault(day, {"raw": [], "history": None})["history"] = rec
+
+    if not days:
+        return {}
+
+    existing = {row["date"]: row for row in daily.all()}
+    moved = {}
+    raw_ids = []
+    history_ids = []
+
+    for day in sorted(days):
+        parts = days[day]
+        old = existing.get(day)
+        row = dict(old) if old else new_daily_row(day)
+        through = row["through"]
+        newest = through
+
+        for rec in sorted(parts["raw"], key=lambda r: r["created"]):
+            raw_ids.append(rec.doc_id)
+            if rec["created"] <= through:
+                continue
+            if rec["type"] == "schedule":
+                row["schedule_time"] = rec.get("time")
+                row["schedules"] += 1
+            elif rec.get("name") == "sleep_time_reached":
+                row["sleep_time_reached"] = True
+            else:
+                row["events"] += 1
+            newest = max(newest, rec["created"])
+
+        h = parts["history"]
+        if h is not None:
+            history_ids.append(h.doc_id)
+            if h.get("created", "") > through:
+                row["score"] = h.get("score")
+                row["extension_minutes"] = h.get("minutes", 0)
+                newest = max(newest, h.get("created", ""))
+
+        row["through"] = newest
+        if old:
+            daily.update(row, doc_ids=[old.doc_id])
+            doc_id = old.doc_id
+        else:
+            doc_id = daily.insert(row)
+        if h is not None:
+            moved[day] = doc_id
+
+    if raw_ids:
+        sleep.remove(doc_ids=raw_ids)
+    if history_ids:
+        history.remove(doc_ids=history_ids)
+    return moved
+
+
+def fold_month(partition, month):
+    """
+    Folds every daily row of a partition into its single 'monthly' summary and
+    removes the daily rows. Returns the list of dates that were removed.
+    """
+    daily = partition.table("daily")
+    monthly = partition.table("monthly")
+
+    rows = daily.all()
+    if not rows:
+        return []
+
+    existing = monthly.all()
+    summary = dict(existing[0]) if existing else new_monthly_row(month)
+    seen = set(summary["dates"])
+
+    for row in sorted(rows, key=lambda r: r["date"]):
+        if row["date"] in seen:
+            continue
+        seen.add(row["date"])
+        summary["dates"].append(row["date"])
+        summary["days"] += 1
+        summary["schedules"] += row.get("schedules", 0)
+        summary["nights_reached"] += 1 if row.get("sleep_time_reached") else 0
+        summary["extension_minutes"] += row.get("extension_minutes", 0)
+        if row.get("score") is not None:
+            summary["scored_days"] += 1
+            summary["score_sum"] += row["score"]
+
+    if summary["scored_days"]:
+        summary["avg_score"] = round(summary["score_sum"] / summary["scored_days"], 2)
+
+    if existing:
+        monthly.update(summary, doc_ids=[existing[0].doc_id])
+    else:
+        monthly.insert(summary)
+    daily.remove(doc_ids=[row.doc_id for row in rows])
+    return [row["date"] for row in rows]
+
+
+def load_state(user_folder):
+    """{'raw_through': 'YYYY-MM-DD', 'daily_through': 'YYYY-MM'}: everything before is rolled."""
+    try:
+        with open(join(user_folder, RETENTION_STATE_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"raw_through": "", "daily_through": ""}
+
+
+def save_state(user_folder, state):
+    try:
+        write_atomic(join(user_folder, RETENTION_STATE_FILE), json.dumps(state))
+    except OSError as e:
+        # Only costs a re-scan next time; the roll-up itself is idempotent
+        Logger.warning(f"[RETENTION] Could not save state: {e}")
@@ -1,34 +1,341 @@
 import time
+import json
+import heapq
 import threading
-from datetime import datetime
+from datetime import datetime, timedelta
+from kivy.clock import Clock
+from kivy.logger import Logger
+from backend.db_writer import get_writer, write_atomic
+from backend.command_queue import COMMAND_TTL
+
+# While wall-clock timers are pending, the clock is re-read at least this often
+# to catch NTP corrections, manual changes and DST (and phone suspend, during
+# which the monotonic clock stops)
+WALL_CHECK_INTERVAL = 60.0
+# A wall/monotonic offset change bigger than this counts as a clock jump
+WALL_JUMP_TOLERANCE = 1.0
+# Cancelled entries are purged once they outnumber the live ones by this much
+COMPACT_RATIO = 2
+
+
+class Timer:
+    """Handle for one scheduled callback. cancel() is O(1); the heap entry is dropped lazily."""
+
+    __slots__ = ("callback", "deadline", "wall", "name", "cancelled", "fired", "_scheduler")
+
+    def __init__(self, scheduler, callback, deadline, wall, name):
+        self._scheduler = scheduler
+        self.callback = callback
+        self.deadline = deadline    # monotonic seconds
+        self.wall = wall            # unix seconds for wall-clock timers, else None
+        self.name = name
+        self.cancelled = False
+        self.fired = False
+
+    @property
+    def active(self):
+        return not (self.cancelled or self.fired)
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self):
+        self._scheduler.cancel(self)
+
+
+class TimerScheduler:
+    """
+    One background thread serving any number of timers from a min-heap of
+    monotonic deadlines.
+
+    The thread sleeps on a Condition until the earliest deadline (or forever
+    when nothing is pending), so an idle scheduler costs no CPU. Adding a
+    timer is a heap push; cancelling marks the entry and leaves it in the
+    heap until it surfaces or the heap is compacted.
+
+    call_at() timers are pinned to a wall-clock time: their monotonic
+    deadline is re-derived whenever the wall clock is seen to jump, so
+    "23:00" still fires at 23:00 after an NTP sync or a suspend.
+
+    Callbacks run on the scheduler thread and must be short; use
+    `main_thread=True` for anything touching widgets.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []             # [(deadline, seq, Timer)]
+        self._seq = 0
+        self._cancelled = 0
+        self._wall_timers = 0       # live call_at() timers; only they need the wall-clock check
+        self._offset = time.time() - time.monotonic()
+        self._running = True
+        self.fired = 0
+        self.wall_jumps = 0
+        self._thread = threading.Thread(target=self._run, name="timers", daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._heap) - self._cancelled
+
+    # ---------------------------------------------------------
+    # PUBLIC API (any thread)
+    # ---------------------------------------------------------
+    def call_later(self, delay, callback, name=None, main_thread=False):
+        """Runs callback() after `delay` seconds of monotonic time."""
+        return self._add(time.monotonic() + max(0.0, delay), None, callback, name, main_thread)
+
+    def call_at(self, when, callback, name=None, main_thread=False):
+        """Runs callback() at `when` (datetime or unix seconds) on the wall clock."""
+        wall = when.timestamp() if isinstance(when, datetime) else float(when)
+        return self._add(wall - self._offset, wall, callback, name, main_thread)
+
+    def cancel(self, timer):
+        with self._cond:
+            if not timer.active:
+                return False
+            timer.cancelled = True
+            self._cancelled += 1
+            if timer.wall is not None:
+                self._wall_timers -= 1
+            if self._cancelled > 16 and self._cancelled * COMPACT_RATIO > len(self._heap):
+                self._compact_locked()
+            # No notify: the thread waking up early for a dead entry just discards it
+            return True
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout=1.0)
+
+    # ---------------------------------------------------------
+    # SCHEDULER THREAD
+    # ---------------------------------------------------------
+    def _add(self, deadline, wall, callback, name, main_thread):
+        if main_thread:
+            target = callback
+            callback = lambda: Clock.schedule_once(lambda dt: target(), 0)
+        with self._cond:
+            timer = Timer(self, callback, deadline, wall, name)
+            self._push_locked(timer)
+            if wall is not None:
+                self._wall_timers += 1
+            # Only an earlier head changes how long the thread should sleep
+            if self._heap[0][2] is timer:
+                self._cond.notify()
+        return timer
+
+    def _push_locked(self, timer):
+        self._seq += 1
+        heapq.heappush(self._heap, (timer.deadline, self._seq, timer))
+
+    def _compact_locked(self):
+        self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+        heapq.heapify(self._heap)
+        self._cancelled = 0
+
+    def _check_wall_locked(self):
+        """Re-pins wall-clock timers if the wall clock moved relative to the monotonic one."""
+        offset = time.time() - time.monotonic()
+        if abs(offset - self._offset) <= WALL_JUMP_TOLERANCE:
+            return
+        Logger.info(f"[TIMER] Wall clock jumped {offset - self._offset:+.1f}s, re-pinning timers")
+        self._offset = offset
+        self.wall_jumps += 1
+        live = [entry[2] for entry in self._heap if not entry[2].cancelled]
+        self._heap, self._cancelled = [], 0
+        for timer in live:
+            if timer.wall is not None:
+                timer.deadline = timer.wall - offset
+            self._push_locked(timer)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                due = None
+                while self._running:
+                    self._check_wall_locked()
+                    while self._heap and self._heap[0][2].cancelled:
+                        heapq.heappop(self._heap)
+                        self._cancelled -= 1
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    timeout = self._heap[0][0] - time.monotonic()
+                    if timeout <= 0:
+                        due = heapq.heappop(self._heap)[2]
+                        due.fired = True
+                        if due.wall is not None:
+                            self._wall_timers -= 1
+                        break
+                    if self._wall_timers:
+                        timeout = min(timeout, WALL_CHECK_INTERVAL)
+                    self._cond.wait(timeout)
+                if due is None:
+                    return
+            self.fired += 1
+            try:
+                due.callback()
+            except Exception as e:
+                Logger.error(f"[TIMER] {due.name or 'timer'} callback failed: {e}")
+
+
+_timers = None
+_timers_lock = threading.Lock()
+
+
+def get_timers():
+    """The process-wide TimerScheduler, started on first use."""
+    global _timers
+    with _timers_lock:
+        if _timers is None:
+            _timers = TimerScheduler()
+        return _timers
+
 
 class SleepScheduler:
-    def __init__(self, mqtt_client, db):
+    """
+    Bedtime countdown on top of the shared TimerScheduler: a single wall-clock
+    timer turns the light off at the target time and then notifies the app
+    on the main thread.
+
+    With a `state_path`, every change (start, extension, cancel, fire) is
+    checkpointed atomically through the background writer, and restore()
+    re-arms the countdown after the app was killed: no DB access, just one
+    small JSON file.
+    """
+
+    def __init__(self, mqtt_client, db, timers=None, state_path=None):
         self.mqtt = mqtt_client
         self.db = db
-        self.running = False
-        self.remaining_seconds = 0
+        self.timers = timers if timers is not None else get_timers()
+        self.state_path = state_path
+        self.target = None          # datetime of the running countdown
+        self.started = None         # when it was started (before any extension)
+        self.extensions = []        # minutes added since it was started
+        self.fired_at = None        # target of the last countdown that fired
+        self._bedtime = None
+        self._on_finished = None
+
+    @property
+    def running(self):
+        return self._bedtime is not None and self._bedtime.active
 
     def set_schedule(self, time_str):
         self.db.save_schedule(time_str)
 
-    def start_countdown(self, target_time_str, callback_update, callback_finished):
-        """ target_time_str format: '23:00' """
+    def remaining(self):
+        """Seconds left on the countdown, None if none is running."""
+        if not self.running:
+            return None
+        return max(0.0, self.target.timestamp() - time.time())
+
+    def start_countdown(self, target, on_finished=None):
+        """
+        Counts down to `target` (datetime, or "HH:MM" for its next occurrence).
+        on_finished() runs on the main thread once the light-OFF is queued.
+        """
+        if isinstance(target, str):
+            now = datetime.now()
+            t = datetime.strptime(target, "%H:%M")
+            target = now.replace(hour=t.hour, minute=t.minute, second=0, microsecond=0)
+            if target <= now:
+                target += timedelta(days=1)
+        self.started = datetime.now()
+        self.extensions = []
+        self._arm(target, on_finished)
+        self._checkpoint()
+        return target
+
+    def extend_time(self, minutes, on_finished=None):
+        """
+        Moves the running countdown `minutes` later (or starts one from now).
+        on_finished, if given, replaces the countdown's callback; a countdown
+        started here has no other.
+        """
+        try:
+            self.db.save_extension(minutes)
+        except Exception as e:
+            Logger.error(f"[DB] save_extension failed: {e}")
+        if not self.running:
+            self.started = datetime.now()
+            self.extensions = []
+        base = self.target if self.running else datetime.now()
+        self.extensions.append(minutes)
+        if on_finished is None:
+            on_finished = self._on_finished
+        self._arm(base + timedelta(minutes=minutes), on_finished)
+        self._checkpoint()
+        return self.target
+
+    def cancel(self):
+        if self._bedtime is not None:
+            self._bedtime.cancel()
+            self._bedtime = None
+            self._checkpoint()
+
+    def _arm(self, target, on_finished):
+        if self._bedtime is not None:
+            self._bedtime.cancel()
+        self.target = target
+        self._on_finished = on_finished
+        self._bedtime = self.timers.call_at(target, self._fire, name="bedtime")
 
-        self.running = True
+    def _fire(self):
+        # Scheduler thread: the outbox is thread-safe, widgets are not
+        self.mqtt.publish_turn_off()
+        self.fired_at = self.target
+        # Queued behind the outbox write, so a crash never loses both the timer and the command
+        self._checkpoint()
+        if self._on_finished is not None:
+            Clock.schedule_once(lambda dt: self._on_finished(), 0)
 
-        def run():
-            while self.running:
-                now = datetime.now().strftime("%H:%M")
-                if now >= target_time_str:
-                    callback_finished()
-                    self.mqtt.publish_turn_off()
-                    break
-                time.sleep(1)
+    # ---------------------------------------------------------
+    # PERSISTENCE
+    # ---------------------------------------------------------
+    def _checkpoint(self):
+        if not self.state_path:
+            return
+        state = {
+            "target": self.target.isoformat() if self.running else None,
+            "started": self.started.isoformat() if self.running and self.started else None,
+            "extensions": list(self.extensions) if self.running else [],
+            "fired_at": self.fired_at.isoformat() if self.fired_at else None,
+        }
+        text = json.dumps(state)
+        path = self.state_path
+        get_writer().call(lambda: write_atomic(path, text))
 
-        thread = threading.Thread(target=run)
-        thread.start()
+    def restore(self, on_finished=None):
+        """
+        Re-arms the countdown saved by the last run. A target that passed while
+        the app was dead fires at once, unless it is older than COMMAND_TTL
+        (last night's light-OFF). Returns True if a countdown is running.
+        """
+        if not self.state_path:
+            return False
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+            target = datetime.fromisoformat(state["target"]) if state.get("target") else None
+            started = datetime.fromisoformat(state["started"]) if state.get("started") else None
+            fired_at = datetime.fromisoformat(state["fired_at"]) if state.get("fired_at") else None
+            extensions = [int(m) for m in state.get("extensions", [])]
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            if not isinstance(e, FileNotFoundError):
+                Logger.warning(f"[SCHED] Ignoring unreadable {self.state_path}: {e}")
+            return False
 
-    def extend_time(self, minutes):
-        self.db.save_extension(minutes)
-        self.mqtt.publish_extend(minutes)
+        self.fired_at = fired_at
+        if target is None:
+            return False
+        if (datetime.now() - target).total_seconds() > COMMAND_TTL:
+            Logger.info(f"[SCHED] Dropped stale countdown to {target}")
+            self._checkpoint()
+            return False
+        self.started = started
+        self.extensions = extensions
+        self._arm(target, on_finished)
+        Logger.info(f"[SCHED] Resumed countdown to {target} ({len(extensions)} extension(s))")
+        return True
@@ -0,0 +1,140 @@
+import bisect
+from datetime import datetime, timedelta
+
+# Occurrences are precomputed this many days ahead (extended as time passes)
+PLAN_HORIZON_DAYS = 14
+
+
+def parse_bedtime(text):
+    """'22:30' -> (22, 30). Raises ValueError for anything else."""
+    hour, minute = (int(part) for part in text.split(":"))
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"invalid bedtime {text!r}")
+    return hour, minute
+
+
+class Occurrence:
+    """One planned bedtime: the plan it comes from and its wall-clock time."""
+
+    __slots__ = ("when", "plan_id")
+
+    def __init__(self, when, plan_id):
+        self.when = when            # naive local datetime
+        self.plan_id = plan_id
+
+    @property
+    def day(self):
+        return self.when.date().isoformat()
+
+    @property
+    def key(self):
+        """Stable id stored on extensions and history rows: '<plan id>@2025-12-03'."""
+        return f"{self.plan_id}@{self.day}"
+
+    def __repr__(self):
+        return f"Occurrence({self.key} {self.when:%H:%M})"
+
+
+def occurrences(plan, first_day, last_day):
+    """Occurrences of `plan` on the days first_day <= day < last_day, in time order."""
+    bedtimes = plan.get("bedtimes", {})
+    skip = set(plan.get("skip", ()))
+    day = first_day
+    while day < last_day:
+        text = bedtimes.get(str(day.weekday()))
+        if text and day.isoformat() not in skip:
+            hour, minute = parse_bedtime(text)
+            yield Occurrence(datetime(day.year, day.month, day.day, hour, minute), plan["id"])
+        day += timedelta(days=1)
+
+
+class OccurrenceIndex:
+    """
+    Upcoming occurrences of every plan, merged into one list sorted by time.
+
+    next_after() keeps a cursor into the list, so asking for the next bedtime
+    as time moves forward is O(1); a plan change only rewrites that plan's
+    entries from a given time on. The list always covers up to
+    `horizon_days` ahead and is extended lazily.
+    """
+
+    def __init__(self, plans, start, horizon_days=PLAN_HORIZON_DAYS):
+        self.plans = plans              # plan id -> plan dict, owned by the Database
+        self.horizon = timedelta(days=horizon_days)
+        self._times = []                # sorted timestamps
+        self._items = []                # Occurrence, same order
+        self._cursor = 0
+        self._until = start.date()      # occurrences are generated for days < _until
+        self._extend(start + self.horizon)
+
+    def __len__(self):
+        return len(self._items)
+
+    def _extend(self, until):
+        last_day = until.date() + timedelta(days=1)
+        if last_day <= self._until:
+            return
+        new = []
+        for plan in self.plans.values():
+            new += occurrences(plan, self._until, last_day)
+        # Every new day is later than every indexed one, so appending keeps the order
+        new.sort(key=lambda o: o.when)
+        self._times += [o.when.timestamp() for o in new]
+        self._items += new
+        self._until = last_day
+
+    def _insert(self, occurrence):
+        ts = occurrence.when.timestamp()
+        i = bisect.bisect_right(self._times, ts)
+        self._times.insert(i, ts)
+        self._items.insert(i, occurrence)
+        if i < self._cursor:
+            self._cursor += 1
+
+    def _remove_from(self, plan_id, since):
+        start = bisect.bisect_left(self._times, since.timestamp())
+        keep = [i for i in range(start, len(self._items)) if self._items[i].plan_id != plan_id]
+        self._times[start:] = [self._times[i] for i in keep]
+        self._items[start:] = [self._items[i] for i in keep]
+        self._cursor = min(self._cursor, len(self._items))
+
+    def update_plan(self, plan_id, since):
+        """Re-generates one plan's occurrences from `since` on (after an edit, add or delete)."""
+        self._remove_from(plan_id, since)
+        plan = self.plans.get(plan_id)
+        if plan is None:
+            return
+        for occurrence in occurrences(plan, since.date(), self._until):
+            if occurrence.when >= since:
+                self._insert(occurrence)
+
+    def next_after(self, now):
+        """First occurrence strictly after `now` (datetime), or None if there are no plans."""
+        self._extend(now + self.horizon)
+        ts = now.timestamp()
+        i = self._cursor
+        if i > 0 and self._times[i - 1] > ts:
+            # The clock went backwards
+            i = bisect.bisect_right(self._times, ts)
+        while i < len(self._times) and self._times[i] <= ts:
+            i += 1
+        self._cursor = i
+        return self._items[i] if i < len(self._items) else None
+
+    def previous(self, now):
+        """Last occurrence at or before `now`, or None."""
+        i = bisect.bisect_right(self._times, now.timestamp())
+        return self._items[i - 1] if i else None
+
+    def between(self, start, end):
+        """Occurrences with start < when <= end, oldest first."""
+        lo = bisect.bisect_right(self._times, start.timestamp())
+        hi = bisect.bisect_right(self._times, end.timestamp())
+        return self._items[lo:hi]
+
+    def trim(self, before):
+        """Forgets occurrences at or before `before` (already scored)."""
+        n = bisect.bisect_right(self._times, before.timestamp())
+        if n:
+            del self._times[:n], self._items[:n]
+            self._cursor = max(0, self._cursor - n)
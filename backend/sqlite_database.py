@@ -0,0 +1,336 @@
+import os
+import sqlite3
+from datetime import datetime
+from os.path import join, exists
+from kivy.app import App
+from kivy.logger import Logger
+
+from backend.database import MAX_DEVIATION, PARTITION_FILE, LEGACY_FILE
+from backend.log_storage import read_tables
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    name TEXT,
+    time TEXT,
+    minutes INTEGER,
+    created TEXT NOT NULL,
+    occurrence TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_type_created ON events (type, created);
+CREATE INDEX IF NOT EXISTS idx_events_created ON events (created);
+
+-- the primary key doubles as the index on history date
+CREATE TABLE IF NOT EXISTS history (
+    date TEXT PRIMARY KEY,
+    score REAL NOT NULL,
+    minutes INTEGER NOT NULL,
+    created TEXT NOT NULL,
+    occurrence TEXT
+);
+
+-- monthly summaries migrated from TinyDB's retention roll-up
+CREATE TABLE IF NOT EXISTS monthly (
+    month TEXT PRIMARY KEY,
+    days INTEGER NOT NULL,
+    schedules INTEGER NOT NULL,
+    nights_reached INTEGER NOT NULL,
+    extension_minutes INTEGER NOT NULL,
+    scored_days INTEGER NOT NULL,
+    score_sum REAL NOT NULL,
+    avg_score REAL
+);
+"""
+
+
+class SQLiteDatabase:
+    """
+    Event and score store backed by the stdlib sqlite3 module, where every
+    read is answered from an index instead of scanning and sorting the whole
+    table in Python.
+
+    Only a subset of Database is implemented: events, schedules, extensions,
+    history scores, write listeners and the monthly summaries carried over by
+    migrate_from_tinydb(). Recurring sleep plans (save_plan, next_occurrence,
+    ...), per-day or per-occurrence scoring, retention roll-ups and the
+    background writer (flush, writer_stats) are not, so
+    SleepApp still needs Database; this class is the target of
+    migrate_from_tinydb().
+    """
+
+    def __init__(self, user_id="guest"):
+        try:
+            base_dir = App.get_running_app().user_data_dir
+        except Exception:
+            base_dir = "."  # Fallback for PyCharm desktop
+
+        self.user_folder = join(base_dir, "users", user_id)
+        if not exists(self.user_folder):
+            os.makedirs(self.user_folder, exist_ok=True)
+            Logger.info(f"[SQL DB] Created folder for: {user_id}")
+
+        self.db_file = join(self.user_folder, "sleep_data.db")
+        self.conn = sqlite3.connect(self.db_file)
+        self.conn.row_factory = sqlite3.Row
+
+        # WAL lets the chart queries read while a write is being committed
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # Files created before occurrences were tracked lack the column
+        for table in ("events", "history"):
+            columns = {row["name"] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            if "occurrence" not in columns:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN occurrence TEXT")
+
+        self._write_listeners = []
+        self._rebuild_extension_total()
+
+        Logger.info(f"[SQL DB] User '{user_id}' is now using: {self.db_file}")
+
+    def close(self):
+        self.conn.close()
+
+    def add_write_listener(self, callback):
+        """Registers callback() to run after every write affecting consistency data."""
+        if callback not in self._write_listeners:
+            self._write_listeners.append(callback)
+
+    def remove_write_listener(self, callback):
+        if callback in self._write_listeners:
+            self._write_listeners.remove(callback)
+
+    def _notify_write(self):
+        for callback in self._write_listeners:
+            try:
+                callback()
+            except Exception as e:
+                Logger.error(f"[SQL DB] Write listener failed: {e}")
+
+    def _insert_event(self, record):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO events (type, name, time, minutes, created, occurrence) VALUES (?, ?, ?, ?, ?, ?)",
+                (record["type"], record.get("name"), record.get("time"),
+                 record.get("minutes"), record["created"], record.get("occurrence"))
+            )
+
+    def log_event(self, name):
+        self._insert_event({"type": "event", "name": name, "created": datetime.now().isoformat()})
+        Logger.info(f"[SQL DB] Event logged: {name}")
+
+    # ---------------------------------------------------------
+    # RAW EVENT LOGGING METHODS
+    # ---------------------------------------------------------
+    def save_schedule(self, time_str):
+        self._insert_event({"type": "schedule", "time": time_str, "created": datetime.now().isoformat()})
+        self._notify_write()
+
+    def save_extension(self, minutes):
+        created = datetime.now().isoformat()
+        self._insert_event({"type": "extension", "minutes": minutes, "created": created})
+        self._ext_total["count"] += 1
+        self._ext_total["sum"] += minutes
+        self._ext_total["updated"] = created
+        Logger.info(f"[SQL DB] Saved extension: {minutes} minutes")
+        self._notify_write()
+
+    def get_all_extensions(self):
+        rows = self.conn.execute(
+            "SELECT minutes FROM events WHERE type = 'extension' ORDER BY created"
+        ).fetchall()
+        return [r["minutes"] for r in rows]
+
+    def get_extension_total(self):
+        """Total extension minutes for the current period (O(1), no table scan)."""
+        return self._ext_total["sum"]
+
+    def get_extension_summary(self):
+        """Returns a copy of the running aggregate: count, sum and last-updated."""
+        return dict(self._ext_total)
+
+    def clear_extensions(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM events WHERE type = 'extension'")
+        self._ext_total = {"count": 0, "sum": 0, "updated": None}
+        Logger.info("[SQL DB] Cleared extensions")
+        self._notify_write()
+
+    def _rebuild_extension_total(self):
+        row = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(minutes), 0), MAX(created) FROM events WHERE type = 'extension'"
+        ).fetchone()
+        self._ext_total = {"count": row[0], "sum": row[1], "updated": row[2]}
+
+    # ---------------------------------------------------------
+    # TIME-RANGE QUERIES (served by idx_events_type_created)
+    # ---------------------------------------------------------
+    def get_events(self, event_type, start=None, end=None):
+        """Raw events of one type with start <= created < end, oldest first."""
+        sql = "SELECT type, name, time, minutes, created, occurrence FROM events WHERE type = ?"
+        params = [event_type]
+        if start is not None:
+            sql += " AND created >= ?"
+            params.append(start if isinstance(start, str) else start.isoformat())
+        if end is not None:
+            sql += " AND created < ?"
+            params.append(end if isinstance(end, str) else end.isoformat())
+        rows = self.conn.execute(sql + " ORDER BY created", params).fetchall()
+        return [self._event_dict(r) for r in rows]
+
+    def get_latest_event(self, event_type):
+        row = self.conn.execute(
+            "SELECT type, name, time, minutes, created, occurrence FROM events WHERE type = ? ORDER BY created DESC LIMIT 1",
+            (event_type,)
+        ).fetchone()
+        return self._event_dict(row) if row else None
+
+    @staticmethod
+    def _event_dict(row):
+        return {k: row[k] for k in row.keys() if row[k] is not None}
+
+    # ---------------------------------------------------------
+    # SCORE CALCULATION & WRITING
+    # ---------------------------------------------------------
+    def _calculate_score_from_minutes(self, m):
+        score = max(0.0, 100.0 - (m / MAX_DEVIATION) * 100.0)
+        return round(score, 2)
+
+    def save_current_period_score(self):
+        """Finalizes the current period: score it, save it to history, clear extensions."""
+        try:
+            total_ext = self.get_extension_total()
+            score = self._calculate_score_from_minutes(total_ext)
+            self.save_score_to_history(score, total_ext)
+            Logger.info(f"[SQL DB] Period finalized. Score {score}% saved and extensions cleared.")
+            return score
+
+        except Exception as e:
+            Logger.error(f"[SQL DB ERROR] Failed to finalize period score: {e}")
+            raise Exception(f"Database error during score finalization: {e}")
+
+    def save_score_to_history(self, score, total_minutes):
+        """Saves the score to the history table under today's date and clears extensions."""
+        today_date_str = datetime.now().date().isoformat()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO history (date, score, minutes, created) VALUES (?, ?, ?, ?)",
+                (today_date_str, score, total_minutes, datetime.now().isoformat())
+            )
+        Logger.info(f"[SQL DB WRITE] Saved score: {score}% for {today_date_str}")
+        self._notify_write()
+
+        self.clear_extensions()
+        return score
+
+    # ---------------------------------------------------------
+    # READ SCORES
+    # ---------------------------------------------------------
+    def get_latest_saved_score(self):
+        """Retrieves the score from the most recent historical record for the main label."""
+        row = self.conn.execute("SELECT score FROM history ORDER BY date DESC LIMIT 1").fetchone()
+        if row is None:
+            return 100.00
+        return row["score"]
+
+    def get_recent_consistency_scores(self, days=7):
+        """Retrieves the last `days` history scores, oldest first (for the bar chart)."""
+        rows = self.conn.execute(
+            "SELECT date, score FROM history ORDER BY date DESC LIMIT ?", (days,)
+        ).fetchall()
+
+        results = []
+        for row in reversed(rows):
+            try:
+                d = datetime.fromisoformat(row["date"]).date()
+                results.append((d.strftime("%b %d"), row["score"]))
+            except Exception as e:
+                Logger.error(f"[SQL DB READ] Skipped invalid record {dict(row)} | {e}")
+
+        return results
+
+    def get_monthly_summaries(self):
+        """Monthly summaries (oldest first) migrated from TinyDB's roll-up."""
+        rows = self.conn.execute("SELECT * FROM monthly ORDER BY month").fetchall()
+        return [dict(row) for row in rows]
+
+
+def _read_tinydb_tables(user_folder):
+    """
+    Every table of a user's TinyDB data, read in place: the monthly partitions,
+    or a sleep_data.json that was never split into them. Opening a Database
+    instead would split and rename that file, even when nothing is migrated.
+    Returns {table name: [record, ...]}, oldest month first.
+    """
+    legacy_path = join(user_folder, LEGACY_FILE)
+    if exists(legacy_path):
+        paths = [legacy_path]
+    else:
+        months = sorted({m.group(1) for m in map(PARTITION_FILE.match, os.listdir(user_folder)) if m})
+        paths = [join(user_folder, key + ".json") for key in months]
+    tables = {}
+    for path in paths:
+        for name, docs in read_tables(path).items():
+            tables.setdefault(name, []).extend(docs.values())
+    return tables
+
+
+def migrate_from_tinydb(user_id="guest"):
+    """
+    One-shot copy of a user's TinyDB JSON data into their SQLite database.
+    Does nothing if the SQLite file already holds data, so it is safe to call
+    on every start-up. Returns (events_copied, history_copied).
+
+    The TinyDB files are only read. Days the retention roll-up already folded
+    into daily rows keep their score as history rows (their raw events are
+    gone); monthly summaries go to the monthly table.
+    """
+    target = SQLiteDatabase(user_id)
+    try:
+        has_data = target.conn.execute(
+            "SELECT EXISTS (SELECT 1 FROM events) OR EXISTS (SELECT 1 FROM history)"
+            " OR EXISTS (SELECT 1 FROM monthly)"
+        ).fetchone()[0]
+        if has_data:
+            Logger.info(f"[SQL DB] '{user_id}' already migrated, skipping")
+            return 0, 0
+
+        tables = _read_tinydb_tables(target.user_folder)
+        events = [r for r in tables.get("sleep", []) if "type" in r and "created" in r]
+        history = sorted(((r["date"], r.get("score", 0), r.get("minutes", 0), r.get("created", r["date"]),
+                           r.get("occurrence")) for r in tables.get("history", []) if "date" in r),
+                         key=lambda row: row[3])
+        daily = [(r["date"], r["score"], r.get("extension_minutes", 0), r["date"], None)
+                 for r in tables.get("daily", []) if r.get("score") is not None and "date" in r]
+        monthly = [r for r in tables.get("monthly", []) if "month" in r]
+
+        with target.conn:
+            target.conn.executemany(
+                "INSERT INTO events (type, name, time, minutes, created, occurrence) VALUES (?, ?, ?, ?, ?, ?)",
+                [(r["type"], r.get("name"), r.get("time"), r.get("minutes"), r["created"], r.get("occurrence"))
+                 for r in events]
+            )
+            # Oldest first, so the newest of duplicate dates is kept (as Database does)
+            target.conn.executemany(
+                "INSERT OR REPLACE INTO history (date, score, minutes, created, occurrence) VALUES (?, ?, ?, ?, ?)",
+                history
+            )
+            # The roll-up deletes the raw row it folds into a daily row, but a raw one wins if both exist
+            target.conn.executemany(
+                "INSERT OR IGNORE INTO history (date, score, minutes, created, occurrence) VALUES (?, ?, ?, ?, ?)",
+                daily
+            )
+            target.conn.executemany(
+                "INSERT OR REPLACE INTO monthly (month, days, schedules, nights_reached, extension_minutes,"
+                " scored_days, score_sum, avg_score) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(r["month"], r.get("days", 0), r.get("schedules", 0), r.get("nights_reached", 0),
+                  r.get("extension_minutes", 0), r.get("scored_days", 0), r.get("score_sum", 0.0),
+                  r.get("avg_score")) for r in monthly]
+            )
+
+        Logger.info(f"[SQL DB] Migrated '{user_id}': {len(events)} events, "
+                    f"{len(history) + len(daily)} history records, {len(monthly)} monthly summaries")
+        return len(events), len(history) + len(daily)
+    finally:
+        target.close()
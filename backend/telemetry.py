@@ -0,0 +1,120 @@
+import time
+from array import array
+
+# One 8-hour night of the ESP32's 1 Hz stream per topic (~460 KB per buffer)
+RING_CAPACITY = 8 * 60 * 60
+
+
+class RingBuffer:
+    """
+    Fixed-capacity (timestamp, value) buffer for one sensor stream.
+
+    Backed by two preallocated array('d') columns, so appends are O(1), memory
+    never grows, and the oldest samples are overwritten once the buffer is full.
+    Timestamps are wall-clock seconds and are expected to arrive in order.
+
+    Appends happen on the paho network thread and reads on the Kivy main thread;
+    a reader racing a writer can at worst see the newest sample twice or miss
+    it, which is fine for display.
+    """
+
+    def __init__(self, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        self._ts = array("d", bytes(8 * capacity))
+        self._values = array("d", bytes(8 * capacity))
+        self._head = 0    # next physical slot to write
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, ts, value):
+        i = self._head
+        self._ts[i] = ts
+        self._values[i] = value
+        self._head = (i + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+    def extend(self, ts, values):
+        """Appends many samples at once (sequences of equal length, oldest first)."""
+        n = len(ts)
+        i = self._head
+        if n > self.capacity:
+            # Only the newest `capacity` samples survive, where append() would leave them
+            i = (i + n - self.capacity) % self.capacity
+            ts, values, n = ts[-self.capacity:], values[-self.capacity:], self.capacity
+        ts, values = array("d", ts), array("d", values)
+        first = min(n, self.capacity - i)
+        self._ts[i:i + first] = ts[:first]
+        self._values[i:i + first] = values[:first]
+        if first < n:
+            # Wrapped around the end of the arrays
+            self._ts[:n - first] = ts[first:]
+            self._values[:n - first] = values[first:]
+        self._head = (i + n) % self.capacity
+        self._count = min(self._count + n, self.capacity)
+
+    def clear(self):
+        self._head = 0
+        self._count = 0
+
+    def latest(self):
+        """(ts, value) of the newest sample, or None if empty."""
+        if not self._count:
+            return None
+        i = (self._head - 1) % self.capacity
+        return self._ts[i], self._values[i]
+
+    # ---------------------------------------------------------
+    # WINDOWED VIEWS
+    # ---------------------------------------------------------
+    def _physical(self, logical):
+        """Maps 0 (oldest) .. count-1 (newest) to a slot in the arrays."""
+        return (self._head - self._count + logical) % self.capacity
+
+    def _first_at_or_after(self, ts):
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ts[self._physical(mid)] < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def window(self, seconds=None, now=None):
+        """
+        Zero-copy view of the samples from the last `seconds` (all if None).
+        Returns a list of up to two (ts_view, value_view) memoryview pairs in
+        chronological order; two pairs when the window wraps around the end.
+        """
+        if not self._count:
+            return []
+        start = 0
+        if seconds is not None:
+            now = time.time() if now is None else now
+            start = self._first_at_or_after(now - seconds)
+        if start >= self._count:
+            return []
+
+        first = self._physical(start)
+        last = self._physical(self._count - 1) + 1
+        ts, values = memoryview(self._ts), memoryview(self._values)
+        if first < last:
+            return [(ts[first:last], values[first:last])]
+        return [(ts[first:], values[first:]), (ts[:last], values[:last])]
+
+    def stats(self, seconds=None, now=None):
+        """min / max / mean / last / count over a window, or None if it is empty."""
+        segments = self.window(seconds, now)
+        count = sum(len(v) for _, v in segments)
+        if not count:
+            return None
+        return {
+            "min": min(min(v) for _, v in segments if len(v)),
+            "max": max(max(v) for _, v in segments if len(v)),
+            "mean": sum(sum(v) for _, v in segments) / count,
+            "last": segments[-1][1][-1],
+            "count": count,
+        }
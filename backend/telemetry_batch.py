@@ -0,0 +1,115 @@
+import json
+import time
+import struct
+
+# Batched telemetry from the ESP32 (see Arduino_Sleep_Monitoring.ino), on
+# "telemetry" or "<device>/telemetry". Binary, little-endian:
+#   header v1: magic "SB", version, sample count, base time (unix seconds, 0 = clock not set)
+#   header v2: v1 + offset of the publish moment from base time (ms), for latency tracking
+#   sample:    sensor id, offset from base time (ms), value (float32)
+# JSON fallback: {"v": 2, "t": base, "p": publish_ms, "s": [["lm35", offset_ms, 26.5], ...]}
+MAGIC = b"SB"
+VERSION = 2
+HEADERS = {
+    1: struct.Struct("<2sBBI"),
+    2: struct.Struct("<2sBBIH"),
+}
+SAMPLE = struct.Struct("<BHf")
+
+SENSOR_IDS = {
+    1: "lm35",
+    2: "mq135",
+    3: "PWM_Fan",
+    4: "light",
+    5: "DC_Fan_state",
+}
+SENSOR_NUMBERS = {name: number for number, name in SENSOR_IDS.items()}
+
+# Device timestamps further than this from our clock are not trusted
+MAX_CLOCK_SKEW = 60 * 60
+
+
+def encode_batch(base_time, samples, sent_offset=None, binary=True):
+    """
+    samples: [(sensor name, offset_ms, value)]. Mirrors what the firmware sends;
+    a v1 batch when sent_offset is None, else v2.
+    """
+    version = 1 if sent_offset is None else 2
+    if not binary:
+        data = {"v": version, "t": base_time, "s": [list(s) for s in samples]}
+        if sent_offset is not None:
+            data["p"] = sent_offset
+        return json.dumps(data).encode()
+    header = HEADERS[version]
+    fields = (MAGIC, version, len(samples), base_time) + ((sent_offset,) if sent_offset is not None else ())
+    out = bytearray(header.pack(*fields))
+    for sensor, offset, value in samples:
+        out += SAMPLE.pack(SENSOR_NUMBERS[sensor], offset, value)
+    return bytes(out)
+
+
+def _unpack(payload):
+    """(base_time, sent_offset or None, [(sensor, offset_ms, value)]), or None if not a batch."""
+    if payload[:2] == MAGIC:
+        if len(payload) < 3 or payload[2] not in HEADERS:
+            return None
+        header = HEADERS[payload[2]]
+        if len(payload) < header.size:
+            return None
+        magic, version, count, base, *sent = header.unpack_from(payload)
+        end = header.size + count * SAMPLE.size
+        if len(payload) < end:
+            return None
+        body = memoryview(payload)[header.size:end]
+        samples = [(SENSOR_IDS.get(sid), off, value) for sid, off, value in SAMPLE.iter_unpack(body)]
+        return base, (sent[0] if sent else None), samples
+
+    if payload[:1] == b"{":
+        try:
+            data = json.loads(payload)
+            if data.get("v") not in HEADERS:
+                return None
+            sent = data.get("p")
+            samples = [(s, int(off), float(v)) for s, off, v in data["s"]]
+            return int(data.get("t") or 0), (int(sent) if sent is not None else None), samples
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return None
+    return None
+
+
+class Batch:
+    """A decoded batch: samples sorted by time plus what is known about its timing."""
+
+    def __init__(self, samples, sent, synced, publish_delays):
+        self.samples = samples            # [(sensor, ts, value)]
+        self.sent = sent                  # wall time the device published it (None if unknown)
+        self.synced = synced              # True if timestamps come from the device clock
+        self.publish_delays = publish_delays  # seconds each sample waited on the device (v2)
+
+
+def decode_batch(payload, received=None):
+    """
+    Decodes a batch, or returns None if the payload is malformed. Unknown
+    sensor ids are skipped.
+
+    Timestamps are base + offset when the device clock is set and sane;
+    otherwise the publish moment (v2) or the newest sample (v1) is pinned to
+    the receive time and the rest keep their spacing.
+    """
+    unpacked = _unpack(payload)
+    if unpacked is None:
+        return None
+    base, sent_offset, samples = unpacked
+    received = time.time() if received is None else received
+    if not samples:
+        return Batch([], None, False, [])
+
+    anchor = sent_offset if sent_offset is not None else max(off for _, off, _ in samples)
+    synced = bool(base) and abs(base + anchor / 1000.0 - received) <= MAX_CLOCK_SKEW
+    origin = float(base) if synced else received - anchor / 1000.0
+
+    decoded = [(sensor, origin + off / 1000.0, value) for sensor, off, value in samples if sensor]
+    decoded.sort(key=lambda s: s[1])
+    delays = [(sent_offset - off) / 1000.0 for _, off, _ in samples] if sent_offset is not None else []
+    sent = origin + sent_offset / 1000.0 if synced and sent_offset is not None else None
+    return Batch(decoded, sent, synced, delays)
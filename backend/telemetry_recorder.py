@@ -0,0 +1,201 @@
+import os
+import mmap
+import time
+import bisect
+import struct
+import threading
+from datetime import datetime, timedelta
+from os.path import join, exists
+from kivy.logger import Logger
+
+# Every column file starts with this 32-byte header:
+# magic, version, item size, type code, capacity (items), count (committed items)
+HEADER = struct.Struct("<4sHHc7xQQ")
+MAGIC = b"SMCL"
+VERSION = 1
+CAPACITY_OFFSET = 16
+COUNT_OFFSET = 24
+
+INITIAL_CAPACITY = 4096          # items; files double when full
+FLUSH_EVERY = 30.0               # seconds between msync calls
+NIGHT_ROLLOVER_HOUR = 12         # samples before noon belong to the previous evening
+
+
+def night_of(ts):
+    """Night key for a wall-clock timestamp: 01:30 on Dec 4 -> '2025-12-03'."""
+    return (datetime.fromtimestamp(ts) - timedelta(hours=NIGHT_ROLLOVER_HOUR)).date().isoformat()
+
+
+class ColumnFile:
+    """
+    One fixed-width binary column in a memory-mapped file.
+
+    The item is written first and the header count is bumped afterwards, so a
+    reader (or a restart after the process was killed) only ever sees fully
+    written items. Writes land in the page cache straight away; flush() also
+    pushes them to storage for power-loss safety.
+    """
+
+    def __init__(self, path, typecode, writable=True):
+        self.path = path
+        self.typecode = typecode
+        self.itemsize = struct.calcsize(typecode)
+        self._fmt = "<" + typecode
+        self.writable = writable
+
+        if writable and not exists(path):
+            with open(path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION, self.itemsize, typecode.encode(), INITIAL_CAPACITY, 0))
+                f.truncate(HEADER.size + INITIAL_CAPACITY * self.itemsize)
+
+        self._file = open(path, "r+b" if writable else "rb")
+        self._map()
+
+    def _map(self):
+        access = mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=access)
+        magic, version, itemsize, typecode, capacity, count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION or itemsize != self.itemsize:
+            raise ValueError(f"{self.path} is not a v{VERSION} '{self.typecode}' column")
+        self.capacity = capacity
+        self.count = count
+
+    def append(self, value):
+        if self.count == self.capacity:
+            self._grow()
+        struct.pack_into(self._fmt, self._mm, HEADER.size + self.count * self.itemsize, value)
+        self.count += 1
+        struct.pack_into("<Q", self._mm, COUNT_OFFSET, self.count)
+
+    def _grow(self):
+        new_capacity = self.capacity * 2
+        self._mm.flush()
+        self._mm.close()
+        self._file.truncate(HEADER.size + new_capacity * self.itemsize)
+        self._map()
+        struct.pack_into("<Q", self._mm, CAPACITY_OFFSET, new_capacity)
+        self.capacity = new_capacity
+
+    def view(self, count=None):
+        """Zero-copy memoryview of the first `count` committed items."""
+        count = self.count if count is None else count
+        return memoryview(self._mm)[HEADER.size:HEADER.size + count * self.itemsize].cast(self.typecode)
+
+    def flush(self):
+        if self.writable:
+            self._mm.flush()
+
+    def close(self):
+        if not self._mm.closed:
+            self.flush()
+            self._mm.close()
+        self._file.close()
+
+
+class NightSeries:
+    """Read-only access to one sensor's recording for one night."""
+
+    def __init__(self, folder, sensor):
+        self.ts = ColumnFile(join(folder, f"{sensor}.ts.col"), "d", writable=False)
+        self.values = ColumnFile(join(folder, f"{sensor}.val.col"), "f", writable=False)
+
+    def __len__(self):
+        return min(self.ts.count, self.values.count)
+
+    def slice(self, start=None, end=None):
+        """
+        (ts_view, value_view) for start <= ts < end, as zero-copy memoryviews.
+        Only the pages that are actually touched get read from disk.
+        """
+        count = len(self)
+        ts = self.ts.view(count)
+        lo = 0 if start is None else bisect.bisect_left(ts, start)
+        hi = count if end is None else bisect.bisect_left(ts, end)
+        return ts[lo:hi], self.values.view(count)[lo:hi]
+
+    def close(self):
+        """Release any views returned by slice() before closing."""
+        self.ts.close()
+        self.values.close()
+
+
+class TelemetryRecorder:
+    """
+    Writes every sensor reading into per-night column files:
+        <user_folder>/telemetry/<night>/<sensor>.ts.col   (float64 wall-clock seconds)
+        <user_folder>/telemetry/<night>/<sensor>.val.col  (float32 reading)
+
+    record() is called from the paho network thread; switching users happens on
+    the main thread, so both go through one lock.
+    """
+
+    def __init__(self, user_folder, flush_every=FLUSH_EVERY):
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._columns = {}  # sensor -> (ts ColumnFile, value ColumnFile)
+        self._night = None
+        self._last_flush = time.monotonic()
+        self.user_folder = user_folder
+
+    def set_user_folder(self, user_folder):
+        with self._lock:
+            self._close_columns()
+            self.user_folder = user_folder
+
+    def record(self, sensor, ts, value):
+        with self._lock:
+            try:
+                night = night_of(ts)
+                if night != self._night:
+                    self._close_columns()
+                    self._night = night
+                columns = self._columns.get(sensor)
+                if columns is None:
+                    columns = self._columns[sensor] = self._open_columns(sensor)
+
+                # Value first: the ts count is what readers trust
+                columns[1].append(value)
+                columns[0].append(ts)
+
+                now = time.monotonic()
+                if now - self._last_flush >= self.flush_every:
+                    self._last_flush = now
+                    for ts_col, val_col in self._columns.values():
+                        val_col.flush()
+                        ts_col.flush()
+            except Exception as e:
+                Logger.error(f"[RECORDER] Failed to record {sensor}: {e}")
+
+    def close(self):
+        with self._lock:
+            self._close_columns()
+
+    def _open_columns(self, sensor):
+        folder = join(self.user_folder, "telemetry", self._night)
+        os.makedirs(folder, exist_ok=True)
+        val_col = ColumnFile(join(folder, f"{sensor}.val.col"), "f")
+        ts_col = ColumnFile(join(folder, f"{sensor}.ts.col"), "d")
+        # A kill between the two appends leaves one extra value: drop it
+        val_col.count = min(val_col.count, ts_col.count)
+        ts_col.count = val_col.count
+        return ts_col, val_col
+
+    def _close_columns(self):
+        for ts_col, val_col in self._columns.values():
+            val_col.close()
+            ts_col.close()
+        self._columns = {}
+        self._night = None
+
+    # ---------------------------------------------------------
+    # READING
+    # ---------------------------------------------------------
+    @staticmethod
+    def list_nights(user_folder):
+        folder = join(user_folder, "telemetry")
+        return sorted(os.listdir(folder)) if exists(folder) else []
+
+    @staticmethod
+    def open_night(user_folder, night, sensor):
+        """NightSeries for one sensor of one night (close it when done)."""
+        return NightSeries(join(user_folder, "telemetry", night), sensor)
@@ -0,0 +1,112 @@
+import re
+from paho.mqtt.client import topic_matches_sub
+
+# Plain numbers as the ESP32 sends them: dtostrf pads with spaces ("  26.50")
+_NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+RAW_NUMBER = re.compile(r"\s*(" + _NUMBER + r")\s*$")
+
+# Cap on remembered concrete topics, in case a '#' route sees unbounded names
+MAX_CACHED_TOPICS = 1024
+
+
+# ---------------------------------------------------------
+# DECODERS
+# Each takes the payload text and returns (value, text): the float reading and
+# the string to show, or None when the payload does not have this format.
+# None of them raise, so the common path never goes through an exception.
+# ---------------------------------------------------------
+def decode_number(payload):
+    """'  26.50' -> (26.5, '26.50')"""
+    m = RAW_NUMBER.match(payload)
+    if m is None:
+        return None
+    text = m.group(1)
+    return float(text), text
+
+
+def json_field_decoder(field):
+    """
+    Decoder for flat JSON objects such as {"temp":26.5,"humidity":60}: pulls the
+    number for `field` out with a regex instead of building the whole dict.
+    """
+    pattern = re.compile(r'^\s*\{.*?"' + re.escape(field) + r'"\s*:\s*(' + _NUMBER + r')\s*[,}]', re.S)
+
+    def decode(payload):
+        m = pattern.match(payload)
+        if m is None:
+            return None
+        text = m.group(1)
+        return float(text), text
+
+    return decode
+
+
+def choose_decoder(payload, field=None):
+    """Picks the decoder that understands `payload`, or None if none does."""
+    if field is not None and payload.lstrip().startswith("{"):
+        decoder = json_field_decoder(field)
+        return decoder if decoder(payload) is not None else None
+    if RAW_NUMBER.match(payload):
+        return decode_number
+    return None
+
+
+class TopicDispatcher:
+    """
+    Routes MQTT messages to handlers by topic filter ('+' and '#' allowed).
+
+    The route and decoder for a concrete topic are resolved on its first valid
+    payload and cached, so later messages cost one dict lookup plus the decode.
+    If a topic changes format (a cached decoder stops matching) it is detected
+    again on the next message. Runs on the paho network thread.
+
+    handler(topic, value, text) gets value=None and the raw payload as text
+    when no decoder understands the payload. Routes registered with raw=True
+    skip decoding and get handler(topic, payload_bytes) instead.
+    """
+
+    def __init__(self):
+        self._routes = []   # [(topic filter, field, raw, handler)] in registration order
+        self._cache = {}    # topic -> [handler, field, raw, decoder]; handler None if unrouted
+
+    def register(self, topic_filter, handler, field=None, raw=False):
+        """`field` names the JSON key holding the reading, for JSON payloads."""
+        self._routes.append((topic_filter, field, raw, handler))
+        self._cache.clear()
+
+    def topic_filters(self):
+        return [route[0] for route in self._routes]
+
+    def _resolve(self, topic):
+        for topic_filter, field, raw, handler in self._routes:
+            if topic_matches_sub(topic_filter, topic):
+                return handler, field, raw
+        return None, None, False
+
+    def dispatch(self, topic, payload):
+        """Decodes `payload` (bytes) and calls the matching handler. False if unrouted."""
+        entry = self._cache.get(topic)
+        if entry is None:
+            if len(self._cache) >= MAX_CACHED_TOPICS:
+                self._cache.clear()
+            entry = self._cache[topic] = [*self._resolve(topic), None]
+        handler, field, raw, decoder = entry
+        if handler is None:
+            return False
+        if raw:
+            handler(topic, payload)
+            return True
+
+        text = payload.decode("utf-8", errors="ignore")
+        decoded = decoder(text) if decoder is not None else None
+        if decoded is None:
+            # First payload, or the format changed: pick (and cache) again
+            decoder = entry[3] = choose_decoder(text, field)
+            if decoder is not None:
+                decoded = decoder(text)
+
+        if decoded is None:
+            handler(topic, None, text.strip())
+        else:
+            handler(topic, decoded[0], decoded[1])
+        return True
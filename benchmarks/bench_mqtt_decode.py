@@ -0,0 +1,61 @@
+"""
+Micro-benchmark for the MQTT decode path.
+
+Compares the old on_message parsing (json.loads inside try/except, falling back
+to the raw text) with TopicDispatcher's cached decoders, for the payload shapes
+the ESP32 sends. Run from the repo root:
+
+    python benchmarks/bench_mqtt_decode.py [iterations]
+"""
+import os
+import sys
+import json
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.topic_dispatch import TopicDispatcher
+
+PAYLOADS = {
+    "raw number": ("lm35", b"  26.50", "temp"),
+    "json object": ("lm35", b'{"temp":26.5,"humidity":60}', "temp"),
+    "raw integer": ("PWM_Fan", b"1", "speed"),
+}
+
+
+def old_decode(topic, payload, field):
+    """The pre-dispatcher path: decode, try JSON, fall back to text, then float()."""
+    text = payload.decode("utf-8", errors="ignore")
+    try:
+        data = json.loads(text)
+        shown = str(data.get(field, "--"))
+    except Exception:
+        shown = text
+    try:
+        value = float(shown)
+    except ValueError:
+        value = None
+    return value, shown
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    sink = []
+
+    def handler(topic, value, text):
+        sink.append(value)
+
+    print(f"{'payload':<14}{'old (us)':>10}{'new (us)':>10}{'speedup':>9}")
+    for name, (topic, payload, field) in PAYLOADS.items():
+        dispatcher = TopicDispatcher()
+        dispatcher.register(topic, handler, field=field)
+        dispatcher.dispatch(topic, payload)  # warm the per-topic cache
+
+        old = timeit.timeit(lambda: handler(topic, *old_decode(topic, payload, field)), number=iterations)
+        new = timeit.timeit(lambda: dispatcher.dispatch(topic, payload), number=iterations)
+        sink.clear()
+        print(f"{name:<14}{old / iterations * 1e6:>10.2f}{new / iterations * 1e6:>10.2f}{old / new:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Load test for DashboardClient against the in-process loopback broker.
+
+Replays synthetic (or recorded) lm35 / mq135 / PWM_Fan streams
+at a fixed total rate, drives a headless DashboardClient with the Kivy Clock
+ticking at ~60 fps on the main thread, and reports:
+
+  * handler latency: broker publish -> on_message returned (network thread)
+  * UI latency: broker publish -> the newest reading shown on its label
+  * dropped messages (client queue full), lost ones, and messages on topics the
+    client does not subscribe to (only a recorded --replay should have any)
+  * peak / mean callback queue depth
+  * CPU use of the whole process
+
+No broker or network is needed. Examples, from the repo root:
+
+    python benchmarks/load_test_mqtt.py --rate 1000 --duration 10
+    python benchmarks/load_test_mqtt.py --rate 5000 --record
+    python benchmarks/load_test_mqtt.py --replay night.jsonl   # {"topic": ..., "payload": ...} per line
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from types import SimpleNamespace
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_LOG_MODE", "PYTHON")
+
+from kivy.clock import Clock
+from backend.mqtt_client import DashboardClient, DASHBOARD_LABELS
+from backend.telemetry_recorder import TelemetryRecorder
+from loopback import LoopbackBroker, LoopbackClient
+
+FRAME = 1.0 / 60
+
+
+def synthetic_stream():
+    """
+    Endless (topic, payload) pairs shaped like the ESP32's output, limited to
+    the topics DashboardClient subscribes to (not DC_Fan_state).
+    """
+    temp, ppm = 26.5, 420.0
+    while True:
+        temp = min(max(temp + random.uniform(-0.05, 0.05), 15.0), 40.0)
+        ppm = min(max(ppm + random.uniform(-3, 3), 300.0), 900.0)
+        yield "lm35", "%6.2f" % temp
+        yield "mq135", "%6.0f" % ppm
+        yield "PWM_Fan", "1" if temp >= 28.0 or ppm >= 500.0 else "0"
+
+
+def replay_stream(path):
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records:
+        raise SystemExit(f"{path} has no records")
+    while True:
+        for rec in records:
+            yield rec["topic"], rec["payload"]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    k = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+class FakeScreen:
+    def __init__(self):
+        self.ids = {widget_id: SimpleNamespace(text="") for widget_id, _ in DASHBOARD_LABELS.values()}
+        self.ids["status_lbl"] = SimpleNamespace(text="")
+
+
+class FakeRoot:
+    current = "dashboard"
+
+    def __init__(self):
+        self.screen = FakeScreen()
+
+    def get_screen(self, name):
+        return self.screen
+
+
+class Probe:
+    """Wraps the client's callbacks to time messages end to end."""
+
+    def __init__(self, dashboard):
+        self.handled = 0
+        self.handler_latency = []
+        self.ui_latency = []
+        self._lock = threading.Lock()
+        self._newest = {}  # widget id -> publish time of the newest reading
+
+        on_message = dashboard.on_message
+        widget_for_topic = {topic: widget for topic, (widget, _) in DASHBOARD_LABELS.items()}
+
+        def timed_on_message(client, userdata, msg):
+            on_message(client, userdata, msg)
+            done = time.monotonic()
+            with self._lock:
+                self.handled += 1
+                self.handler_latency.append(done - msg.timestamp)
+                widget = widget_for_topic.get(msg.topic)
+                if widget is not None:
+                    self._newest[widget] = msg.timestamp
+
+        flush_ui = dashboard.flush_ui
+
+        def timed_flush_ui(*args):
+            with self._lock:
+                newest, self._newest = self._newest, {}
+            flush_ui(*args)
+            now = time.monotonic()
+            self.ui_latency.extend(now - ts for ts in newest.values())
+
+        dashboard.client.on_message = timed_on_message
+        dashboard.flush_ui = timed_flush_ui
+
+
+def run(args):
+    broker = LoopbackBroker()
+    client = LoopbackClient(broker, max_queue=args.queue)
+    app = SimpleNamespace(root=FakeRoot())
+    dashboard = DashboardClient(app, client=client)
+    probe = Probe(dashboard)
+
+    tmp = None
+    if args.record:
+        tmp = tempfile.TemporaryDirectory()
+        dashboard.recorder = TelemetryRecorder(tmp.name)
+
+    dashboard.connect()
+    while not client.is_connected() or client.queue_depth:
+        time.sleep(0.01)  # let on_connect subscribe before the stream starts
+    stream = replay_stream(args.replay) if args.replay else synthetic_stream()
+    total = int(args.rate * args.duration)
+    sent = [0]
+    depth_samples = []
+
+    def produce():
+        start = time.monotonic()
+        for i in range(total):
+            target = start + i / args.rate
+            delay = target - time.monotonic()
+            if delay > 0.001:
+                time.sleep(delay)
+            topic, payload = next(stream)
+            broker.publish(topic, payload)
+            sent[0] += 1
+
+    producer = threading.Thread(target=produce, name="producer", daemon=True)
+    cpu0, wall0 = time.process_time(), time.monotonic()
+    producer.start()
+
+    # Main thread plays the Kivy frame loop
+    while producer.is_alive() or client.queue_depth:
+        Clock.tick()
+        depth_samples.append(client.queue_depth)
+        time.sleep(FRAME)
+    Clock.tick()
+
+    wall = time.monotonic() - wall0
+    cpu = time.process_time() - cpu0
+    dashboard.disconnect()
+    if dashboard.recorder is not None:
+        dashboard.recorder.close()
+        tmp.cleanup()
+
+    handler = sorted(probe.handler_latency)
+    ui = sorted(probe.ui_latency)
+    print(f"rate            {args.rate} msg/s for {args.duration}s ({sent[0]} sent)")
+    print(f"handled         {probe.handled}  dropped {broker.dropped}  "
+          f"not subscribed {broker.unrouted}  "
+          f"lost {sent[0] - probe.handled - broker.dropped - broker.unrouted}")
+    print(f"queue depth     peak {client.max_queue_depth}  "
+          f"mean {sum(depth_samples) / max(len(depth_samples), 1):.1f} (per frame)")
+    for name, values in (("handler latency", handler), ("ui latency", ui)):
+        print(f"{name:<16}p50 {percentile(values, 50) * 1000:.2f} ms  "
+              f"p95 {percentile(values, 95) * 1000:.2f} ms  "
+              f"p99 {percentile(values, 99) * 1000:.2f} ms  "
+              f"max {(values[-1] if values else float('nan')) * 1000:.2f} ms")
+    print(f"cpu             {cpu / wall * 100:.0f}% of one core over {wall:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=100, help="total messages per second (1 - 5000)")
+    parser.add_argument("--duration", type=float, default=5, help="seconds to publish for")
+    parser.add_argument("--queue", type=int, default=10000, help="client inbound queue size before drops")
+    parser.add_argument("--record", action="store_true", help="also write telemetry column files (temp dir)")
+    parser.add_argument("--replay", help="JSON-lines file of recorded {topic, payload} messages")
+    args = parser.parse_args()
+    if not 1 <= args.rate <= 5000:
+        parser.error("--rate must be between 1 and 5000")
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
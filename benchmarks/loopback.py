@@ -0,0 +1,171 @@
+"""
+In-process stand-in for the MQTT broker, for benchmarks and load tests.
+
+LoopbackClient implements the slice of the paho Client API that DashboardClient
+uses, so it can be passed in as DashboardClient(app, client=...). Each client
+has its own network thread that delivers messages and PUBACKs from a bounded
+inbound queue, the way paho's loop thread does. No sockets are involved.
+"""
+import time
+import queue
+import threading
+from types import SimpleNamespace
+
+import paho.mqtt.client as mqtt
+
+# Messages a client may have waiting before the broker starts dropping
+INBOUND_QUEUE = 10000
+
+
+class LoopbackBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = []  # [(topic filter, client)]
+        self.published = 0
+        self.unrouted = 0   # no subscriber for the topic
+        self.dropped = 0    # a subscriber's inbound queue was full
+
+    def subscribe(self, client, topic_filter):
+        with self._lock:
+            self._subscriptions.append((topic_filter, client))
+
+    def unsubscribe_all(self, client):
+        with self._lock:
+            self._subscriptions = [s for s in self._subscriptions if s[1] is not client]
+
+    def publish(self, topic, payload):
+        """Fans a message out to every matching subscriber. Returns the number delivered."""
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self._lock:
+            targets = {c for f, c in self._subscriptions if mqtt.topic_matches_sub(f, topic)}
+            self.published += 1
+            if not targets:
+                self.unrouted += 1
+        delivered = 0
+        for client in targets:
+            # paho stamps received messages with its monotonic clock
+            msg = SimpleNamespace(topic=topic, payload=payload, qos=0, retain=False,
+                                  timestamp=time.monotonic())
+            if client._deliver(("message", msg)):
+                delivered += 1
+            else:
+                with self._lock:
+                    self.dropped += 1
+        return delivered
+
+
+class LoopbackClient:
+    """paho.mqtt.client.Client look-alike bound to a LoopbackBroker."""
+
+    def __init__(self, broker, max_queue=INBOUND_QUEUE):
+        self.broker = broker
+        self._inbound = queue.Queue(maxsize=max_queue)
+        self._connected = False
+        self._thread = None
+        self._next_mid = 0
+        self._mid_lock = threading.Lock()
+        self.max_queue_depth = 0
+
+        self.on_connect = None
+        self.on_message = None
+        self.on_disconnect = None
+        self.on_connect_fail = None
+        self.on_publish = None
+
+    # Setup calls that have no meaning without a network
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def tls_set(self, *args, **kwargs):
+        pass
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        pass
+
+    # ---------------------------------------------------------
+    # CONNECTION
+    # ---------------------------------------------------------
+    def connect_async(self, host, port=1883, keepalive=60):
+        pass
+
+    def loop_start(self):
+        self._thread = threading.Thread(target=self._run, name="loopback-net", daemon=True)
+        self._thread.start()
+        self._deliver(("connect", None), block=True)
+
+    def loop_stop(self):
+        if self._thread is not None:
+            self._deliver(("stop", None), block=True)
+            self._thread.join()
+            self._thread = None
+
+    def disconnect(self):
+        self.drop_connection(rc=0)
+
+    def drop_connection(self, rc=1):
+        """Simulates losing the connection; call reconnect() to bring it back."""
+        if self._connected:
+            self._connected = False
+            self.broker.unsubscribe_all(self)
+            self._deliver(("disconnect", rc), block=True)
+
+    def reconnect(self):
+        self._deliver(("connect", None), block=True)
+
+    def is_connected(self):
+        return self._connected
+
+    # ---------------------------------------------------------
+    # PUB/SUB
+    # ---------------------------------------------------------
+    def subscribe(self, topic_filter, qos=0):
+        self.broker.subscribe(self, topic_filter)
+        return mqtt.MQTT_ERR_SUCCESS, 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        with self._mid_lock:
+            self._next_mid += 1
+            mid = self._next_mid
+        if not self._connected:
+            return SimpleNamespace(rc=mqtt.MQTT_ERR_NO_CONN, mid=mid)
+        self.broker.publish(topic, payload)
+        if qos > 0:
+            self._deliver(("puback", mid), block=True)
+        return SimpleNamespace(rc=mqtt.MQTT_ERR_SUCCESS, mid=mid)
+
+    # ---------------------------------------------------------
+    # NETWORK THREAD
+    # ---------------------------------------------------------
+    @property
+    def queue_depth(self):
+        return self._inbound.qsize()
+
+    def _deliver(self, item, block=False):
+        try:
+            self._inbound.put(item, block=block)
+        except queue.Full:
+            return False
+        depth = self._inbound.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        return True
+
+    def _run(self):
+        while True:
+            kind, data = self._inbound.get()
+            if kind == "message":
+                if self.on_message:
+                    self.on_message(self, None, data)
+            elif kind == "puback":
+                if self.on_publish:
+                    self.on_publish(self, None, data)
+            elif kind == "connect":
+                self._connected = True
+                if self.on_connect:
+                    self.on_connect(self, None, {}, 0)
+            elif kind == "disconnect":
+                if self.on_disconnect:
+                    self.on_disconnect(self, None, data)
+            elif kind == "stop":
+                return
@@ -0,0 +1,194 @@
+"""
+Replays recorded (or synthetic) nights through FanController.
+
+For every night it reports how many fan commands the controller would have
+sent, next to a plain per-sample threshold switch like the firmware's, and
+how quickly each speed-up followed the raw readings crossing a threshold:
+
+  * "anticipated": the trend slope triggered the speed-up before any raw
+    sample crossed the threshold
+  * otherwise the delay is measured from the first crossing sample
+
+The commands drive a model of the firmware, which follows a command for
+PWM_FAN_CMD_TIMEOUT and then falls back to its own thresholds, and which
+reports its speed back once a second. "resend" counts keepalives and
+re-sends after a mismatching report; "lapsed" is how long the device ran
+at another speed than the controller's. --no-resend shows the controller
+without either.
+
+Recorded nights come from TelemetryRecorder's column files. From the repo root:
+
+    python benchmarks/replay_fan_control.py --user-folder users/guest
+    python benchmarks/replay_fan_control.py --user-folder users/guest --night 2025-12-03
+    python benchmarks/replay_fan_control.py --synthetic 3
+    python benchmarks/replay_fan_control.py --synthetic 3 --no-resend
+"""
+import os
+import sys
+import math
+import time
+import heapq
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_LOG_MODE", "PYTHON")
+
+from kivy.logger import Logger
+from backend.fan_control import FanController, THRESHOLDS, TEMP_SENSOR, AIR_SENSOR
+from backend.telemetry_recorder import TelemetryRecorder
+
+
+# Mirrors Arduino_Sleep_Monitoring.ino
+PWM_FAN_CMD_TIMEOUT = 30 * 60
+PWM_FAN_MAX_SPEED = 2
+
+
+def raw_step(sensor, value):
+    return sum(1 for limit in THRESHOLDS[sensor] if value >= limit)
+
+
+class SimulatedDevice:
+    """The firmware's fan logic: the app's command while fresh, else full speed or off."""
+
+    def __init__(self):
+        self.command = None
+        self.command_ts = None
+        self.latest = {}
+
+    def receive(self, ts, speed):
+        self.command, self.command_ts = speed, ts
+
+    def speed(self, ts):
+        if self.command is not None and ts - self.command_ts < PWM_FAN_CMD_TIMEOUT:
+            return self.command
+        local = any(raw_step(sensor, value) for sensor, value in self.latest.items())
+        return PWM_FAN_MAX_SPEED if local else 0
+
+
+def recorded_night(user_folder, night):
+    """Merged (ts, sensor, value) samples of one recorded night."""
+    streams = []
+    for sensor in (TEMP_SENSOR, AIR_SENSOR):
+        try:
+            series = TelemetryRecorder.open_night(user_folder, night, sensor)
+        except (OSError, ValueError):
+            continue
+        ts, values = series.slice()
+        streams.append([(t, sensor, v) for t, v in zip(ts.tolist(), values.tolist())])
+        del ts, values
+        series.close()
+    return list(heapq.merge(*streams))
+
+
+def synthetic_night(seed):
+    """8 h at 1 Hz: slow warm-up past 28 C, noise, and a few air-quality spikes."""
+    rng = random.Random(seed)
+    start = 1_700_000_000.0 + seed * 86400
+    samples = []
+    spikes = sorted(rng.uniform(0, 8 * 3600) for _ in range(4))
+    for i in range(8 * 3600):
+        ts = start + i
+        temp = 26.5 + 2.5 * math.sin(i / (8 * 3600) * math.pi) + rng.gauss(0, 0.2)
+        ppm = 420.0 + rng.gauss(0, 8)
+        for s in spikes:
+            if s <= i < s + 600:
+                ppm += 350.0 * math.sin((i - s) / 600 * math.pi)
+        samples.append((ts, TEMP_SENSOR, temp))
+        samples.append((ts, AIR_SENSOR, ppm))
+    return samples
+
+
+def replay(samples, resend=True):
+    sent = []
+    device = SimulatedDevice()
+    now = [None]
+
+    def send(speed):
+        sent.append(speed)
+        device.receive(now[0], speed)
+
+    options = {} if resend else {"keepalive_interval": None, "resend_after": None}
+    controller = FanController(send, **options)
+    latest = {}
+    lapsed, reported_at = 0.0, None
+    naive_speed, naive_commands = None, 0
+    crossed_at = None      # first sample whose raw readings asked for more than the current speed
+    delays, anticipated = [], 0
+
+    t0 = time.perf_counter()
+    for ts, sensor, value in samples:
+        before = len(sent)
+        now[0] = ts
+        controller.update(sensor, ts, value)
+        device.latest[sensor] = value
+
+        # The device reports its speed once a second
+        if reported_at is None or ts - reported_at >= 1.0:
+            actual = device.speed(ts)
+            if reported_at is not None and controller.last_command_ts is not None and actual != controller.speed:
+                lapsed += ts - reported_at
+            reported_at = ts
+            controller.observe_device(actual, ts)
+
+        latest[sensor] = value
+        raw = max(raw_step(s, v) for s, v in latest.items())
+        if raw != naive_speed:
+            naive_speed, naive_commands = raw, naive_commands + 1
+
+        current = sent[-1] if sent else 0
+        if len(sent) > before and sent[-1] > (sent[before - 1] if before else 0):
+            if crossed_at is None:
+                anticipated += 1
+            else:
+                delays.append(ts - crossed_at)
+            crossed_at = None
+        elif raw > current:
+            crossed_at = crossed_at if crossed_at is not None else ts
+        else:
+            crossed_at = None
+    elapsed = time.perf_counter() - t0
+
+    return {
+        "samples": len(samples),
+        "commands": controller.commands,
+        "resends": controller.resends,
+        "lapsed": lapsed,
+        "naive_commands": naive_commands,
+        "anticipated": anticipated,
+        "delays": sorted(delays),
+        "us_per_sample": elapsed / max(len(samples), 1) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-folder", help="user data folder holding telemetry/<night>/")
+    parser.add_argument("--night", action="append", help="night to replay (default: all)")
+    parser.add_argument("--synthetic", type=int, default=0, help="replay N synthetic nights instead")
+    parser.add_argument("--no-resend", action="store_true", help="disable keepalives and mismatch re-sends")
+    args = parser.parse_args()
+    Logger.setLevel("WARNING")
+
+    if args.synthetic:
+        nights = [(f"synthetic-{i}", synthetic_night(i)) for i in range(args.synthetic)]
+    elif args.user_folder:
+        names = args.night or TelemetryRecorder.list_nights(args.user_folder)
+        nights = [(n, recorded_night(args.user_folder, n)) for n in names]
+    else:
+        parser.error("give --user-folder or --synthetic N")
+
+    print(f"{'night':<14}{'samples':>9}{'cmds':>6}{'naive':>7}{'resend':>8}{'lapsed':>8}"
+          f"{'early':>7}{'delay p50':>11}{'max':>7}{'us/smp':>8}")
+    for name, samples in nights:
+        r = replay(samples, resend=not args.no_resend)
+        delays = r["delays"]
+        p50 = f"{delays[len(delays) // 2]:.0f}s" if delays else "-"
+        worst = f"{delays[-1]:.0f}s" if delays else "-"
+        print(f"{name:<14}{r['samples']:>9}{r['commands']:>6}{r['naive_commands']:>7}"
+              f"{r['resends']:>8}{r['lapsed'] / 60:>7.0f}m{r['anticipated']:>7}{p50:>11}{worst:>7}{r['us_per_sample']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Kivy parses sys.argv and writes its own log setup on import unless told not to
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_LOG_MODE", "PYTHON")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,79 @@
+import json
+import os
+
+import pytest
+
+from backend.database import Database
+
+
+def write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def write_lines(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("".join(json.dumps(r) + "\n" for r in records))
+
+
+def schedule(created):
+    return {"type": "schedule", "time": "22:00", "created": created}
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    # Without a running App the database lives under the working directory
+    monkeypatch.chdir(tmp_path)
+    folder = tmp_path / "users" / "legacy"
+    folder.mkdir(parents=True)
+    return folder
+
+
+def write_legacy(folder):
+    """A pre-partitioning sleep_data.json whose newest record is still in its log."""
+    write_json(folder / "sleep_data.json", {"sleep": {"1": schedule("2025-01-10T21:00:00")}})
+    write_lines(folder / "sleep_data.json.log",
+                [{"t": "sleep", "id": "2", "doc": schedule("2025-02-10T21:00:00")}])
+
+
+def scheduled_days(db):
+    return [e["created"][:10] for e in db.get_events("schedule")]
+
+
+def test_interrupted_split_is_redone_with_the_log_tail(folder):
+    # Killed after writing a monthly file, before anything was renamed
+    write_legacy(folder)
+    write_json(folder / "2025-01.json", {"sleep": {"1": schedule("2025-01-10T21:00:00")}})
+
+    db = Database("legacy", raw_days=None)
+    try:
+        assert scheduled_days(db) == ["2025-01-10", "2025-02-10"]
+    finally:
+        db.close()
+    assert sorted(name for name in os.listdir(folder) if name.startswith("sleep_data")) == [
+        "sleep_data.json.log.migrated", "sleep_data.json.migrated"]
+
+
+def test_split_finished_after_moving_the_json_is_not_redone(folder):
+    write_legacy(folder)
+    Database("legacy", raw_days=None).close()
+    # Killed after the .json was moved, before its log was
+    os.replace(folder / "sleep_data.json.log.migrated", folder / "sleep_data.json.log")
+
+    db = Database("legacy", raw_days=None)
+    try:
+        assert scheduled_days(db) == ["2025-01-10", "2025-02-10"]
+    finally:
+        db.close()
+    assert not (folder / "sleep_data.json.log").exists()
+    assert (folder / "sleep_data.json.log.migrated").exists()
+
+
+def test_score_for_an_earlier_month_goes_into_its_partition(folder):
+    db = Database("legacy", raw_days=None)
+    try:
+        db.save_score_to_history(50.0, 90, day="2025-01-31")
+        assert [r["date"] for r in db.partitions["2025-01"].table("history").all()] == ["2025-01-31"]
+        assert db.history_table.all() == []
+    finally:
+        db.close()
@@ -0,0 +1,33 @@
+from backend.fan_control import FanController, KEEPALIVE_INTERVAL, RESEND_AFTER, TEMP_SENSOR
+
+
+def hot_controller():
+    sent = []
+    controller = FanController(sent.append)
+    controller.observe_device(0, 0.0)
+    for ts in range(10):
+        controller.update(TEMP_SENSOR, float(ts), 29.0)
+    assert sent == [1]
+    return controller, sent
+
+
+def test_unchanged_speed_is_sent_again_as_a_keepalive():
+    controller, sent = hot_controller()
+    t = controller.last_sent_ts + KEEPALIVE_INTERVAL - 1
+    controller.update(TEMP_SENSOR, t, 29.0)
+    assert sent == [1]
+    controller.update(TEMP_SENSOR, t + 1, 29.0)
+    assert sent == [1, 1]
+    assert controller.commands == 1 and controller.resends == 1
+
+
+def test_device_running_another_speed_gets_the_command_again():
+    controller, sent = hot_controller()
+    t0 = controller.last_sent_ts
+    # A report racing the command is not a mismatch yet
+    assert controller.observe_device(0, t0 + RESEND_AFTER / 2) is None
+    # The firmware fell back to its own thresholds
+    assert controller.observe_device(2, t0 + RESEND_AFTER) == 1
+    assert controller.observe_device(2, t0 + RESEND_AFTER + 1) is None
+    assert controller.observe_device(1, t0 + 3 * RESEND_AFTER) is None
+    assert sent == [1, 1]
@@ -0,0 +1,89 @@
+import json
+import os
+
+from backend.log_storage import AppendLogStorage
+
+
+def write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def write_lines(path, records, tail=""):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("".join(json.dumps(r) + "\n" for r in records) + tail)
+
+
+def doc(doc_id, name, **fields):
+    return {"t": "sleep", "id": doc_id, "doc": {"name": name, **fields}}
+
+
+def reopen(path):
+    storage = AppendLogStorage(path)
+    try:
+        return storage.read()
+    finally:
+        storage.close()
+
+
+def test_replays_log_on_top_of_snapshot(tmp_path):
+    path = str(tmp_path / "2025-12.json")
+    write_json(path, {"sleep": {"1": {"name": "a"}, "2": {"name": "b"}}})
+    write_lines(path + ".log", [
+        doc("2", "b2"),                            # update
+        doc("3", "c"),                             # insert
+        {"t": "sleep", "id": "1", "del": 1},       # delete
+        {"t": "history", "id": "1", "doc": {"score": 90}},
+    ])
+
+    assert reopen(path) == {
+        "sleep": {"2": {"name": "b2"}, "3": {"name": "c"}},
+        "history": {"1": {"score": 90}},
+    }
+
+
+def test_torn_last_line_is_dropped_and_cut_off(tmp_path):
+    path = str(tmp_path / "2025-12.json")
+    write_json(path, {})
+    write_lines(path + ".log", [doc("1", "a"), doc("2", "b")], tail='{"t": "sleep", "id": "3", "do')
+    good_size = os.path.getsize(path + ".log") - len('{"t": "sleep", "id": "3", "do')
+
+    assert reopen(path) == {"sleep": {"1": {"name": "a"}, "2": {"name": "b"}}}
+    assert os.path.getsize(path + ".log") == good_size
+
+    # The next append starts on a clean line and survives another reopen
+    storage = AppendLogStorage(path)
+    data = storage.read()
+    data["sleep"]["4"] = {"name": "d"}
+    storage.write(data)
+    storage.close()
+    assert reopen(path)["sleep"] == {"1": {"name": "a"}, "2": {"name": "b"}, "4": {"name": "d"}}
+
+
+def test_interrupted_compaction_is_finished_on_open(tmp_path):
+    # Killed after the tail was rotated to .log.old but before the new
+    # snapshot replaced the old one: snapshot + .log.old + .log are all live
+    path = str(tmp_path / "2025-12.json")
+    write_json(path, {"sleep": {"1": {"name": "a"}}})
+    write_lines(path + ".log.old", [doc("2", "b"), doc("1", "a2")])
+    write_lines(path + ".log", [doc("3", "c")])
+
+    expected = {"sleep": {"1": {"name": "a2"}, "2": {"name": "b"}, "3": {"name": "c"}}}
+    assert reopen(path) == expected
+
+    # The compaction run at open folded everything into the snapshot
+    assert not os.path.exists(path + ".log.old")
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f) == expected
+    assert reopen(path) == expected
+
+
+def test_stale_tmp_snapshot_is_ignored(tmp_path):
+    # Killed while writing the new snapshot: the .tmp is never read
+    path = str(tmp_path / "2025-12.json")
+    write_json(path, {"sleep": {"1": {"name": "a"}}})
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write('{"sleep": {"1": {"na')
+    write_lines(path + ".log.old", [doc("2", "b")])
+
+    assert reopen(path) == {"sleep": {"1": {"name": "a"}, "2": {"name": "b"}}}
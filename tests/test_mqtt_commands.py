@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import pytest
+from kivy.clock import Clock
+from backend.mqtt_client import DashboardClient, TOPIC_FAN, TOPIC_FAN_CMD
+from backend.fan_control import FanController
+from loopback import LoopbackBroker, LoopbackClient
+from load_test_mqtt import FakeRoot
+
+
+class RecordingRecorder:
+    def __init__(self):
+        self.samples = []
+
+    def record(self, sensor, ts, value):
+        self.samples.append((sensor, value))
+
+    def close(self):
+        pass
+
+
+def drain(client, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while client.queue_depth and time.monotonic() < deadline:
+        time.sleep(0.005)
+    time.sleep(0.02)   # the message being handled when the queue emptied
+    Clock.tick()
+
+
+@pytest.fixture
+def dashboard():
+    broker = LoopbackBroker()
+    client = LoopbackClient(broker)
+    published = []
+    publish = broker.publish
+
+    def spy(topic, payload):
+        published.append((topic, payload))
+        return publish(topic, payload)
+
+    broker.publish = spy
+    d = DashboardClient(SimpleNamespace(root=FakeRoot()), client=client)
+    d.recorder = RecordingRecorder()
+    d.connect()
+    while not client.is_connected():
+        time.sleep(0.005)
+    drain(client)
+    yield d, broker, client, published
+    d.disconnect()
+
+
+def test_fan_commands_are_never_ingested_as_readings(dashboard):
+    d, broker, client, published = dashboard
+    d.enable_fan_control(FanController)
+
+    # Replay a warming room: the controller commands the fan up while the
+    # ESP32 keeps reporting its own fan state ("0") on PWM_Fan
+    for i in range(40):
+        broker.publish("lm35", "%.2f" % (30.0 + i * 0.1))
+        broker.publish(TOPIC_FAN, "0")
+    drain(client)
+
+    values = [v for _, part in d.device.buffers[TOPIC_FAN].window() for v in part.tolist()]
+    assert values == [0.0] * 40
+    assert {v for s, v in d.recorder.samples if s == TOPIC_FAN} == {0.0}
+
+    commands = [p for t, p in published if t == TOPIC_FAN_CMD]
+    assert commands == ['{"speed": 2}']
+
+
+def test_own_commands_do_not_mark_devices_online(dashboard):
+    d, broker, client, published = dashboard
+    broker.publish("bedroom/lm35", "24.0")
+    drain(client)
+    bedroom = d.devices.get("bedroom")
+    assert bedroom.online
+    d.devices.expire(now=time.monotonic() + 3600)
+    assert not bedroom.online
+
+    # Bedtime light-OFF goes to every known device and comes back on +/light;
+    # an older app build may still send {"speed": n} on PWM_Fan
+    d.publish_turn_off()
+    broker.publish("bedroom/PWM_Fan", '{"speed": 2}')
+    drain(client)
+
+    assert ("bedroom/light", "OFF") in published
+    assert not bedroom.online
+    assert "PWM_Fan" not in bedroom.buffers
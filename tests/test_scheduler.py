@@ -0,0 +1,207 @@
+import json
+import time
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from kivy.clock import Clock
+
+import backend.scheduler as scheduler_module
+from backend.scheduler import TimerScheduler, SleepScheduler
+
+
+class FakeClock:
+    """Stands in for the time module in backend.scheduler; starts at the real time."""
+
+    def __init__(self):
+        self.wall = time.time()
+        self.mono = time.monotonic()
+
+    def time(self):
+        return self.wall
+
+    def monotonic(self):
+        return self.mono
+
+
+class FakeMQTT:
+    def __init__(self):
+        self.turned_off = 0
+
+    def publish_turn_off(self):
+        self.turned_off += 1
+
+
+class FakeDB:
+    def save_extension(self, minutes):
+        pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler_module, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def timers(clock):
+    timers = TimerScheduler()
+    yield timers
+    timers.stop()
+
+
+def advance(timers, clock, seconds, wall_only=False):
+    """
+    Moves the fake clock, then waits until the timer thread has run everything
+    due by now: a probe due now fires after every earlier deadline.
+    """
+    clock.wall += seconds
+    if not wall_only:
+        clock.mono += seconds
+    done = threading.Event()
+    timers.call_later(0, done.set, name="probe")
+    # A real clock would wake the thread for the earlier head; the fake one must
+    with timers._cond:
+        timers._cond.notify()
+    assert done.wait(2.0), "timer thread did not catch up"
+
+
+def test_extension_without_countdown_runs_the_finished_callback(timers, clock):
+    mqtt = FakeMQTT()
+    sched = SleepScheduler(mqtt, FakeDB(), timers=timers)
+    finished = []
+
+    sched.extend_time(1, on_finished=lambda: finished.append(True))
+    advance(timers, clock, 61)
+    Clock.tick()
+
+    assert mqtt.turned_off == 1
+    assert finished == [True]
+
+
+def test_extension_keeps_the_running_countdowns_callback(timers, clock):
+    mqtt = FakeMQTT()
+    sched = SleepScheduler(mqtt, FakeDB(), timers=timers)
+    finished = []
+    sched.start_countdown(datetime.fromtimestamp(clock.wall) + timedelta(minutes=1),
+                          on_finished=lambda: finished.append(True))
+
+    sched.extend_time(1)
+    advance(timers, clock, 61)
+    assert mqtt.turned_off == 0
+    advance(timers, clock, 60)
+    Clock.tick()
+
+    assert mqtt.turned_off == 1
+    assert finished == [True]
+
+
+def test_timers_fire_in_deadline_order(timers, clock):
+    fired = []
+    for delay in (30, 10, 20):
+        timers.call_later(delay, lambda d=delay: fired.append(d))
+
+    advance(timers, clock, 15)
+    assert fired == [10]
+    advance(timers, clock, 15)
+    assert fired == [10, 20, 30]
+    assert len(timers) == 0
+
+
+def test_cancelled_timers_never_fire_and_are_compacted(timers, clock):
+    fired = []
+    handles = [timers.call_later(10 + i, lambda i=i: fired.append(i)) for i in range(40)]
+    for handle in handles[:30]:
+        handle.cancel()
+        assert not handle.active
+
+    # 30 dead entries against 10 live ones: the heap was purged on the way
+    assert len(timers) == 10
+    assert len(timers._heap) < 40
+    assert timers.cancel(handles[0]) is False
+
+    advance(timers, clock, 60)
+    assert fired == list(range(30, 40))
+
+
+def test_wall_timer_is_repinned_after_a_clock_jump(timers, clock):
+    fired = []
+    bedtime = clock.wall + 3600
+    timers.call_at(bedtime, lambda: fired.append("wall"))
+    timers.call_later(3600, lambda: fired.append("monotonic"))
+
+    # NTP sets the clock an hour ahead: "23:00" has just passed
+    advance(timers, clock, 3601, wall_only=True)
+    assert fired == ["wall"]
+    assert timers.wall_jumps == 1
+    advance(timers, clock, 3600)
+    assert fired == ["wall", "monotonic"]
+
+
+def test_wall_timer_fires_after_a_suspend(timers, clock):
+    # While the phone sleeps the monotonic clock stops but the wall clock does not
+    fired = []
+    timers.call_at(clock.wall + 600, lambda: fired.append("wall"))
+    timers.call_later(600, lambda: fired.append("monotonic"))
+
+    advance(timers, clock, 900, wall_only=True)
+    assert fired == ["wall"]
+
+
+def restore(timers, tmp_path, state):
+    path = str(tmp_path / "scheduler.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    mqtt = FakeMQTT()
+    sched = SleepScheduler(mqtt, FakeDB(), timers=timers, state_path=path)
+    return sched, mqtt, sched.restore()
+
+
+def test_restore_rearms_a_pending_countdown(timers, clock, tmp_path):
+    target = datetime.fromtimestamp(clock.wall).replace(microsecond=0) + timedelta(hours=1)
+    sched, mqtt, running = restore(timers, tmp_path, {
+        "target": target.isoformat(), "started": None, "extensions": [15], "fired_at": None})
+
+    assert running and sched.running
+    assert sched.target == target
+    assert sched.extensions == [15]
+    advance(timers, clock, 3599)
+    assert mqtt.turned_off == 0
+    advance(timers, clock, 2)
+    assert mqtt.turned_off == 1
+
+
+def test_restore_fires_a_target_missed_while_dead(timers, clock, tmp_path):
+    target = datetime.now() - timedelta(minutes=5)
+    sched, mqtt, running = restore(timers, tmp_path, {"target": target.isoformat()})
+
+    assert running
+    advance(timers, clock, 0)
+    assert mqtt.turned_off == 1
+    assert sched.fired_at == target
+
+
+def test_restore_drops_a_stale_countdown(timers, clock, tmp_path):
+    target = datetime.now() - timedelta(seconds=scheduler_module.COMMAND_TTL + 60)
+    fired_at = target - timedelta(days=1)
+    sched, mqtt, running = restore(timers, tmp_path, {
+        "target": target.isoformat(), "fired_at": fired_at.isoformat()})
+
+    assert not running and not sched.running
+    assert sched.fired_at == fired_at
+    advance(timers, clock, 60)
+    assert mqtt.turned_off == 0
+    # The stale target was checkpointed away
+    assert scheduler_module.get_writer().flush(2.0)
+    with open(sched.state_path, encoding="utf-8") as f:
+        assert json.load(f)["target"] is None
+
+
+def test_restore_ignores_an_unreadable_state_file(timers, tmp_path):
+    path = tmp_path / "scheduler.json"
+    path.write_text('{"target": "23:0', encoding="utf-8")
+    sched = SleepScheduler(FakeMQTT(), FakeDB(), timers=timers, state_path=str(path))
+
+    assert sched.restore() is False
+    assert not sched.running
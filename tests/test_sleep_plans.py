@@ -0,0 +1,78 @@
+import json
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from backend.database import Database, OCCURRENCE_GRACE, partition_key
+
+
+def previous_month(key):
+    year, month = (int(part) for part in key.split("-"))
+    return f"{year - 1}-12" if month == 1 else f"{year}-{month - 1:02d}"
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # Without a running App the database lives under the working directory
+    monkeypatch.chdir(tmp_path)
+    db = Database("plans", raw_days=None)
+    yield db
+    db.close()
+
+
+def test_overlapping_plans_score_a_night_once(db):
+    today = date.today().isoformat()
+    tomorrow = date.today() + timedelta(days=1)
+    # Two plans cover the same night; neither has a bedtime left today
+    db.save_plan({day: "22:00" for day in range(7)}, skip=[today], plan_id="early")
+    db.save_plan({day: "23:00" for day in range(7)}, skip=[today], plan_id="late")
+    db.save_extension(60)
+
+    last_bedtime = datetime.combine(tomorrow, datetime.min.time()).replace(hour=23)
+    db.next_occurrence(last_bedtime + OCCURRENCE_GRACE + timedelta(minutes=1))
+
+    scores = db.get_recent_consistency_scores(7)
+    assert [score for _, score in scores] == [66.67]
+    assert db.get_extension_total() == 0
+
+
+def write_month(folder, key, tables):
+    with open(folder / f"{key}.json", "w", encoding="utf-8") as f:
+        json.dump({name: {str(i + 1): rec for i, rec in enumerate(rows)} for name, rows in tables.items()}, f)
+
+
+def test_extension_total_stops_at_last_scored_month(tmp_path, monkeypatch):
+    # A plan-only user never saves schedules: the last score bounds the period
+    monkeypatch.chdir(tmp_path)
+    folder = tmp_path / "users" / "plans"
+    folder.mkdir(parents=True)
+    current = partition_key(datetime.now().isoformat())
+    scored = previous_month(current)
+    old = previous_month(scored)
+    write_month(folder, old, {"sleep": [{"type": "extension", "minutes": 30, "created": f"{old}-10T23:00:00"}]})
+    write_month(folder, scored, {"history": [{"date": f"{scored}-11", "score": 83.33, "minutes": 30,
+                                              "created": f"{scored}-11T02:00:00"}]})
+
+    db = Database("plans", raw_days=None)
+    try:
+        assert db.get_extension_total() == 0
+        assert sorted(db.partitions) == [scored, current]
+    finally:
+        db.close()
+
+
+def test_one_off_score_leaves_planned_extensions_to_their_night(db):
+    db.save_plan({day: "23:59" for day in range(7)}, plan_id="nightly")
+    db.save_extension(90)
+    (extension,) = db.get_events("extension")
+    night = datetime.fromisoformat(extension["occurrence"].rpartition("@")[2] + "T23:59")
+
+    # "Confirm Sleep Time" scores the one-off countdown: nothing of it is pending
+    assert db.save_current_period_score() == 100.0
+    assert db.get_extension_total() == 90
+
+    db.next_occurrence(night + OCCURRENCE_GRACE + timedelta(minutes=1))
+    scores = dict((label, score) for label, score in db.get_recent_consistency_scores(7))
+    assert scores[night.strftime("%b %d")] == 50.0
+    assert db.get_extension_total() == 0
+    assert db.get_events("extension") == []
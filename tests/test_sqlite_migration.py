@@ -0,0 +1,64 @@
+import json
+import os
+
+import pytest
+
+from backend.sqlite_database import SQLiteDatabase, migrate_from_tinydb
+
+
+def write_json(path, tables):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({name: {str(i + 1): rec for i, rec in enumerate(rows)} for name, rows in tables.items()}, f)
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    # Without a running App both databases live under the working directory
+    monkeypatch.chdir(tmp_path)
+    folder = tmp_path / "users" / "u"
+    folder.mkdir(parents=True)
+    return folder
+
+
+def test_unsplit_legacy_file_is_read_in_place(folder):
+    write_json(folder / "sleep_data.json", {
+        "sleep": [{"type": "extension", "minutes": 30, "created": "2025-01-10T23:10:00",
+                   "occurrence": "nightly@2025-01-10"}],
+        "history": [{"date": "2025-01-11", "score": 83.33, "minutes": 30,
+                     "created": "2025-01-11T02:00:00", "occurrence": "nightly@2025-01-10"}],
+    })
+    before = sorted(os.listdir(folder))
+
+    assert migrate_from_tinydb("u") == (1, 1)
+    assert sorted(name for name in os.listdir(folder) if not name.startswith("sleep_data.db")) == before
+
+    db = SQLiteDatabase("u")
+    try:
+        assert db.get_events("extension")[0]["occurrence"] == "nightly@2025-01-10"
+        row = db.conn.execute("SELECT occurrence FROM history WHERE date = '2025-01-11'").fetchone()
+        assert row["occurrence"] == "nightly@2025-01-10"
+    finally:
+        db.close()
+
+
+def test_rolled_up_rows_are_migrated(folder):
+    write_json(folder / "2024-01.json", {"monthly": [{
+        "month": "2024-01", "dates": ["2024-01-05"], "days": 1, "schedules": 1, "nights_reached": 1,
+        "extension_minutes": 90, "scored_days": 1, "score_sum": 50.0, "avg_score": 50.0}]})
+    write_json(folder / "2025-01.json", {
+        "daily": [{"date": "2025-01-05", "schedules": 1, "events": 0, "extension_minutes": 60,
+                   "score": 66.67, "through": "2025-01-05T22:00:00"}],
+        "history": [{"date": "2025-01-20", "score": 100.0, "minutes": 0, "created": "2025-01-20T22:00:00"}],
+        "sleep": [{"type": "schedule", "time": "22:00", "created": "2025-01-20T21:00:00"}],
+    })
+
+    assert migrate_from_tinydb("u") == (1, 2)
+    db = SQLiteDatabase("u")
+    try:
+        assert db.get_recent_consistency_scores(7) == [("Jan 05", 66.67), ("Jan 20", 100.0)]
+        (summary,) = db.get_monthly_summaries()
+        assert summary["month"] == "2024-01" and summary["avg_score"] == 50.0
+    finally:
+        db.close()
+    # Already migrated: a second run copies nothing
+    assert migrate_from_tinydb("u") == (0, 0)
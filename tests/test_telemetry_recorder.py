@@ -0,0 +1,68 @@
+import struct
+import time
+
+from backend.telemetry_recorder import ColumnFile, TelemetryRecorder, COUNT_OFFSET, night_of
+
+
+def set_header_count(path, count):
+    with open(path, "r+b") as f:
+        f.seek(COUNT_OFFSET)
+        f.write(struct.pack("<Q", count))
+
+
+def test_uncommitted_item_is_invisible_after_reopen(tmp_path):
+    # Killed after the item was written but before the count was bumped
+    path = str(tmp_path / "lm35.val.col")
+    col = ColumnFile(path, "f")
+    for v in (1.0, 2.0, 3.0):
+        col.append(v)
+    col.close()
+    set_header_count(path, 2)
+
+    col = ColumnFile(path, "f", writable=False)
+    assert col.count == 2
+    assert col.view().tolist() == [1.0, 2.0]
+    col.close()
+
+
+def test_count_survives_growth(tmp_path):
+    path = str(tmp_path / "lm35.ts.col")
+    col = ColumnFile(path, "d")
+    n = col.capacity + 10
+    for i in range(n):
+        col.append(float(i))
+    col.close()
+
+    col = ColumnFile(path, "d", writable=False)
+    assert col.count == n
+    assert col.capacity >= n
+    assert col.view()[-1] == n - 1
+    col.close()
+
+
+def test_recorder_drops_value_without_timestamp_on_reopen(tmp_path):
+    # Killed between the value append and the ts append: one extra value
+    user = str(tmp_path)
+    ts0 = time.time()
+    recorder = TelemetryRecorder(user)
+    for i in range(3):
+        recorder.record("lm35", ts0 + i, 20.0 + i)
+    recorder.close()
+    night = night_of(ts0)
+    folder = tmp_path / "telemetry" / night
+    set_header_count(str(folder / "lm35.ts.col"), 2)
+
+    series = TelemetryRecorder.open_night(user, night, "lm35")
+    assert len(series) == 2
+    series.close()
+
+    # Recording again overwrites the orphaned value instead of misaligning the columns
+    recorder = TelemetryRecorder(user)
+    recorder.record("lm35", ts0 + 10, 99.0)
+    recorder.close()
+    series = TelemetryRecorder.open_night(user, night, "lm35")
+    ts, values = series.slice()
+    assert ts.tolist() == [ts0, ts0 + 1, ts0 + 10]
+    assert values.tolist() == [20.0, 21.0, 99.0]
+    del ts, values
+    series.close()